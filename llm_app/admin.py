@@ -1,11 +1,46 @@
 from django.contrib import admin
+from django.db.models import Q
 
 from .models import PropertySummary
+from .pagination import EstimatedCountPaginator
+from .search import build_search_query
 
 
 @admin.register(PropertySummary)
 class PropertySummaryAdmin(admin.ModelAdmin):
-    list_display = ("id", "summary", "property_id", "create_date", "update_date")
+    list_display = (
+        "id",
+        "summary",
+        "property_id",
+        "property_title",
+        "create_date",
+        "update_date",
+    )
     list_display_links = ["id", "summary", "property_id"]
     list_filter = ["create_date", "update_date"]
-    search_fields = ["id", "property_id", "create_date"]
+    # Loads the property with the summaries in one query instead of one per row
+    list_select_related = ["property"]
+    search_fields = ["summary"]
+    search_help_text = (
+        "Searches property titles and summaries, or matches a property ID."
+    )
+    paginator = EstimatedCountPaginator
+    # Avoids a second COUNT(*) over the whole table when searching or filtering
+    show_full_result_count = False
+
+    @admin.display(description="Property title", ordering="property__title")
+    def property_title(self, obj):
+        return obj.property.title
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Uses the full-text index instead of icontains scans over the search fields.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        condition = Q(search_vector=build_search_query(search_term))
+        if search_term.isdigit():
+            condition |= Q(property_id=int(search_term))
+        return queryset.filter(condition), False
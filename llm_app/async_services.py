@@ -0,0 +1,432 @@
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from llm_app.cache import get_generation_cache
+from llm_app.metrics import record_generation
+from llm_app.resilience import get_retry_policy
+from llm_app.services import (
+    CONTENT_OPTIONS,
+    CONTENT_SCHEMA,
+    GENERATION_OPTIONS,
+    ResponseParser,
+    build_content_prompt,
+    build_description_prompt,
+    build_session_description_prompt,
+    build_session_summary_prompt,
+    build_session_title_prompt,
+    build_summary_prompt,
+    build_title_prompt,
+    clean_generated_text,
+    parse_structured_response,
+    save_property_description,
+    save_property_summary,
+    save_property_title,
+    with_generated_fields,
+)
+from llm_app.stage_models import get_stage_model
+
+
+async def _agenerate_field(
+    client,
+    prompt,
+    keyword,
+    model,
+    retries,
+    property_id,
+    clean=True,
+    options=None,
+    on_text=None,
+    images=None,
+):
+    """
+    Requests a generation until the keyword line can be parsed from the response.
+    Returns the parsed (and optionally cleaned) value, or None once all attempts failed.
+    `options` default to the GENERATION_OPTIONS of the keyword. `on_text(attempt, text)`
+    is called with the value generated so far each time a network chunk arrives.
+    `images` are PreparedImages sent along with the prompt.
+    """
+    model = model or get_stage_model(keyword.lower(), client.model)
+    options = options or GENERATION_OPTIONS[keyword]
+
+    # Reuse a previous generation for the exact same request if there is one
+    cache = get_generation_cache()
+    cache_key = cache.make_key(
+        model, prompt, options, [image.key for image in images or []]
+    )
+    cached_value = await sync_to_async(cache.get)(cache_key)
+    if cached_value:
+        print(f"New {keyword.lower()} (cached): {cached_value}")
+        return cached_value
+
+    stage = keyword.lower()
+    for attempt in range(retries):
+        if not await get_retry_policy().abackoff(attempt):
+            break
+        started = time.monotonic()
+        try:
+            async with client.stream(
+                prompt,
+                model,
+                options,
+                images=[image.data for image in images or []],
+            ) as response:
+                if response.status_code != 200:
+                    record_generation(
+                        stage, model, response.url, started, "http_error", attempt
+                    )
+                    print(
+                        f"Unexpected response status {response.status_code} for property {property_id}."
+                    )
+                    continue
+
+                # Stop reading as soon as the keyword line is complete
+                parser = ResponseParser(keyword)
+                async for chunk in response.aiter_bytes():
+                    if not chunk:
+                        continue
+                    finished = parser.feed(chunk)
+                    if on_text is not None:
+                        on_text(attempt, parser.partial_value())
+                    if finished:
+                        break
+                value = parser.finish()
+        except httpx.HTTPError as e:
+            record_generation(stage, model, None, started, "error", attempt)
+            print(f"Attempt {attempt + 1} failed: {e}")
+            continue
+
+        print(f"New {stage}: {value}")
+
+        if clean:
+            value = clean_generated_text(value)
+
+        record_generation(
+            stage,
+            model,
+            response.url,
+            started,
+            "success" if value else "unparsed",
+            attempt,
+            parser.stats,
+            parser.tokens,
+        )
+
+        if value:
+            await sync_to_async(cache.set)(cache_key, model, value)
+            return value
+
+    return None
+
+
+async def arewrite_property_title(
+    client, property_info, model=None, retries=3, writer=None
+):
+    """
+    Async counterpart of rewrite_property_title using an AsyncOllamaClient.
+    """
+    property_id = property_info.get("id")
+
+    print(f"Previous title: {property_info.get('title')}")
+    new_title = await _agenerate_field(
+        client,
+        build_title_prompt(property_info),
+        "Title",
+        model,
+        retries,
+        property_id,
+        clean=False,
+    )
+
+    if new_title:
+        await sync_to_async(save_property_title)(property_id, new_title, writer)
+        return new_title
+
+    print(
+        f"Failed to rewrite title for property {property_id} after {retries} attempts."
+    )
+    return None
+
+
+async def awrite_property_description(
+    client, property_info, model=None, retries=3, writer=None
+):
+    """
+    Async counterpart of write_property_description using an AsyncOllamaClient.
+    """
+    property_id = property_info.get("id")
+    images = property_info.get("images")
+
+    description = await _agenerate_field(
+        client,
+        build_description_prompt(property_info),
+        "Description",
+        model or (settings.OLLAMA_VISION_MODEL if images else None),
+        retries,
+        property_id,
+        images=images,
+    )
+
+    if description:
+        await sync_to_async(save_property_description)(property_id, description, writer)
+        return description
+
+    print(
+        f"Failed to write description for property {property_id} after {retries} attempts."
+    )
+    return None
+
+
+async def agenerate_property_summary(
+    client, property_info, model=None, retries=3, writer=None
+):
+    """
+    Async counterpart of generate_property_summary using an AsyncOllamaClient.
+    """
+    property_id = property_info.get("id")
+
+    summary = await _agenerate_field(
+        client,
+        build_summary_prompt(property_info),
+        "Summary",
+        model,
+        retries,
+        property_id,
+    )
+
+    if summary:
+        await sync_to_async(save_property_summary)(property_id, summary, writer)
+        return summary
+
+    print(
+        f"Failed to generate summary for property {property_id} after {retries} attempts."
+    )
+    return None
+
+
+async def agenerate_property_content(
+    client, property_info, model=None, retries=3, writer=None
+):
+    """
+    Async counterpart of generate_property_content using an AsyncOllamaClient.
+    """
+    property_id = property_info.get("id")
+
+    prompt = build_content_prompt(property_info)
+    content_model = model or get_stage_model("content", client.model)
+    options = {**CONTENT_OPTIONS, "format": CONTENT_SCHEMA}
+
+    cache = get_generation_cache()
+    cache_key = cache.make_key(content_model, prompt, options)
+    response_text = await sync_to_async(cache.get)(cache_key)
+
+    for attempt in range(retries if response_text is None else 0):
+        if not await get_retry_policy().abackoff(attempt):
+            break
+        started = time.monotonic()
+        try:
+            response = await client.generate_structured(
+                prompt, CONTENT_SCHEMA, content_model, CONTENT_OPTIONS
+            )
+            if response.status_code == 200:
+                data = response.json()
+                response_text = data.get("response")
+                # Output that is not a usable JSON document is retried like a failure
+                parsed = any(parse_structured_response(response_text).values())
+                record_generation(
+                    "content",
+                    content_model,
+                    response.url,
+                    started,
+                    "success" if parsed else "unparsed",
+                    attempt,
+                    data,
+                )
+                if parsed:
+                    break
+                continue
+
+            record_generation(
+                "content", content_model, response.url, started, "http_error", attempt
+            )
+            print(
+                f"Unexpected response status {response.status_code} for property {property_id}."
+            )
+
+        except (httpx.HTTPError, ValueError) as e:
+            record_generation("content", content_model, None, started, "error", attempt)
+            print(f"Attempt {attempt + 1} failed: {e}")
+
+    fields = parse_structured_response(response_text)
+    if all(fields.values()):
+        await sync_to_async(cache.set)(cache_key, content_model, response_text)
+
+    print(f"Previous title: {property_info.get('title')}")
+    print(f"New title: {fields['title']}")
+    print(f"New description: {fields['description']}")
+
+    # Store the valid fields and fall back to separate requests for the others
+    if fields["title"]:
+        await sync_to_async(save_property_title)(property_id, fields["title"], writer)
+    else:
+        fields["title"] = await arewrite_property_title(
+            client, property_info, model, retries, writer
+        )
+
+    if fields["description"]:
+        await sync_to_async(save_property_description)(
+            property_id, fields["description"], writer
+        )
+    else:
+        fields["description"] = await awrite_property_description(
+            client,
+            with_generated_fields(property_info, fields["title"]),
+            model,
+            retries,
+            writer,
+        )
+
+    if fields["summary"]:
+        await sync_to_async(save_property_summary)(
+            property_id, fields["summary"], writer
+        )
+    else:
+        fields["summary"] = await agenerate_property_summary(
+            client,
+            with_generated_fields(
+                property_info, fields["title"], fields["description"]
+            ),
+            model,
+            retries,
+            writer,
+        )
+
+    return fields["title"], fields["description"], fields["summary"]
+
+
+async def _agenerate_session_field(
+    client, prompt, keyword, model, retries, property_id, context=None, clean=True
+):
+    """
+    Async counterpart of generate_session_field using an AsyncOllamaClient.
+    """
+    stage = keyword.lower()
+    options = GENERATION_OPTIONS[keyword]
+
+    for attempt in range(retries):
+        if not await get_retry_policy().abackoff(attempt):
+            break
+        started = time.monotonic()
+        try:
+            async with client.stream(prompt, model, options, context) as response:
+                if response.status_code != 200:
+                    record_generation(
+                        stage, model, response.url, started, "http_error", attempt
+                    )
+                    print(
+                        f"Unexpected response status {response.status_code} for property {property_id}."
+                    )
+                    continue
+
+                # The context only comes with the final object of the stream
+                parser = ResponseParser(keyword, read_to_end=True)
+                async for chunk in response.aiter_bytes():
+                    if chunk and parser.feed(chunk):
+                        break
+                value = parser.finish()
+        except httpx.HTTPError as e:
+            record_generation(stage, model, None, started, "error", attempt)
+            print(f"Attempt {attempt + 1} failed: {e}")
+            continue
+
+        if clean:
+            value = clean_generated_text(value)
+        record_generation(
+            stage,
+            model,
+            response.url,
+            started,
+            "success" if value else "unparsed",
+            attempt,
+            parser.stats,
+            parser.tokens,
+        )
+
+        if value:
+            return value, (parser.stats or {}).get("context")
+
+    return None, None
+
+
+async def agenerate_property_session(
+    client, property_info, model=None, retries=3, writer=None
+):
+    """
+    Async counterpart of generate_property_session using an AsyncOllamaClient.
+    """
+    property_id = property_info.get("id")
+    session_model = model or get_stage_model("session", client.model)
+
+    print(f"Previous title: {property_info.get('title')}")
+    title, context = await _agenerate_session_field(
+        client,
+        build_session_title_prompt(property_info),
+        "Title",
+        session_model,
+        retries,
+        property_id,
+        clean=False,
+    )
+    print(f"New title: {title}")
+    if title:
+        await sync_to_async(save_property_title)(property_id, title, writer)
+    else:
+        title = await arewrite_property_title(
+            client, property_info, model, retries, writer
+        )
+
+    description = None
+    if context:
+        description, context = await _agenerate_session_field(
+            client,
+            build_session_description_prompt(),
+            "Description",
+            session_model,
+            retries,
+            property_id,
+            context,
+        )
+        print(f"New description: {description}")
+    if description:
+        await sync_to_async(save_property_description)(property_id, description, writer)
+    else:
+        context = None
+        description = await awrite_property_description(
+            client, with_generated_fields(property_info, title), model, retries, writer
+        )
+
+    summary = None
+    if context:
+        summary, _ = await _agenerate_session_field(
+            client,
+            build_session_summary_prompt(),
+            "Summary",
+            session_model,
+            retries,
+            property_id,
+            context,
+        )
+    if summary:
+        await sync_to_async(save_property_summary)(property_id, summary, writer)
+    else:
+        summary = await agenerate_property_summary(
+            client,
+            with_generated_fields(property_info, title, description),
+            model,
+            retries,
+            writer,
+        )
+
+    return title, description, summary
@@ -0,0 +1,310 @@
+import asyncio
+import itertools
+import json
+import time
+
+import httpx
+from properties.models import Property
+
+from llm_app.async_services import _agenerate_field
+from llm_app.metrics import record_generation
+from llm_app.resilience import get_retry_policy
+from llm_app.services import (
+    CONTENT_OPTIONS,
+    CONTENT_SCHEMA,
+    GENERATION_OPTIONS,
+    build_content_prompt,
+    build_description_prompt,
+    build_summary_prompt,
+    build_title_prompt,
+    iter_property_info,
+    mark_property_generated,
+    parse_structured_response,
+    save_property_description,
+    save_property_summary,
+    save_property_title,
+)
+from llm_app.stage_models import get_stage_model
+
+# Prompt builder of every field that can be generated separately
+PROMPT_BUILDERS = {
+    "title": build_title_prompt,
+    "description": build_description_prompt,
+    "summary": build_summary_prompt,
+}
+
+SAVERS = {
+    "title": save_property_title,
+    "description": save_property_description,
+    "summary": save_property_summary,
+}
+
+
+def read_jsonl(path):
+    """
+    Yields the objects of a JSONL file one line at a time, skipping blank lines.
+    """
+    with open(path) as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_batch_requests(property_infos, model, structured=False):
+    """
+    Yields the generation requests of the properties, one per property and field, or
+    one "content" request per property in structured mode. The requests of a property
+    are adjacent. Each request uses the model configured for its stage, or `model`.
+
+    All prompts are built before anything is generated, so unlike online runs the
+    description and summary prompts see the current title and description of the
+    property, not the generated ones. Structured requests generate the fields together.
+    """
+    for property_info in property_infos:
+        property_id = property_info["id"]
+
+        if structured:
+            yield {
+                "property_id": property_id,
+                "field": "content",
+                "prompt": build_content_prompt(property_info),
+                "model": get_stage_model("content", model),
+                "options": CONTENT_OPTIONS,
+                "format": CONTENT_SCHEMA,
+            }
+            continue
+
+        for field, build_prompt in PROMPT_BUILDERS.items():
+            yield {
+                "property_id": property_id,
+                "field": field,
+                "prompt": build_prompt(property_info),
+                "model": get_stage_model(field, model),
+                "options": GENERATION_OPTIONS[field.capitalize()],
+            }
+
+
+def export_batch(path, property_infos, model, structured=False):
+    """
+    Writes the generation requests of the properties to a JSONL file without calling
+    the model.
+
+    Returns:
+        int: The number of requests written.
+    """
+    count = 0
+    with open(path, "w") as batch_file:
+        for request in iter_batch_requests(property_infos, model, structured):
+            batch_file.write(json.dumps(request) + "\n")
+            count += 1
+    return count
+
+
+async def arun_request(client, request, retries=3):
+    """
+    Executes one exported generation request.
+
+    Returns:
+        list: The result lines of the request. A "content" request yields one result
+        per field. Failed fields have a null response.
+    """
+    property_id = request["property_id"]
+    field = request["field"]
+
+    if field != "content":
+        value = await _agenerate_field(
+            client,
+            request["prompt"],
+            field.capitalize(),
+            request["model"],
+            retries,
+            property_id,
+            clean=field != "title",
+            options=request.get("options"),
+        )
+        return [{"property_id": property_id, "field": field, "response": value}]
+
+    fields = {"title": None, "description": None, "summary": None}
+    for attempt in range(retries):
+        if not await get_retry_policy().abackoff(attempt):
+            break
+        started = time.monotonic()
+        try:
+            response = await client.generate_structured(
+                request["prompt"],
+                request["format"],
+                request["model"],
+                request.get("options"),
+            )
+            if response.status_code == 200:
+                data = response.json()
+                fields = parse_structured_response(data.get("response"))
+                parsed = any(fields.values())
+                record_generation(
+                    "content",
+                    request["model"],
+                    response.url,
+                    started,
+                    "success" if parsed else "unparsed",
+                    attempt,
+                    data,
+                )
+                if parsed:
+                    break
+                continue
+
+            record_generation(
+                "content",
+                request["model"],
+                response.url,
+                started,
+                "http_error",
+                attempt,
+            )
+        except (httpx.HTTPError, ValueError) as e:
+            record_generation(
+                "content", request["model"], None, started, "error", attempt
+            )
+            print(f"Attempt {attempt + 1} failed: {e}")
+
+    return [
+        {"property_id": property_id, "field": name, "response": value}
+        for name, value in fields.items()
+    ]
+
+
+def read_completed(path):
+    """
+    Returns the (property_id, field) pairs that already have a response in a results
+    file, so an interrupted run can be continued.
+    """
+    try:
+        return {
+            (result["property_id"], result["field"])
+            for result in read_jsonl(path)
+            if result.get("response")
+        }
+    except FileNotFoundError:
+        return set()
+
+
+def is_completed(request, completed):
+    property_id = request["property_id"]
+    if request["field"] == "content":
+        fields = ("title", "description", "summary")
+    else:
+        fields = (request["field"],)
+    return all((property_id, field) in completed for field in fields)
+
+
+async def arun_batch(client, input_path, output_path, concurrency=8, retries=3):
+    """
+    Executes the requests of an exported batch file against Ollama and appends the
+    results to a JSONL file.
+
+    Up to `concurrency` properties are processed at once, the requests of one property
+    one after the other so its results stay adjacent in the output. Requests that already
+    have a result in the output file are skipped.
+
+    Returns:
+        tuple: The number of successful and failed results.
+    """
+    completed = read_completed(output_path)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"succeeded": 0, "failed": 0}
+
+    with open(output_path, "a") as output_file:
+
+        async def worker():
+            while True:
+                requests = await queue.get()
+                if requests is None:
+                    return
+
+                results = []
+                for request in requests:
+                    results.extend(await arun_request(client, request, retries))
+
+                for result in results:
+                    output_file.write(json.dumps(result) + "\n")
+                    counts["succeeded" if result["response"] else "failed"] += 1
+                output_file.flush()
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+        # Exported requests of a property are adjacent, so they can be grouped lazily
+        for _, requests in itertools.groupby(
+            read_jsonl(input_path), key=lambda request: request["property_id"]
+        ):
+            requests = [
+                request for request in requests if not is_completed(request, completed)
+            ]
+            if requests:
+                await queue.put(requests)
+
+        for _ in workers:
+            await queue.put(None)
+
+        await asyncio.gather(*workers)
+
+    return counts["succeeded"], counts["failed"]
+
+
+def mark_batch_generated(results, writer):
+    """
+    Records the fingerprint of every property of `results` (property_id -> fields) that
+    got all three fields, loading the property data in bulk.
+    """
+    if not results:
+        return
+
+    properties = Property.objects.filter(property_id__in=list(results))
+    for property_info in iter_property_info(properties):
+        fields = results[property_info["id"]]
+        mark_property_generated(
+            property_info, fields["title"], fields["description"], writer
+        )
+
+
+def import_batch(path, writer):
+    """
+    Applies a results file written by arun_batch with bulk writes.
+
+    Results are streamed from the file and handed to the write-behind writer, which is
+    flushed every `writer.batch_size` properties. Properties with all three fields are
+    marked as generated just before each flush, so that their fingerprint is written
+    together with their summary.
+
+    Returns:
+        tuple: The number of applied and failed results.
+    """
+    applied = failed = 0
+    pending = {}
+    complete = {}
+
+    for result in read_jsonl(path):
+        property_id = result["property_id"]
+        field = result["field"]
+        value = result.get("response")
+
+        if not value or field not in SAVERS:
+            failed += 1
+            continue
+
+        SAVERS[field](property_id, value, writer)
+        applied += 1
+
+        fields = pending.setdefault(property_id, {})
+        fields[field] = value
+        if len(fields) == len(SAVERS):
+            complete[property_id] = pending.pop(property_id)
+
+        if writer.pending >= writer.batch_size:
+            mark_batch_generated(complete, writer)
+            complete = {}
+            writer.flush()
+
+    mark_batch_generated(complete, writer)
+    writer.flush()
+
+    return applied, failed
@@ -0,0 +1,130 @@
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from llm_app.models import CachedGeneration
+
+
+class GenerationCache:
+    """
+    Two-tier cache for LLM generations.
+
+    Lookups go to an in-process LRU first and fall back to the CachedGeneration table.
+    Entries are keyed by a hash of (model, prompt, generation options), so any change to
+    the property data that ends up in a prompt produces a different key.
+    """
+
+    def __init__(self, memory_size=None, max_entries=None, ttl=None):
+        self.memory_size = memory_size or settings.LLM_CACHE_MEMORY_SIZE
+        self.max_entries = max_entries or settings.LLM_CACHE_MAX_ENTRIES
+        self.ttl = ttl or settings.LLM_CACHE_TTL
+        self.memory = OrderedDict()
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, prompt, options=None, images=None):
+        """
+        Returns the hex digest identifying a generation request. Images are identified
+        by the keys of their prepared payloads.
+        """
+        request = [model, prompt, options]
+        if images:
+            request.append(images)
+        payload = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached response for the key, or None on a miss or when disabled.
+        """
+        if not self.enabled:
+            return None
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        response = (
+            CachedGeneration.objects.filter(key=key, update_date__gte=cutoff)
+            .values_list("response", flat=True)
+            .first()
+        )
+
+        if response is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.remember(key, response)
+        return response
+
+    def set(self, key, model, response):
+        """
+        Stores a response in both tiers.
+        """
+        if not self.enabled:
+            return
+
+        self.remember(key, response)
+        CachedGeneration.objects.update_or_create(
+            key=key, defaults={"model": model, "response": response}
+        )
+
+    def remember(self, key, response):
+        """
+        Adds an entry to the in-process LRU, dropping the least recently used one when full.
+        """
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def evict(self):
+        """
+        Deletes expired rows and the oldest rows beyond the configured maximum.
+
+        Returns:
+            int: The number of deleted rows.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        deleted, _ = CachedGeneration.objects.filter(update_date__lt=cutoff).delete()
+
+        oldest_kept = list(
+            CachedGeneration.objects.order_by("-update_date").values_list(
+                "update_date", flat=True
+            )[self.max_entries - 1 : self.max_entries]
+        )
+        if oldest_kept:
+            overflow, _ = CachedGeneration.objects.filter(
+                update_date__lt=oldest_kept[0]
+            ).delete()
+            deleted += overflow
+
+        return deleted
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+
+
+def get_generation_cache():
+    """
+    Returns the process-wide GenerationCache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        _cache = GenerationCache()
+    return _cache
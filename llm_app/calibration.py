@@ -0,0 +1,159 @@
+import time
+
+import requests
+
+from llm_app.metrics import percentile
+from llm_app.ollama import get_ollama_client
+from llm_app.services import (
+    GENERATION_OPTIONS,
+    ResponseParser,
+    build_description_prompt,
+    build_summary_prompt,
+    build_title_prompt,
+    clean_generated_text,
+)
+
+# Stages calibrate_models can measure: prompt builder, keyword of the answer line and
+# whether the value is cleaned like the summary command does
+CALIBRATION_STAGES = {
+    "title": (build_title_prompt, "Title", False),
+    "description": (build_description_prompt, "Description", True),
+    "summary": (build_summary_prompt, "Summary", True),
+}
+
+
+def measure_generation(client, model, stage, property_info):
+    """
+    Generates one stage of a property the way the summary command does, without retries,
+    cache or saving, and times it.
+
+    Returns:
+        dict: The seconds taken, the seconds until the first chunk (None if none
+        arrived), the number of streamed tokens and whether a usable value was parsed.
+    """
+    build_prompt, keyword, clean = CALIBRATION_STAGES[stage]
+    started = time.monotonic()
+    first_chunk = None
+    parser = ResponseParser(keyword)
+    value = None
+    try:
+        with client.generate(
+            build_prompt(property_info), model, GENERATION_OPTIONS[keyword]
+        ) as response:
+            if response.status_code == 200:
+                for chunk in response.iter_content(chunk_size=None):
+                    if not chunk:
+                        continue
+                    if first_chunk is None:
+                        first_chunk = time.monotonic() - started
+                    if parser.feed(chunk):
+                        break
+                value = parser.finish()
+    except requests.exceptions.RequestException as e:
+        print(f"Calibration request of {model} failed: {e}")
+
+    if clean:
+        value = clean_generated_text(value)
+    return {
+        "seconds": time.monotonic() - started,
+        "first_chunk_seconds": first_chunk,
+        "tokens": parser.tokens,
+        # Titles are stored in a 255 character column
+        "parsed": bool(value) and (stage != "title" or len(value) <= 255),
+    }
+
+
+def summarize_samples(samples):
+    """
+    Aggregates the measure_generation results of one model and stage.
+    """
+    seconds = [sample["seconds"] for sample in samples]
+    first_chunks = [
+        sample["first_chunk_seconds"]
+        for sample in samples
+        if sample["first_chunk_seconds"] is not None
+    ]
+    # Generation speed once the first token arrived
+    streaming_seconds = sum(
+        sample["seconds"] - sample["first_chunk_seconds"]
+        for sample in samples
+        if sample["first_chunk_seconds"] is not None
+    )
+    tokens = sum(sample["tokens"] for sample in samples)
+    return {
+        "requests": len(samples),
+        "success_rate": (
+            sum(sample["parsed"] for sample in samples) / len(samples)
+            if samples
+            else 0.0
+        ),
+        "p50": percentile(seconds, 50),
+        "p95": percentile(seconds, 95),
+        "p99": percentile(seconds, 99),
+        "first_chunk_p50": percentile(first_chunks, 50),
+        "tokens_per_second": tokens / streaming_seconds if streaming_seconds else None,
+    }
+
+
+def calibrate(property_infos, models, stages, client=None):
+    """
+    Runs every stage of the properties through every candidate model. Each model is
+    loaded before it is measured, so that the load time does not count as latency.
+
+    Returns:
+        dict: The summarize_samples figures per stage and model, plus the load time of
+        each model under "load_seconds" (None if it failed to load).
+    """
+    client = client or get_ollama_client()
+    measurements = {stage: {} for stage in stages}
+    load_seconds = {}
+
+    for model in models:
+        loads = [elapsed for _, elapsed in client.warm_up(model)]
+        load_seconds[model] = None if None in loads else max(loads, default=None)
+        for stage in stages:
+            samples = [
+                measure_generation(client, model, stage, property_info)
+                for property_info in property_infos
+            ]
+            measurements[stage][model] = summarize_samples(samples)
+
+    return {"stages": measurements, "load_seconds": load_seconds}
+
+
+def recommend_models(measurements, min_success=0.9):
+    """
+    Picks the model of each stage: the one with the lowest median latency among those
+    parsing at least `min_success` of the answers, or the one parsing the most answers
+    if none does.
+
+    Returns:
+        dict: The recommended model per stage.
+    """
+    recommended = {}
+    for stage, results in measurements.items():
+        candidates = [
+            (model, stats)
+            for model, stats in results.items()
+            if stats["requests"] and stats["p50"] is not None
+        ]
+        if not candidates:
+            continue
+
+        eligible = [
+            (model, stats)
+            for model, stats in candidates
+            if stats["success_rate"] >= min_success
+        ]
+        if eligible:
+            model, _ = min(eligible, key=lambda candidate: candidate[1]["p50"])
+        else:
+            model, _ = min(
+                candidates,
+                key=lambda candidate: (
+                    -candidate[1]["success_rate"],
+                    candidate[1]["p50"],
+                ),
+            )
+        recommended[stage] = model
+    return recommended
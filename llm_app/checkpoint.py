@@ -0,0 +1,58 @@
+from collections import deque
+
+from llm_app.models import GenerationCheckpoint
+
+
+class RunCheckpoint:
+    """
+    Tracks the watermark of a generation run so that it can be resumed after a crash.
+
+    Properties are dispatched in property_id order but may finish out of order when they
+    are processed concurrently, so the watermark only advances past a property once every
+    property dispatched before it has finished as well.
+    """
+
+    def __init__(self, name="summary"):
+        self.record, _ = GenerationCheckpoint.objects.get_or_create(name=name)
+        self.in_flight = deque()
+        self.finished = set()
+
+    @property
+    def last_property_id(self):
+        return self.record.last_property_id
+
+    def reset(self):
+        """
+        Starts a new run from the beginning.
+        """
+        self.record.last_property_id = None
+        self.save()
+
+    def start(self, property_id):
+        """
+        Registers a property as dispatched.
+        """
+        self.in_flight.append(property_id)
+
+    def finish(self, property_id):
+        """
+        Registers a property as processed and advances the watermark if possible.
+
+        Returns:
+            bool: True if the watermark moved and should be saved.
+        """
+        self.finished.add(property_id)
+
+        advanced = False
+        while self.in_flight and self.in_flight[0] in self.finished:
+            self.record.last_property_id = self.in_flight.popleft()
+            self.finished.discard(self.record.last_property_id)
+            advanced = True
+
+        return advanced
+
+    def save(self):
+        """
+        Stores the current watermark.
+        """
+        self.record.save(update_fields=["last_property_id", "update_date"])
@@ -0,0 +1,341 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from llm_app.models import PropertySummary
+from llm_app.ollama import get_ollama_client
+from llm_app.resilience import get_retry_policy
+
+
+class EmbeddingIndex:
+    """
+    Summary embeddings stored as a float32 matrix in a memory-mapped file.
+
+    Files in `directory`:
+        vectors.f32: One L2-normalized embedding per row, as raw float32.
+        ids.npy: The property id of every row, -1 for rows of deleted summaries.
+        meta.json: Embedding model, dimension, number of rows and the update_date of
+            the summaries up to which the index is complete.
+
+    Loading only maps the files, so it takes the same time whatever the size of the
+    index, and the OS pages the vectors in as searches touch them. Vectors are normalized
+    when written, so the cosine similarity with every property is one matrix-vector
+    product.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.LLM_EMBEDDINGS_DIR
+        self.meta = {}
+        self.meta_mtime = None
+        self.vectors = None
+        self.ids = None
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def ids_path(self):
+        return os.path.join(self.directory, "ids.npy")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def model(self):
+        return self.meta.get("model")
+
+    @property
+    def watermark(self):
+        watermark = self.meta.get("watermark")
+        return parse_datetime(watermark) if watermark else None
+
+    def load(self):
+        """
+        Maps the index files, unless they did not change since the last load.
+
+        Returns:
+            bool: False if there is no index yet.
+        """
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            self.meta, self.meta_mtime, self.vectors, self.ids = {}, None, None, None
+            return False
+
+        if mtime == self.meta_mtime:
+            return True
+
+        with open(self.meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        count, dimension = meta["count"], meta["dimension"]
+        if count:
+            self.ids = np.load(self.ids_path, mmap_mode="r")
+            self.vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(count, dimension)
+            )
+        else:
+            self.ids = np.empty(0, dtype=np.int64)
+            self.vectors = np.empty((0, dimension), dtype=np.float32)
+
+        self.meta, self.meta_mtime = meta, mtime
+        return True
+
+    def clear(self):
+        """
+        Deletes the index files.
+        """
+        for path in (self.meta_path, self.ids_path, self.vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.load()
+
+    def vector(self, property_id):
+        """
+        Returns the embedding of the property, or None if it is not indexed.
+        """
+        if not self.load():
+            return None
+        rows = np.flatnonzero(self.ids == property_id)
+        return self.vectors[rows[0]] if len(rows) else None
+
+    def search(self, vector, k=10, exclude=None, min_score=None):
+        """
+        Finds the properties whose embeddings are the most similar to the vector.
+
+        Args:
+            vector: Query embedding, normalized here.
+            k (int): Maximum number of results.
+            exclude (int): Property id left out of the results, e.g. the queried one.
+            min_score (float): Minimum cosine similarity of the results.
+
+        Returns:
+            list: (property_id, cosine similarity) pairs, most similar first.
+        """
+        if not self.load() or not len(self.ids) or k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm or query.shape[0] != self.vectors.shape[1]:
+            return []
+
+        scores = self.vectors @ (query / norm)
+        scores[self.ids < 0] = -np.inf
+        if exclude is not None:
+            scores[self.ids == exclude] = -np.inf
+
+        # Partial sort: only the k best rows are ordered
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            (int(self.ids[row]), float(scores[row]))
+            for row in top
+            if scores[row] > -np.inf and (min_score is None or scores[row] >= min_score)
+        ]
+
+    def similar(self, property_id, k=10, min_score=None):
+        """
+        Returns the properties most similar to an indexed one, or None if it is not
+        indexed. See search for the arguments.
+        """
+        vector = self.vector(property_id)
+        if vector is None:
+            return None
+        return self.search(vector, k, exclude=property_id, min_score=min_score)
+
+    def write(self, embeddings, model, removed=(), watermark=None):
+        """
+        Stores embeddings (property_id -> vector): rows of indexed properties are
+        overwritten and new properties are appended. Rows of `removed` property ids are
+        cleared. The rows are written to a copy of the vectors file which then replaces
+        it, so searches on the mapped previous file never see half-written vectors, and
+        the metadata is written last, so readers only see the new rows once they are
+        complete.
+        """
+        self.load()
+        os.makedirs(self.directory, exist_ok=True)
+
+        dimension = self.meta.get("dimension")
+        if embeddings:
+            dimension = len(next(iter(embeddings.values())))
+        if dimension is None:
+            return
+        if self.meta and (
+            self.meta["dimension"] != dimension or self.meta["model"] != model
+        ):
+            raise ValueError(
+                "The embedding model changed, the index has to be rebuilt (--rebuild)."
+            )
+
+        ids = list(self.ids) if self.ids is not None else []
+        rows = {int(property_id): row for row, property_id in enumerate(ids)}
+        row_size = dimension * np.dtype(np.float32).itemsize
+
+        temporary_path = f"{self.vectors_path}.tmp"
+        if os.path.exists(self.vectors_path):
+            shutil.copyfile(self.vectors_path, temporary_path)
+            mode = "r+b"
+        else:
+            mode = "w+b"
+        with open(temporary_path, mode) as vectors_file:
+            for property_id, vector in embeddings.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                if norm:
+                    vector = vector / norm
+
+                row = rows.get(property_id)
+                if row is None:
+                    row = rows[property_id] = len(ids)
+                    ids.append(property_id)
+                vectors_file.seek(row * row_size)
+                vectors_file.write(vector.tobytes())
+
+            for property_id in removed:
+                row = rows.get(property_id)
+                if row is not None:
+                    ids[row] = -1
+                    vectors_file.seek(row * row_size)
+                    vectors_file.write(bytes(row_size))
+        os.replace(temporary_path, self.vectors_path)
+
+        self.replace(
+            self.ids_path,
+            lambda ids_file: np.save(ids_file, np.asarray(ids, dtype=np.int64)),
+        )
+
+        if watermark is None:
+            watermark = self.meta.get("watermark")
+        elif not isinstance(watermark, str):
+            watermark = watermark.isoformat()
+        meta = {
+            "model": model,
+            "dimension": dimension,
+            "count": len(ids),
+            "watermark": watermark,
+        }
+        self.replace(
+            self.meta_path, lambda meta_file: meta_file.write(json.dumps(meta).encode())
+        )
+        self.load()
+
+    @staticmethod
+    def replace(path, write):
+        """
+        Writes a file through a temporary file so that it is replaced atomically.
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as temporary_file:
+            write(temporary_file)
+        os.replace(temporary_path, path)
+
+
+def embed_texts(client, texts, model, retries=3):
+    """
+    Returns the embeddings of the texts, or None once all attempts failed.
+    """
+    for attempt in range(retries):
+        if not get_retry_policy().backoff(attempt):
+            break
+        try:
+            response = client.embed(texts, model)
+            if response.status_code == 200:
+                return response.json()["embeddings"]
+            print(f"Unexpected response status {response.status_code} for embeddings.")
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"Attempt {attempt + 1} failed: {e}")
+    return None
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_summaries(
+    index=None, client=None, model=None, batch_size=32, write_every=1024, rebuild=False
+):
+    """
+    Embeds the summaries that changed since the last run and removes the embeddings of
+    deleted summaries. Summaries are sent to Ollama `batch_size` at a time and the
+    vectors are written to the index every `write_every` embeddings. The whole index is
+    rebuilt when asked to or when the embedding model changed.
+
+    Returns:
+        tuple: The number of embedded and removed summaries, or None if a batch failed.
+        The run then stops and the remaining summaries are embedded by the next one.
+    """
+    index = index or get_embedding_index()
+    client = client or get_ollama_client()
+    model = model or settings.OLLAMA_EMBED_MODEL
+
+    index.load()
+    if rebuild or (index.model and index.model != model):
+        index.clear()
+
+    # Summaries updated while this run is going are embedded by the next one
+    started = timezone.now()
+    summaries = PropertySummary.objects.order_by("property_id")
+    if index.watermark:
+        summaries = summaries.filter(update_date__gt=index.watermark)
+
+    embedded = 0
+    pending = {}
+    rows = summaries.values_list("property_id", "summary").iterator(chunk_size=1000)
+    for batch in iter_batches(rows, batch_size):
+        vectors = embed_texts(client, [summary for _, summary in batch], model)
+        if vectors is None or len(vectors) != len(batch):
+            print(
+                f"Failed to embed summaries of properties {batch[0][0]}-{batch[-1][0]}."
+            )
+            index.write(pending, model)
+            return None
+
+        pending.update(
+            (property_id, vector) for (property_id, _), vector in zip(batch, vectors)
+        )
+        embedded += len(batch)
+        if len(pending) >= write_every:
+            index.write(pending, model)
+            pending = {}
+
+    existing = set(PropertySummary.objects.values_list("property_id", flat=True))
+    index.load()
+    indexed = index.ids if index.ids is not None else []
+    removed = [
+        int(property_id)
+        for property_id in indexed
+        if property_id >= 0 and property_id not in existing
+    ]
+    index.write(pending, model, removed, watermark=started)
+    return embedded, len(removed)
+
+
+_index = None
+
+
+def get_embedding_index():
+    """
+    Returns the process-wide EmbeddingIndex, creating it on first use.
+    """
+    global _index
+    if _index is None:
+        _index = EmbeddingIndex()
+    return _index
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+from llm_app.resilience import CircuitBreaker
+
+
+class Endpoint:
+    """
+    An Ollama server together with its load and request statistics.
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.total_latency = 0.0
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "average_latency": (
+                self.total_latency / self.requests if self.requests else 0.0
+            ),
+        }
+
+
+class EndpointPool:
+    """
+    Routes requests over several Ollama servers.
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests. An
+    endpoint is ejected after `max_errors` consecutive failed requests or a failed health
+    check, and re-admitted once its /api/tags health check succeeds again. Health checks
+    run every `health_check_interval` seconds in a background thread.
+
+    The outcome of every request is also fed to `breaker`, which the clients wait on
+    before sending, so that all endpoints get a pause when most requests fail.
+    """
+
+    def __init__(self, urls, health_check_interval=30, max_errors=3, breaker=None):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.health_check_interval = health_check_interval
+        self.max_errors = max_errors
+        self.breaker = breaker or CircuitBreaker()
+        self.lock = threading.Lock()
+        self.health_checker = None
+
+    def acquire(self, exclude=None):
+        """
+        Picks the least loaded healthy endpoint and counts the request as outstanding.
+        Falls back to all endpoints when none is healthy. Returns None if every candidate
+        is excluded.
+        """
+        with self.lock:
+            candidates = [
+                endpoint for endpoint in self.endpoints if endpoint is not exclude
+            ]
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+            if not (healthy or candidates):
+                return None
+
+            endpoint = min(
+                healthy or candidates,
+                key=lambda endpoint: (endpoint.outstanding, endpoint.requests),
+            )
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint, started, error=False):
+        """
+        Records the outcome of a request started at `started` (time.monotonic()).
+        """
+        self.breaker.record(error, started)
+        with self.lock:
+            endpoint.outstanding -= 1
+            endpoint.requests += 1
+            endpoint.total_latency += time.monotonic() - started
+
+            if not error:
+                endpoint.consecutive_errors = 0
+                return
+
+            endpoint.errors += 1
+            endpoint.consecutive_errors += 1
+            if endpoint.healthy and endpoint.consecutive_errors >= self.max_errors:
+                endpoint.healthy = False
+                print(f"Ollama endpoint {endpoint.url} ejected after repeated errors.")
+
+    def check_health(self, timeout=5):
+        """
+        Calls /api/tags on every endpoint, ejecting and re-admitting them accordingly.
+        """
+        for endpoint in self.endpoints:
+            try:
+                response = requests.get(f"{endpoint.url}/api/tags", timeout=timeout)
+                healthy = response.status_code == 200
+            except requests.exceptions.RequestException:
+                healthy = False
+
+            with self.lock:
+                if healthy and not endpoint.healthy:
+                    print(f"Ollama endpoint {endpoint.url} re-admitted.")
+                elif not healthy and endpoint.healthy:
+                    print(f"Ollama endpoint {endpoint.url} ejected by health check.")
+                endpoint.healthy = healthy
+                if healthy:
+                    endpoint.consecutive_errors = 0
+
+    def start_health_checks(self):
+        """
+        Starts the background health check thread, unless it is already running.
+        """
+        if self.health_checker is not None or not self.health_check_interval:
+            return
+
+        def run():
+            while True:
+                self.check_health()
+                time.sleep(self.health_check_interval)
+
+        self.health_checker = threading.Thread(
+            target=run, name="ollama-health-check", daemon=True
+        )
+        self.health_checker.start()
+
+    def stats(self):
+        """
+        Returns the statistics of every endpoint.
+        """
+        with self.lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+_pool = None
+
+
+def get_endpoint_pool():
+    """
+    Returns the process-wide EndpointPool built from the OLLAMA_URLS setting, creating it
+    and starting its health checks on first use.
+    """
+    global _pool
+    if _pool is None:
+        _pool = EndpointPool(
+            settings.OLLAMA_URLS,
+            health_check_interval=settings.OLLAMA_HEALTH_CHECK_INTERVAL,
+            max_errors=settings.OLLAMA_MAX_ERRORS,
+            breaker=CircuitBreaker(
+                threshold=settings.OLLAMA_BREAKER_THRESHOLD,
+                window=settings.OLLAMA_BREAKER_WINDOW,
+                min_requests=settings.OLLAMA_BREAKER_MIN_REQUESTS,
+                cooldown=settings.OLLAMA_BREAKER_COOLDOWN,
+            ),
+        )
+        _pool.start_health_checks()
+    return _pool
@@ -0,0 +1,286 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words the fake model samples its answers from
+WORDS = (
+    "charming cozy elegant modern boutique hotel rooms views city beach garden "
+    "spacious comfortable welcoming stay guests breakfast pool spa lounge quiet"
+).split()
+
+
+class FakeOllamaServer:
+    """
+    Local stand-in for an Ollama server, used to benchmark the pipeline without a model.
+
+    Streams NDJSON /api/generate responses shaped like Ollama's, answers structured-output
+    requests with a JSON document, /api/embed requests with bag-of-words vectors and
+    /api/tags health checks with a fixed model list. Requests without a prompt only
+    "load" the model, and the final object of a generation carries a context extending
+    the one of the request, like Ollama's.
+
+    Args:
+        ttft (float): Seconds before the first token is sent.
+        token_latency (float): Seconds between two tokens.
+        error_rate (float): Fraction of generate requests answered with HTTP 500.
+        malformed_rate (float): Fraction of NDJSON lines replaced by invalid JSON.
+        split_chunks (bool): Whether NDJSON lines are split across network chunks.
+        ramble_tokens (int): Number of tokens generated after the requested line.
+        seed (int): Seed of the random generator, for reproducible runs.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        ttft=0.0,
+        token_latency=0.0,
+        error_rate=0.0,
+        malformed_rate=0.0,
+        split_chunks=False,
+        ramble_tokens=20,
+        seed=None,
+    ):
+        self.ttft = ttft
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.split_chunks = split_chunks
+        self.ramble_tokens = ramble_tokens
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counter = 0
+        # Server-side duration of every generate request, per stage
+        self.durations = {}
+
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="fake-ollama", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def chance(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def words(self, count):
+        with self.lock:
+            return [self.random.choice(WORDS) for _ in range(count)]
+
+    def next_number(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def record(self, stage, duration):
+        with self.lock:
+            self.durations.setdefault(stage, []).append(duration)
+
+    @staticmethod
+    def detect_stage(request):
+        """
+        Tells which pipeline stage a generate request belongs to from its prompt.
+        """
+        prompt = request.get("prompt", "")
+        if request.get("format"):
+            return "content"
+        if "Title: generated_title" in prompt:
+            return "title"
+        if "Description: generated_description" in prompt:
+            return "description"
+        return "summary"
+
+    def answer(self, stage):
+        """
+        Returns the text the fake model generates for a stage.
+        """
+        number = self.next_number()
+        if stage == "content":
+            return json.dumps(
+                {
+                    "title": f"{' '.join(self.words(4)).title()} {number}",
+                    "description": " ".join(self.words(30)),
+                    "summary": " ".join(self.words(40)),
+                }
+            )
+
+        keyword = stage.capitalize()
+        length = 6 if stage == "title" else 35
+        line = " ".join(self.words(length))
+        if stage == "title":
+            line = f"{line.title()} {number}"
+        ramble = " ".join(self.words(self.ramble_tokens))
+        return f"Sure, here it is.\n\n{keyword}: {line}\n\n{ramble}"
+
+    @staticmethod
+    def embed(text, dimension=64):
+        """
+        Returns a bag-of-words vector of the text, so texts sharing words are similar.
+        """
+        vector = [0.0] * dimension
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode("utf-8")) % dimension] += 1.0
+        return vector
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self.send_json(200, {"models": [{"name": "fake"}]})
+                else:
+                    self.send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                started = time.monotonic()
+
+                if self.path == "/api/embed":
+                    inputs = request.get("input", [])
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    self.send_json(
+                        200,
+                        {
+                            "model": request.get("model"),
+                            "embeddings": [fake.embed(text) for text in inputs],
+                        },
+                    )
+                    return
+
+                if self.path != "/api/generate":
+                    self.send_json(404, {"error": "not found"})
+                    return
+
+                if fake.chance(fake.error_rate):
+                    self.send_json(500, {"error": "fake server error"})
+                    return
+
+                if not request.get("prompt"):
+                    self.send_json(
+                        200,
+                        {
+                            "model": request.get("model"),
+                            "response": "",
+                            "done": True,
+                            "done_reason": "load",
+                        },
+                    )
+                    return
+
+                stage = fake.detect_stage(request)
+                text = fake.answer(stage)
+                tokens = [token + " " for token in text.split(" ")]
+                # One fake token id per word of the conversation so far
+                context = list(request.get("context") or [])
+                context += range(
+                    len(context),
+                    len(context) + len(request["prompt"].split()) + len(tokens),
+                )
+                final = {
+                    "model": request.get("model"),
+                    "response": "",
+                    "done": True,
+                    "total_duration": 0,
+                    "load_duration": 0,
+                    "prompt_eval_count": len(request.get("prompt", "").split()),
+                    "prompt_eval_duration": int(fake.ttft * 1e9),
+                    "eval_count": len(tokens),
+                    "eval_duration": int(fake.token_latency * len(tokens) * 1e9),
+                    "context": context,
+                }
+
+                time.sleep(fake.ttft)
+                try:
+                    if request.get("stream") is False:
+                        time.sleep(fake.token_latency * len(tokens))
+                        final["response"] = text
+                        final["total_duration"] = int(
+                            (time.monotonic() - started) * 1e9
+                        )
+                        self.send_json(200, final)
+                    else:
+                        self.stream(request, tokens, final, started)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading early, just like with a real server
+                    pass
+                finally:
+                    fake.record(stage, time.monotonic() - started)
+
+            def stream(self, request, tokens, final, started):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                pending = b""
+                for token in tokens:
+                    time.sleep(fake.token_latency)
+                    line = json.dumps(
+                        {
+                            "model": request.get("model"),
+                            "response": token,
+                            "done": False,
+                        }
+                    ).encode("utf-8")
+                    if fake.chance(fake.malformed_rate):
+                        line = line[: len(line) // 2]
+                    pending += line + b"\n"
+
+                    # Optionally cut the stream in the middle of a line
+                    if fake.split_chunks and len(pending) > 1:
+                        cut = len(pending) // 2
+                        self.send_chunk(pending[:cut])
+                        pending = pending[cut:]
+                    else:
+                        self.send_chunk(pending)
+                        pending = b""
+
+                final["total_duration"] = int((time.monotonic() - started) * 1e9)
+                self.send_chunk(pending + json.dumps(final).encode("utf-8") + b"\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
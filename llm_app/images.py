@@ -0,0 +1,206 @@
+import asyncio
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# A photo ready to be sent to a vision model. `key` identifies the source contents and
+# the preparation settings, `data` is the base64-encoded JPEG.
+PreparedImage = namedtuple("PreparedImage", ["key", "data"])
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as image_file:
+        while chunk := image_file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def init_worker(max_pixels):
+    """
+    Sets up a worker process of an ImageLoader. Pillow's decompression bomb limit is
+    set once per process, prepare_image skips the photos over `max_pixels` itself
+    since Pillow only refuses those over twice its limit.
+    """
+    django.setup()
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+def prepare_image(path, cache_dir, max_size=672, quality=85, max_pixels=50_000_000):
+    """
+    Prepares a photo for a vision model: decoded at a reduced scale where the format
+    allows it, rotated according to its EXIF orientation, downscaled so that its longest
+    side is at most `max_size` pixels and re-encoded as a base64 JPEG.
+
+    Results are cached in `cache_dir` under a hash of the file contents and the
+    preparation settings, so a photo is only decoded again when it changed. Runs in the
+    worker processes of an ImageLoader.
+
+    Returns:
+        PreparedImage: The prepared photo, None if it cannot be read or decoded.
+    """
+    try:
+        contents = hash_file(path)
+    except OSError as e:
+        print(f"Skipping image {path}: {e}")
+        return None
+
+    key = hashlib.sha256(f"{contents}:{max_size}:{quality}".encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, key[:2], f"{key}.b64")
+    try:
+        with open(cache_path) as cache_file:
+            return PreparedImage(key, cache_file.read())
+    except FileNotFoundError:
+        pass
+
+    try:
+        with Image.open(path) as image:
+            # Only the header was read so far, larger photos are skipped undecoded
+            if image.width * image.height > max_pixels:
+                print(
+                    f"Skipping image {path}: {image.width}x{image.height} pixels "
+                    f"exceed LLM_IMAGE_MAX_PIXELS"
+                )
+                return None
+            # JPEGs are decoded at 1/2, 1/4 or 1/8 scale right away, so the full-size
+            # bitmap of a large photo is never held in memory
+            image.draft("RGB", (max_size, max_size))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image.thumbnail((max_size, max_size))
+            encoded = io.BytesIO()
+            image.save(encoded, "JPEG", quality=quality, optimize=True)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Skipping image {path}: {e}")
+        return None
+
+    data = base64.b64encode(encoded.getvalue()).decode("ascii")
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as cache_file:
+        cache_file.write(data)
+    os.replace(temporary_path, cache_path)
+    return PreparedImage(key, data)
+
+
+class ImageLoader:
+    """
+    Prepares the photos of properties for a vision model in a pool of worker processes,
+    so that decoding and resizing run in parallel with generation and do not hold up
+    the event loop or the GIL.
+
+    Photos are only prepared for the properties about to be processed, a few at a time,
+    so at most the photos of `lookahead` properties are held in memory.
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        per_property=None,
+        lookahead=None,
+        root=None,
+        cache_dir=None,
+        max_size=None,
+        quality=None,
+        max_pixels=None,
+    ):
+        self.workers = workers or settings.LLM_IMAGE_WORKERS
+        self.per_property = per_property or settings.LLM_IMAGES_PER_PROPERTY
+        self.lookahead = lookahead or self.workers
+        self.root = root or settings.LLM_IMAGE_ROOT
+        self.cache_dir = str(cache_dir or settings.LLM_IMAGE_CACHE_DIR)
+        self.max_size = max_size or settings.LLM_IMAGE_MAX_SIZE
+        self.quality = quality or settings.LLM_IMAGE_QUALITY
+        self.max_pixels = max_pixels or settings.LLM_IMAGE_MAX_PIXELS
+        self.executor = None
+
+    def close(self):
+        """
+        Stops the worker processes, which are started again when needed.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def image_paths(self, property_info):
+        """
+        Returns the file paths of the first photos of a property, from the "image_names"
+        loaded with its chunk (see iter_property_info_chunks) or queried otherwise.
+        """
+        names = property_info.get("image_names")
+        if names is None:
+            # Worker processes import this module before setting up Django
+            from properties.models import PropertyImage
+
+            names = (
+                PropertyImage.objects.filter(property_id=property_info["id"])
+                .order_by("id")
+                .values_list("image", flat=True)[: self.per_property]
+            )
+        names = [name for name in names if name][: self.per_property]
+        return [os.path.join(self.root, name) for name in names]
+
+    def submit(self, property_info):
+        """
+        Starts preparing the photos of a property and returns their futures.
+        """
+        if self.executor is None:
+            # Spawning the worker processes avoids forking the threads of the parent
+            # (e.g. the endpoint health checks)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.max_pixels,),
+            )
+        return [
+            self.executor.submit(
+                prepare_image,
+                path,
+                self.cache_dir,
+                self.max_size,
+                self.quality,
+                self.max_pixels,
+            )
+            for path in self.image_paths(property_info)
+        ]
+
+    @staticmethod
+    def with_images(property_info, futures):
+        images = [future.result() for future in futures]
+        return {**property_info, "images": [image for image in images if image]}
+
+    def prefetch(self, properties):
+        """
+        Takes (property information, whether it is processed) pairs and yields them with
+        the prepared photos under "images", preparing the photos of the next `lookahead`
+        properties meanwhile. Only the photos of processed properties are prepared.
+        """
+        pending = deque()
+        for property_info, process in properties:
+            futures = self.submit(property_info) if process else []
+            pending.append((property_info, futures, process))
+            if len(pending) > self.lookahead:
+                property_info, futures, process = pending.popleft()
+                yield self.with_images(property_info, futures), process
+        for property_info, futures, process in pending:
+            yield self.with_images(property_info, futures), process
+
+    async def aload(self, property_info):
+        """
+        Async counterpart of prefetch for a single property.
+        """
+        futures = await sync_to_async(self.submit)(property_info)
+        images = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+        return {**property_info, "images": [image for image in images if image]}
@@ -0,0 +1,310 @@
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from properties.models import Property
+
+from llm_app.cache import get_generation_cache
+from llm_app.models import GenerationJob
+from llm_app.ollama import get_ollama_client, parse_keep_alive
+from llm_app.services import (
+    generate_property_summary,
+    iter_property_info,
+    mark_property_generated,
+    rewrite_property_title,
+    write_property_description,
+)
+from llm_app.stage_models import set_stage_models
+
+# Stages of a property in order. Finishing a stage queues the next one, so every stage
+# runs on the values the previous ones stored.
+STAGES = ("title", "description", "summary")
+NEXT_STAGE = dict(zip(STAGES, STAGES[1:]))
+
+
+def get_worker_name():
+    """
+    Returns the name a worker process records on the jobs it claims.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_properties(property_ids, stage=STAGES[0], batch_size=1000):
+    """
+    Queues a stage of the properties. Properties that already have a pending or running
+    job are left alone, finished and failed jobs of the stage are queued again.
+
+    Returns:
+        int: The number of queued jobs.
+    """
+    queued = 0
+    batch = []
+    for property_id in property_ids:
+        batch.append(property_id)
+        if len(batch) == batch_size:
+            queued += enqueue_batch(batch, stage)
+            batch = []
+    if batch:
+        queued += enqueue_batch(batch, stage)
+    return queued
+
+
+def enqueue_batch(property_ids, stage):
+    """
+    Queues a stage of the properties that have no pending or running job. The upsert
+    only resets finished and failed jobs, so a job claimed by a worker meanwhile is
+    never queued a second time.
+    """
+    active = set(
+        GenerationJob.objects.filter(
+            property_id__in=property_ids,
+            status__in=[GenerationJob.PENDING, GenerationJob.RUNNING],
+        ).values_list("property_id", flat=True)
+    )
+    property_ids = [
+        property_id for property_id in property_ids if property_id not in active
+    ]
+    if not property_ids:
+        return 0
+
+    now = timezone.now()
+    table = GenerationJob._meta.db_table
+    values = ", ".join(["(%s, %s, %s, NULL, '', 0, %s, %s)"] * len(property_ids))
+    params = []
+    for property_id in property_ids:
+        params += [property_id, stage, GenerationJob.PENDING, now, now]
+    params += [GenerationJob.PENDING, GenerationJob.RUNNING]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (property_id, stage, status, lease_expiry, worker, attempts,
+                 create_date, update_date)
+            VALUES {values}
+            ON CONFLICT (property_id, stage) DO UPDATE SET
+                status = excluded.status,
+                lease_expiry = NULL,
+                worker = '',
+                attempts = 0,
+                update_date = excluded.update_date
+            WHERE {table}.status NOT IN (%s, %s)
+            """,
+            params,
+        )
+        return cursor.rowcount
+
+
+def requeue_failed():
+    """
+    Queues the failed jobs again with a fresh number of attempts.
+    """
+    return GenerationJob.objects.filter(status=GenerationJob.FAILED).update(
+        status=GenerationJob.PENDING,
+        attempts=0,
+        lease_expiry=None,
+        worker="",
+        update_date=timezone.now(),
+    )
+
+
+def claim_job(worker, lease=None, max_attempts=None):
+    """
+    Claims the oldest pending job, or a running one whose lease expired, with
+    SELECT ... FOR UPDATE SKIP LOCKED so that concurrent workers never get the same job.
+    Jobs that used up their attempts are marked as failed instead.
+
+    Returns:
+        GenerationJob: The claimed job, None when there is nothing left to claim.
+    """
+    lease = lease or settings.LLM_JOB_LEASE
+    max_attempts = max_attempts or settings.LLM_JOB_MAX_ATTEMPTS
+
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            job = (
+                GenerationJob.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=GenerationJob.PENDING)
+                    | Q(status=GenerationJob.RUNNING, lease_expiry__lt=now)
+                )
+                .order_by("id")
+                .first()
+            )
+            if job is None:
+                return None
+
+            if job.attempts >= max_attempts:
+                # The worker of the last attempt died
+                job.status = GenerationJob.FAILED
+                job.save(update_fields=["status", "update_date"])
+                continue
+
+            job.status = GenerationJob.RUNNING
+            job.worker = worker
+            job.attempts += 1
+            job.lease_expiry = now + timedelta(seconds=lease)
+            job.save(
+                update_fields=[
+                    "status",
+                    "worker",
+                    "attempts",
+                    "lease_expiry",
+                    "update_date",
+                ]
+            )
+            return job
+
+
+def renew_lease(job, lease=None):
+    """
+    Extends the lease of a job still held by its worker.
+
+    Returns:
+        bool: False if the lease was lost to another worker.
+    """
+    lease = lease or settings.LLM_JOB_LEASE
+    return bool(
+        GenerationJob.objects.filter(
+            id=job.id, status=GenerationJob.RUNNING, worker=job.worker
+        ).update(
+            lease_expiry=timezone.now() + timedelta(seconds=lease),
+            update_date=timezone.now(),
+        )
+    )
+
+
+@contextmanager
+def keep_lease(job, lease=None):
+    """
+    Renews the lease of the job every third of its length until the block exits, so
+    that jobs outlasting the lease are not claimed again while their worker is alive.
+    """
+    lease = lease or settings.LLM_JOB_LEASE
+    stopped = threading.Event()
+
+    def renew():
+        try:
+            while not stopped.wait(lease / 3):
+                if not renew_lease(job, lease):
+                    return
+        finally:
+            # The renewals use a connection of their own, opened by this thread
+            connection.close()
+
+    thread = threading.Thread(target=renew, name=f"lease-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def finish_job(job, succeeded, max_attempts=None):
+    """
+    Ends a claimed job. A successful job is done and queues the next stage of its
+    property, a failed one is queued again until it used up its attempts.
+
+    Returns:
+        bool: False if the lease was lost to another worker, whose outcome then wins.
+    """
+    max_attempts = max_attempts or settings.LLM_JOB_MAX_ATTEMPTS
+    if succeeded:
+        status = GenerationJob.DONE
+    elif job.attempts < max_attempts:
+        status = GenerationJob.PENDING
+    else:
+        status = GenerationJob.FAILED
+
+    with transaction.atomic():
+        updated = GenerationJob.objects.filter(
+            id=job.id, status=GenerationJob.RUNNING, worker=job.worker
+        ).update(status=status, lease_expiry=None, update_date=timezone.now())
+        if updated and succeeded and job.stage in NEXT_STAGE:
+            enqueue_batch([job.property_id], NEXT_STAGE[job.stage])
+    return bool(updated)
+
+
+def run_job(job, client=None):
+    """
+    Generates the stage of a job from the property data as currently stored, i.e. with
+    the values of the previous stages, and saves the result right away.
+
+    Returns:
+        bool: Whether the stage was generated.
+    """
+    # Read from the primary, a replica may not have the previous stage yet
+    properties = Property.objects.using("default").filter(property_id=job.property_id)
+    property_info = next(iter_property_info(properties), None)
+    if property_info is None:
+        return False
+
+    if job.stage == "title":
+        return bool(rewrite_property_title(property_info, client=client))
+    if job.stage == "description":
+        return bool(write_property_description(property_info, client=client))
+
+    summary = generate_property_summary(property_info, client=client)
+    if summary:
+        # The stored title and description are the ones generated by the earlier stages
+        mark_property_generated(
+            property_info, property_info["title"], property_info["description"]
+        )
+    return bool(summary)
+
+
+def drain_queue(
+    lease=None, max_attempts=None, use_cache=True, keep_alive=None, stage_models=None
+):
+    """
+    Claims and runs jobs until the queue is empty. Meant to run in its own process,
+    several of which can work on the same queue from any number of machines.
+    `stage_models` replaces the models configured per stage, e.g. those of the parent.
+
+    Returns:
+        dict: The number of jobs done, to be retried and failed, and lost leases.
+    """
+    worker = get_worker_name()
+    get_generation_cache().enabled = use_cache
+    client = get_ollama_client()
+    if keep_alive is not None:
+        client.keep_alive = parse_keep_alive(keep_alive)
+    if stage_models is not None:
+        set_stage_models(stage_models)
+    counts = {"done": 0, "retry": 0, "failed": 0, "lost": 0}
+
+    try:
+        while job := claim_job(worker, lease, max_attempts):
+            with keep_lease(job, lease):
+                succeeded = run_job(job, client)
+            if not finish_job(job, succeeded, max_attempts):
+                counts["lost"] += 1
+            elif succeeded:
+                counts["done"] += 1
+            elif job.attempts < (max_attempts or settings.LLM_JOB_MAX_ATTEMPTS):
+                counts["retry"] += 1
+            else:
+                counts["failed"] += 1
+    finally:
+        connection.close()
+
+    return counts
+
+
+def queue_stats():
+    """
+    Returns the number of jobs per stage and status.
+    """
+    rows = GenerationJob.objects.values("stage", "status").annotate(jobs=Count("id"))
+    stats = {}
+    for row in rows:
+        stats.setdefault(row["stage"], {})[row["status"]] = row["jobs"]
+    return stats
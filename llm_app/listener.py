@@ -0,0 +1,89 @@
+import select
+import time
+
+import psycopg2
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Channel the property triggers of migration 0008 notify on
+CHANNEL = "llm_property_changed"
+
+
+class PropertyChangeListener:
+    """
+    Receives the IDs of changed properties from the notifications sent by the triggers
+    of the property tables. Listens on a connection of its own, so that waiting for
+    notifications does not hold up the connection used for generation.
+    """
+
+    def __init__(self, channel=CHANNEL, using=DEFAULT_DB_ALIAS):
+        self.channel = channel
+        self.using = using
+        self.connection = None
+
+    def connect(self):
+        """
+        Opens the connection and starts listening, unless already connected.
+        """
+        if self.connection is not None:
+            return
+        wrapper = connections[self.using]
+        self.connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        # LISTEN only takes effect once committed
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except psycopg2.Error:
+                pass
+            self.connection = None
+
+    def wait(self, timeout=None):
+        """
+        Waits up to `timeout` seconds (forever if None) for notifications.
+
+        Returns:
+            set: The IDs of the notified properties, empty on timeout.
+        """
+        self.connect()
+        if select.select([self.connection], [], [], timeout) != ([], [], []):
+            self.connection.poll()
+
+        property_ids = set()
+        while self.connection.notifies:
+            notify = self.connection.notifies.pop(0)
+            try:
+                property_ids.add(int(notify.payload))
+            except ValueError:
+                pass
+        return property_ids
+
+    def collect(self, timeout=None, debounce=2.0, max_wait=10.0, max_batch=100):
+        """
+        Waits up to `timeout` seconds for a change, then keeps collecting until no
+        change arrived for `debounce` seconds, `max_wait` seconds passed or `max_batch`
+        properties changed, so that a burst of edits is processed as one batch.
+
+        Returns:
+            set: The IDs of the changed properties, or None if the connection was lost
+            and changes may have been missed.
+        """
+        try:
+            property_ids = self.wait(timeout)
+            deadline = time.monotonic() + max_wait
+            while property_ids and len(property_ids) < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                changed = self.wait(min(debounce, remaining))
+                if not changed:
+                    break
+                property_ids |= changed
+        except psycopg2.Error as error:
+            print(f"Lost the property change notifications: {error}")
+            self.close()
+            return None
+        return property_ids
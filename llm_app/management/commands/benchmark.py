@@ -0,0 +1,348 @@
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from properties.models import Amenity, Location, Property
+
+from llm_app.fake_ollama import FakeOllamaServer
+from llm_app.metrics import percentile, read_run_report
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting the queries run on every connection it is installed on.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, db_connection):
+        if self not in db_connection.execute_wrappers:
+            db_connection.execute_wrappers.append(self)
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        # Connections opened by other threads (e.g. sync_to_async) are counted as well
+        self.install(connection)
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Command(BaseCommand):
+    """
+    Class for benchmarking the summary pipeline against a fake Ollama server.
+    """
+
+    help = (
+        "Benchmarks the summary command on synthetic properties in a temporary test "
+        "database, using a local fake Ollama server instead of a model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--properties",
+            type=int,
+            default=200,
+            help="Number of synthetic properties to generate",
+        )
+        parser.add_argument(
+            "--locations",
+            type=int,
+            default=5,
+            help="Number of locations per synthetic property",
+        )
+        parser.add_argument(
+            "--amenities",
+            type=int,
+            default=8,
+            help="Number of amenities per synthetic property",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Passed to the summary command",
+        )
+        parser.add_argument(
+            "--structured",
+            action="store_true",
+            help="Passed to the summary command",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Keep the generation cache enabled during the run",
+        )
+        parser.add_argument(
+            "--ttft",
+            type=float,
+            default=0.05,
+            help="Seconds before the fake server sends the first token",
+        )
+        parser.add_argument(
+            "--token-latency",
+            type=float,
+            default=0.002,
+            help="Seconds between two tokens of the fake server",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests the fake server answers with HTTP 500",
+        )
+        parser.add_argument(
+            "--malformed-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of NDJSON lines the fake server corrupts",
+        )
+        parser.add_argument(
+            "--split-chunks",
+            action="store_true",
+            help="Make the fake server split NDJSON lines across network chunks",
+        )
+        parser.add_argument(
+            "--ramble-tokens",
+            type=int,
+            default=20,
+            help="Number of tokens the fake server generates after the requested line",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed for the synthetic data and the fake server",
+        )
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Write the benchmark report as JSON to this file",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=None,
+            help="Compare the results with a report previously written with --output",
+        )
+
+    def handle(self, *args, **kwargs):
+        fake_server = FakeOllamaServer(
+            ttft=kwargs["ttft"],
+            token_latency=kwargs["token_latency"],
+            error_rate=kwargs["error_rate"],
+            malformed_rate=kwargs["malformed_rate"],
+            split_chunks=kwargs["split_chunks"],
+            ramble_tokens=kwargs["ramble_tokens"],
+            seed=kwargs["seed"],
+        )
+
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with fake_server, override_settings(
+                OLLAMA_URL=fake_server.url, OLLAMA_URLS=[fake_server.url]
+            ):
+                self.create_properties(
+                    kwargs["properties"],
+                    kwargs["locations"],
+                    kwargs["amenities"],
+                    kwargs["seed"],
+                )
+                report = self.run_pipeline(fake_server, kwargs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.print_report(report)
+
+        if kwargs["baseline"]:
+            with open(kwargs["baseline"]) as baseline_file:
+                self.print_comparison(report, json.load(baseline_file))
+
+        if kwargs["output"]:
+            with open(kwargs["output"], "w") as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(f"Report written to {kwargs['output']}\n")
+
+    def create_properties(self, count, locations_per_property, amenities, seed):
+        """
+        Fills the test database with synthetic properties, locations and amenities.
+        """
+        rng = random.Random(seed)
+
+        Amenity.objects.bulk_create(
+            [Amenity(name=f"Amenity {index}") for index in range(max(amenities, 30))]
+        )
+        Location.objects.bulk_create(
+            [
+                Location(
+                    name=f"Location {index}",
+                    type=rng.choice(["country", "state", "city"]),
+                    latitude=Decimal(str(round(rng.uniform(-90, 90), 6))),
+                    longitude=Decimal(str(round(rng.uniform(-180, 180), 6))),
+                )
+                for index in range(max(locations_per_property * 10, 50))
+            ]
+        )
+        Property.objects.bulk_create(
+            [
+                Property(
+                    title=f"Synthetic Hotel {index}",
+                    description=f"A synthetic hotel used for benchmarking, number {index}.",
+                )
+                for index in range(count)
+            ]
+        )
+
+        amenity_ids = list(Amenity.objects.values_list("id", flat=True))
+        location_ids = list(Location.objects.values_list("id", flat=True))
+        property_ids = list(Property.objects.values_list("property_id", flat=True))
+
+        Property.amenities.through.objects.bulk_create(
+            [
+                Property.amenities.through(property_id=property_id, amenity_id=amenity)
+                for property_id in property_ids
+                for amenity in rng.sample(amenity_ids, amenities)
+            ]
+        )
+        Property.locations.through.objects.bulk_create(
+            [
+                Property.locations.through(
+                    property_id=property_id, location_id=location
+                )
+                for property_id in property_ids
+                for location in rng.sample(location_ids, locations_per_property)
+            ]
+        )
+
+    def run_pipeline(self, fake_server, kwargs):
+        """
+        Runs the summary command and collects throughput, latency, query and memory figures.
+        """
+        counter = QueryCounter()
+        counter.install(connection)
+        connection_created.connect(counter.on_connection_created)
+
+        # The run report of the benchmark must not replace the one of real runs
+        report_dir = tempfile.TemporaryDirectory()
+        report_file = os.path.join(report_dir.name, "summary_report.json")
+
+        started = time.monotonic()
+        try:
+            # The pipeline prints a lot of progress output which is not of interest here
+            with redirect_stdout(io.StringIO()):
+                call_command(
+                    "summary",
+                    concurrency=kwargs["concurrency"],
+                    structured=kwargs["structured"],
+                    no_cache=not kwargs["cache"],
+                    report=report_file,
+                    stdout=io.StringIO(),
+                )
+            run_report = read_run_report(report_file)
+        finally:
+            report_dir.cleanup()
+            elapsed = time.monotonic() - started
+            connection_created.disconnect(counter.on_connection_created)
+            connection.execute_wrappers.remove(counter)
+
+        count = kwargs["properties"]
+        return {
+            "config": {
+                key: kwargs[key]
+                for key in (
+                    "properties",
+                    "locations",
+                    "amenities",
+                    "concurrency",
+                    "structured",
+                    "cache",
+                    "ttft",
+                    "token_latency",
+                    "error_rate",
+                    "malformed_rate",
+                    "split_chunks",
+                    "ramble_tokens",
+                    "seed",
+                )
+            },
+            "elapsed": elapsed,
+            "properties_per_second": count / elapsed if elapsed else None,
+            "queries": counter.count,
+            "queries_per_property": counter.count / count if count else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {
+                stage: {
+                    "requests": len(durations),
+                    "p50": percentile(durations, 50),
+                    "p95": percentile(durations, 95),
+                    "p99": percentile(durations, 99),
+                }
+                for stage, durations in fake_server.durations.items()
+            },
+            # Client-side figures of the summary command, including tokens/s and retries
+            "client_stages": run_report["stages"],
+            "database_seconds": run_report["database_seconds"],
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"Processed {report['config']['properties']} properties in "
+            f"{report['elapsed']:.2f}s ({report['properties_per_second']:.2f} properties/s)\n"
+        )
+        self.stdout.write(
+            f"DB queries: {report['queries']} "
+            f"({report['queries_per_property']:.2f} per property)\n"
+        )
+        self.stdout.write(f"Peak RSS: {report['peak_rss_mb']:.1f} MB\n")
+        self.stdout.write(f"DB time: {report['database_seconds']:.2f}s\n")
+        for stage, latency in report["stages"].items():
+            self.stdout.write(
+                f"{stage}: {latency['requests']} requests, "
+                f"p50 {latency['p50'] * 1000:.1f}ms, "
+                f"p95 {latency['p95'] * 1000:.1f}ms, "
+                f"p99 {latency['p99'] * 1000:.1f}ms\n"
+            )
+
+    def print_comparison(self, report, baseline):
+        """
+        Prints the relative change of the main figures compared to a baseline report.
+        """
+
+        def change(current, previous):
+            if not previous or current is None:
+                return "n/a"
+            return f"{(current - previous) / previous * 100:+.1f}%"
+
+        self.stdout.write("Compared to baseline:\n")
+        for key in ("properties_per_second", "queries_per_property", "peak_rss_mb"):
+            self.stdout.write(f"  {key}: {change(report[key], baseline.get(key))}\n")
+        for stage, latency in report["stages"].items():
+            previous = baseline.get("stages", {}).get(stage, {})
+            self.stdout.write(
+                f"  {stage} p95: {change(latency['p95'], previous.get('p95'))}\n"
+            )
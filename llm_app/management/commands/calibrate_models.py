@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from properties.models import Property
+
+from llm_app.calibration import CALIBRATION_STAGES, calibrate, recommend_models
+from llm_app.services import iter_property_info
+from llm_app.stage_models import read_model_map, write_model_map
+
+
+class Command(BaseCommand):
+    """
+    Class for choosing the model of each generation stage from measurements.
+    """
+
+    help = (
+        "Runs a sample of properties through each candidate model, measures latency, "
+        "tokens/s and the share of parsable answers per stage, and writes the fastest "
+        "reliable model of each stage to LLM_MODEL_MAP_FILE for the summary command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            nargs="+",
+            required=True,
+            help="Candidate Ollama models, e.g. gemma2:2b qwen2.5:0.5b llama3.1:8b",
+        )
+        parser.add_argument(
+            "--stages",
+            nargs="+",
+            choices=list(CALIBRATION_STAGES),
+            default=list(CALIBRATION_STAGES),
+            help="Stages to calibrate, all by default",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=20,
+            help="Number of randomly chosen properties each model generates",
+        )
+        parser.add_argument(
+            "--min-success",
+            type=float,
+            default=0.9,
+            help="Share of answers a model must parse to be recommended for a stage",
+        )
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="File of the recommended models, LLM_MODEL_MAP_FILE by default",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the measurements and recommendations",
+        )
+
+    def handle(self, *args, **kwargs):
+        output = kwargs["output"] or settings.LLM_MODEL_MAP_FILE
+
+        # Nothing is written, so the properties can come from any database
+        property_ids = list(
+            Property.objects.order_by("?").values_list("property_id", flat=True)[
+                : kwargs["sample"]
+            ]
+        )
+        if not property_ids:
+            raise CommandError("There are no properties to calibrate with.")
+        property_infos = list(
+            iter_property_info(Property.objects.filter(property_id__in=property_ids))
+        )
+
+        self.stdout.write(
+            f"Calibrating {len(kwargs['models'])} models on {len(property_infos)} "
+            f"properties\n"
+        )
+        result = calibrate(property_infos, kwargs["models"], kwargs["stages"])
+        recommended = recommend_models(result["stages"], kwargs["min_success"])
+
+        for model, seconds in result["load_seconds"].items():
+            if seconds is None:
+                self.stdout.write(self.style.ERROR(f"Failed to load {model}\n"))
+        for stage, results in result["stages"].items():
+            for model, stats in results.items():
+                tokens_per_second = (
+                    f"{stats['tokens_per_second']:.1f} tokens/s"
+                    if stats["tokens_per_second"]
+                    else "tokens/s unknown"
+                )
+                latency = (
+                    f"p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s"
+                    if stats["p50"] is not None
+                    else "no latency"
+                )
+                self.stdout.write(
+                    f"{stage} {model}: {stats['success_rate']:.0%} parsed, "
+                    f"{latency}, {tokens_per_second}\n"
+                )
+            if stage in recommended:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Recommended {stage} model: {recommended[stage]}\n"
+                    )
+                )
+
+        if kwargs["dry_run"] or not recommended:
+            return
+
+        # Stages that were not calibrated this time keep their previous model
+        write_model_map(
+            output,
+            {
+                "calibrated_at": timezone.now(),
+                "properties": len(property_infos),
+                "min_success": kwargs["min_success"],
+                "models": {**read_model_map(output), **recommended},
+                "load_seconds": result["load_seconds"],
+                "stages": result["stages"],
+            },
+        )
+        self.stdout.write(self.style.SUCCESS(f"Model map written to {output}\n"))
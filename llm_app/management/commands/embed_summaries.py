@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from llm_app.embeddings import embed_summaries, get_embedding_index
+
+
+class Command(BaseCommand):
+    """
+    Class for updating the embedding index of property summaries.
+    """
+
+    help = (
+        "Embeds the property summaries that changed since the last run with the Ollama "
+        "embed API and stores them in the embedding index used to find similar properties."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=32,
+            help="Number of summaries embedded per request",
+        )
+        parser.add_argument(
+            "--model",
+            default=None,
+            help="Embedding model, OLLAMA_EMBED_MODEL by default",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Embed every summary again instead of only the changed ones",
+        )
+
+    def handle(self, *args, **kwargs):
+        result = embed_summaries(
+            model=kwargs["model"],
+            batch_size=kwargs["batch_size"],
+            rebuild=kwargs["rebuild"],
+        )
+        if result is None:
+            self.stdout.write(
+                self.style.ERROR(
+                    "Embedding stopped after a failed batch, run the command again to continue.\n"
+                )
+            )
+            return
+
+        embedded, removed = result
+        index = get_embedding_index()
+        index.load()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Embedded {embedded} summaries, removed {removed}. The index holds "
+                f"{index.meta.get('count', 0)} rows in {index.directory}\n"
+            )
+        )
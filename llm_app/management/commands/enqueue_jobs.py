@@ -0,0 +1,107 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from properties.models import Property
+
+from llm_app.jobs import enqueue_properties, queue_stats, requeue_failed
+from llm_app.services import iter_property_info, needs_generation
+
+
+class Command(BaseCommand):
+    """
+    Class for filling the generation queue processed by `summary --worker`.
+    """
+
+    help = (
+        "Queues the generation of title, description and summary of the selected "
+        "properties, to be processed by any number of `summary --worker` processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ids",
+            type=int,
+            nargs="+",
+            default=None,
+            help="Only queue these property IDs",
+        )
+        parser.add_argument(
+            "--updated-since",
+            default=None,
+            help="Only queue properties updated since this date (ISO 8601)",
+        )
+        parser.add_argument(
+            "--changed-only",
+            action="store_true",
+            help="Only queue properties that changed since their last complete generation",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum number of properties to queue",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Queue the failed jobs again instead of selecting properties",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["retry_failed"]:
+            count = requeue_failed()
+            self.stdout.write(self.style.SUCCESS(f"Queued {count} failed jobs again\n"))
+        else:
+            count = enqueue_properties(self.select_property_ids(kwargs))
+            self.stdout.write(self.style.SUCCESS(f"Queued {count} properties\n"))
+
+        for stage, counts in queue_stats().items():
+            statuses = ", ".join(
+                f"{count} {status}" for status, count in counts.items()
+            )
+            self.stdout.write(f"{stage}: {statuses}\n")
+
+    @staticmethod
+    def parse_date(value):
+        """
+        Parses a date or datetime, naive values are in the current time zone.
+        """
+        parsed = parse_datetime(value)
+        if parsed is None and (day := parse_date(value)) is not None:
+            parsed = datetime.combine(day, time.min)
+        if parsed is None:
+            raise CommandError(f"Invalid date for --updated-since: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def select_property_ids(self, kwargs):
+        """
+        Yields the IDs of the properties matching the filters, in property_id order.
+        """
+        properties = Property.objects.order_by("property_id")
+        if kwargs["ids"]:
+            properties = properties.filter(property_id__in=kwargs["ids"])
+        if kwargs["updated_since"]:
+            updated_since = self.parse_date(kwargs["updated_since"])
+            properties = properties.filter(update_date__gte=updated_since)
+
+        limit = kwargs["limit"]
+        if kwargs["changed_only"]:
+            # Unchanged properties do not count towards the limit
+            count = 0
+            for property_info in iter_property_info(properties):
+                if limit is not None and count >= limit:
+                    return
+                if needs_generation(property_info):
+                    count += 1
+                    yield property_info["id"]
+            return
+
+        if limit is not None:
+            properties = properties[:limit]
+        yield from properties.values_list("property_id", flat=True).iterator(
+            chunk_size=1000
+        )
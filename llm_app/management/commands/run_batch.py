@@ -0,0 +1,67 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from llm_app.batch import arun_batch
+from llm_app.cache import get_generation_cache
+from llm_app.endpoints import get_endpoint_pool
+from llm_app.ollama import AsyncOllamaClient
+
+
+class Command(BaseCommand):
+    """
+    Class for running an exported batch of prompts against Ollama.
+    """
+
+    help = (
+        "Executes a prompts file written by `summary --export-batch` against Ollama and "
+        "appends the results to a JSONL file, to be applied with `summary --import-batch`. "
+        "Does not access the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Prompts file written by --export-batch")
+        parser.add_argument(
+            "output",
+            help="Results file, requests that already have a result in it are skipped",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="Number of properties to keep in flight at once",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=3,
+            help="Number of attempts per request",
+        )
+
+    def handle(self, *args, **kwargs):
+        # The generation cache lives in the database, which the runner does not need
+        get_generation_cache().enabled = False
+
+        concurrency = kwargs["concurrency"]
+        succeeded, failed = asyncio.run(
+            self.run(kwargs["input"], kwargs["output"], concurrency, kwargs["retries"])
+        )
+
+        for endpoint in get_endpoint_pool().stats():
+            self.stdout.write(
+                f"Ollama endpoint {endpoint['url']}: {endpoint['requests']} requests, "
+                f"{endpoint['errors']} errors, "
+                f"{endpoint['average_latency']:.2f}s average latency\n"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {succeeded} results to {kwargs['output']}, {failed} failed\n"
+            )
+        )
+
+    async def run(self, input_path, output_path, concurrency, retries):
+        async with AsyncOllamaClient(pool_size=concurrency) as client:
+            return await arun_batch(
+                client, input_path, output_path, concurrency, retries
+            )
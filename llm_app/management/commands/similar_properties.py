@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from properties.models import Property
+
+from llm_app.embeddings import embed_texts, get_embedding_index
+from llm_app.ollama import get_ollama_client
+
+
+class Command(BaseCommand):
+    """
+    Class for finding similar properties in the embedding index.
+    """
+
+    help = (
+        "Lists the properties whose summaries are the most similar to a property or to a "
+        "text. Use --min-score close to 1 to find near-duplicates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "property_id",
+            type=int,
+            nargs="?",
+            help="Property to find similar properties for",
+        )
+        parser.add_argument(
+            "--text",
+            default=None,
+            help="Find properties similar to this text instead of a property",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of results",
+        )
+        parser.add_argument(
+            "--min-score",
+            type=float,
+            default=None,
+            help="Minimum cosine similarity of the results",
+        )
+
+    def handle(self, *args, **kwargs):
+        index = get_embedding_index()
+        if not index.load():
+            raise CommandError(
+                "There is no embedding index, run embed_summaries first."
+            )
+
+        if kwargs["text"]:
+            vectors = embed_texts(get_ollama_client(), [kwargs["text"]], index.model)
+            if not vectors:
+                raise CommandError("Failed to embed the text.")
+            results = index.search(
+                vectors[0], kwargs["top"], min_score=kwargs["min_score"]
+            )
+        elif kwargs["property_id"] is not None:
+            results = index.similar(
+                kwargs["property_id"], kwargs["top"], kwargs["min_score"]
+            )
+            if results is None:
+                raise CommandError(
+                    f"Property {kwargs['property_id']} is not in the embedding index."
+                )
+        else:
+            raise CommandError("Give a property ID or --text.")
+
+        titles = dict(
+            Property.objects.filter(
+                property_id__in=[property_id for property_id, _ in results]
+            ).values_list("property_id", "title")
+        )
+        for property_id, score in results:
+            self.stdout.write(
+                f"{score:.4f}  {property_id}  {titles.get(property_id)}\n"
+            )
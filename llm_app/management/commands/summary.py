@@ -1,12 +1,60 @@
-from django.core.management.base import BaseCommand
+import asyncio
+import cProfile
+import io
+import multiprocessing
+import pstats
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils import timezone
 from properties.models import Property
 
+from llm_app.async_services import (
+    agenerate_property_content,
+    agenerate_property_session,
+    agenerate_property_summary,
+    arewrite_property_title,
+    awrite_property_description,
+)
+from llm_app.batch import export_batch, import_batch
+from llm_app.cache import get_generation_cache
+from llm_app.checkpoint import RunCheckpoint
+from llm_app.embeddings import embed_summaries
+from llm_app.endpoints import get_endpoint_pool
+from llm_app.images import ImageLoader
+from llm_app.jobs import drain_queue, queue_stats
+from llm_app.listener import PropertyChangeListener
+from llm_app.metrics import get_metrics, summarize_stages, write_run_report
+from llm_app.ollama import AsyncOllamaClient, get_ollama_client, parse_keep_alive
+from llm_app.pipeline import Pipeline, Stage
+from llm_app.resilience import get_retry_policy
 from llm_app.services import (  # rewrite_property_title,_description, write summary
-    fetch_property_info,
+    generate_property_content,
+    generate_property_session,
     generate_property_summary,
+    iter_property_info,
+    iter_property_info_chunks,
+    mark_property_generated,
+    needs_generation,
     rewrite_property_title,
+    with_generated_fields,
     write_property_description,
 )
+from llm_app.stage_models import (
+    STAGES,
+    get_stage_model,
+    get_stage_models,
+    set_stage_models,
+)
+from llm_app.tracing import span, start_tracing, stop_tracing
+from llm_app.writer import GenerationWriter
 
 
 class Command(BaseCommand):
@@ -23,66 +71,822 @@ class Command(BaseCommand):
             default=None,
             help="Limit the number of properties to process",
         )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Number of properties to keep in flight at once using the async Ollama client",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Always call the model instead of reusing cached generations",
+        )
+        parser.add_argument(
+            "--changed-only",
+            action="store_true",
+            help="Only process properties that changed since their last complete generation",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue after the last property processed by the previous run",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of processed properties to buffer before writing them in bulk",
+        )
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            default=5.0,
+            help="Maximum number of seconds generated values stay buffered before being written",
+        )
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            "--structured",
+            action="store_true",
+            help="Generate title, description and summary with one JSON-mode request per property",
+        )
+        mode.add_argument(
+            "--session",
+            action="store_true",
+            help="Generate title, description and summary as one conversation, reusing the model context",
+        )
+        parser.add_argument(
+            "--keep-alive",
+            default=None,
+            help="How long Ollama keeps the model loaded during this run (-1 pins it), instead of OLLAMA_KEEP_ALIVE",
+        )
+        parser.add_argument(
+            "--report",
+            default=None,
+            help="Write the JSON run report to this file instead of LLM_RUN_REPORT_FILE",
+        )
+        parser.add_argument(
+            "--embed",
+            action="store_true",
+            help="Update the embedding index of the summaries at the end of the run",
+        )
+        parser.add_argument(
+            "--export-batch",
+            metavar="FILE",
+            default=None,
+            help=(
+                "Write the prompts of the selected properties to a JSONL file instead of "
+                "calling the model. Without --structured, descriptions and summaries are "
+                "prompted with the current title and description, not the generated ones"
+            ),
+        )
+        parser.add_argument(
+            "--import-batch",
+            metavar="FILE",
+            default=None,
+            help="Apply a results JSONL file written by the run_batch command",
+        )
+        parser.add_argument(
+            "--images",
+            action="store_true",
+            help="Write descriptions from the property photos with OLLAMA_VISION_MODEL",
+        )
+        parser.add_argument(
+            "--worker",
+            action="store_true",
+            help="Process the jobs queued with the enqueue_jobs command until the queue is empty",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=4,
+            help="Number of worker processes draining the queue in --worker mode",
+        )
+        parser.add_argument(
+            "--daemon",
+            action="store_true",
+            help="Keep running and regenerate properties as soon as they change",
+        )
+        parser.add_argument(
+            "--debounce",
+            type=float,
+            default=None,
+            help="Seconds without changes before --daemon processes the changed properties, instead of LLM_DAEMON_DEBOUNCE",
+        )
+        parser.add_argument(
+            "--sweep-interval",
+            type=float,
+            default=None,
+            help="Seconds between checks of all properties in --daemon mode, instead of LLM_DAEMON_SWEEP_INTERVAL",
+        )
+        parser.add_argument(
+            "--model",
+            action="append",
+            default=[],
+            metavar="STAGE=MODEL",
+            help=f"Model of a generation stage ({', '.join(STAGES)}) for this run, can be repeated",
+        )
+        parser.add_argument(
+            "--profile",
+            nargs="?",
+            const="",
+            default=None,
+            metavar="FILE",
+            help="Profile the run with cProfile, print the slowest functions and optionally save the profile to FILE",
+        )
+        parser.add_argument(
+            "--trace",
+            metavar="FILE",
+            help="Record a timeline of the run to FILE, as Chrome trace events to open in Perfetto",
+        )
 
     def handle(self, *args, **kwargs):
+        profile = kwargs.get("profile")
+        trace_file = kwargs.get("trace")
+        if (profile is not None or trace_file) and kwargs.get("worker"):
+            raise CommandError(
+                "--profile and --trace only cover this process and cannot be combined "
+                "with --worker."
+            )
+
+        profiler = cProfile.Profile() if profile is not None else None
+        if trace_file:
+            start_tracing()
+        try:
+            if profiler is not None:
+                profiler.runcall(self.run, *args, **kwargs)
+            else:
+                self.run(*args, **kwargs)
+        finally:
+            if trace_file:
+                events = stop_tracing(trace_file)
+                self.stdout.write(f"Trace of {events} events written to {trace_file}\n")
+            if profiler is not None:
+                self.write_profile(profiler, profile)
+
+    def write_profile(self, profiler, path=None):
+        """
+        Prints the functions taking the most cumulative time and saves the profile to
+        `path`, e.g. for snakeviz. Only the main thread is profiled: in --concurrency mode
+        the database work of sync_to_async threads is missing.
+        """
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
+        self.stdout.write(report.getvalue())
+        if path:
+            stats.dump_stats(path)
+            self.stdout.write(f"Profile written to {path}\n")
+
+    def run(self, *args, **kwargs):
+        """
+        Runs the generation as configured by the command arguments.
+        """
         # Get the limit from command arguments
         limit = kwargs.get("limit")
+        concurrency = kwargs.get("concurrency")
+
+        cache = get_generation_cache()
+        cache.enabled = not kwargs.get("no_cache")
 
-        # Fetch properties with optional limit
+        # Metrics of this run, exported in the run report
+        get_metrics().reset()
+        get_retry_policy().reset()
+        self.concurrency = None
+        self.pipeline = None
+        self.report_file = kwargs.get("report") or settings.LLM_RUN_REPORT_FILE
+        self.started_at = timezone.now()
+        self.started = time.monotonic()
+        self.counts = {"generated": 0, "incomplete": 0, "skipped": 0}
+
+        self.changed_only = kwargs.get("changed_only")
+        self.structured = kwargs.get("structured")
+        self.session = kwargs.get("session")
+        self.keep_alive = kwargs.get("keep_alive")
+        if kwargs.get("model"):
+            set_stage_models(
+                {**get_stage_models(), **self.parse_stage_models(kwargs["model"])}
+            )
+        self.image_loader = ImageLoader() if kwargs.get("images") else None
+        self.writer = GenerationWriter(
+            batch_size=kwargs.get("batch_size"),
+            flush_interval=kwargs.get("flush_interval"),
+        )
+
+        # Offline batch mode: prompts and results are exchanged through files
+        if kwargs.get("export_batch"):
+            self.export_batch(kwargs["export_batch"], limit)
+            return
+        if kwargs.get("import_batch"):
+            self.import_batch(kwargs["import_batch"])
+            return
+
+        if kwargs.get("worker") and (self.structured or self.session):
+            raise CommandError(
+                "--worker generates each stage separately and cannot be combined "
+                "with --structured or --session."
+            )
+        if self.image_loader and (
+            self.structured or self.session or kwargs.get("worker")
+        ):
+            raise CommandError(
+                "--images cannot be combined with --structured, --session or --worker."
+            )
+
+        self.warm_up()
+
+        # Queue mode: the jobs queued by enqueue_jobs are claimed from the database
+        if kwargs.get("worker"):
+            self.run_workers(kwargs["processes"], cache.enabled)
+            return
+
+        if kwargs.get("daemon"):
+            self.run_daemon(
+                concurrency, kwargs.get("debounce"), kwargs.get("sweep_interval")
+            )
+            return
+
+        self.checkpoint = RunCheckpoint()
+
+        # Properties are loaded in property_id order so that a run can be resumed
         properties = Property.objects.all()
-        if limit is not None:
-            properties = properties[:limit]
+        if kwargs.get("resume"):
+            if self.checkpoint.last_property_id is not None:
+                properties = properties.filter(
+                    property_id__gt=self.checkpoint.last_property_id
+                )
+        else:
+            self.checkpoint.reset()
 
-        for property in properties:
-            # Fetch property information
-            print("fetching data: \n")
-            property_info = fetch_property_info(property.property_id)
+        status = "interrupted"
+        try:
+            if concurrency:
+                asyncio.run(self.handle_concurrently(properties, concurrency, limit))
+            else:
+                self.handle_sequentially(properties, limit)
+            status = "finished"
+        finally:
+            # Write whatever is still buffered, also when interrupted with Ctrl-C
+            self.flush()
+            report = self.write_run_report(status)
+            if self.image_loader:
+                self.image_loader.close()
 
-            if property_info:
-                print("\n")
-                new_title = rewrite_property_title(property_info)
-                # print(f"new title: {new_title}")
-                if new_title:
+        if kwargs.get("embed"):
+            result = embed_summaries()
+            if result is None:
+                self.stdout.write(self.style.ERROR("Failed to update the embeddings\n"))
+            else:
+                self.stdout.write(
+                    f"Embedded {result[0]} summaries, removed {result[1]}\n"
+                )
+
+        for endpoint in get_endpoint_pool().stats():
+            self.stdout.write(
+                f"Ollama endpoint {endpoint['url']}: {endpoint['requests']} requests, "
+                f"{endpoint['errors']} errors, "
+                f"{endpoint['average_latency']:.2f}s average latency\n"
+            )
+
+        resilience = report["resilience"]
+        retries = resilience["retry_budget"]
+        self.stdout.write(
+            f"Retries: {retries['retries']} for {retries['requests']} requests, "
+            f"{retries['denied']} denied by the retry budget, circuit breaker opened "
+            f"{resilience['circuit_breaker']['opened']} times\n"
+        )
+        if resilience["concurrency"]:
+            self.stdout.write(
+                f"Adaptive concurrency: limit {resilience['concurrency']['limit']} of "
+                f"{resilience['concurrency']['maximum']} at the end of the run\n"
+            )
+
+        for stage in report["pipeline"] or []:
+            self.stdout.write(
+                f"Pipeline stage {stage['name']}: {stage['processed']} properties, "
+                f"{stage['busy_workers']:.1f} of {stage['workers']} workers busy on average\n"
+            )
+
+        if cache.enabled:
+            cache.evict()
+            stats = cache.stats()
+            self.stdout.write(
+                f"Generation cache: {stats['hits']} hits, {stats['misses']} misses\n"
+            )
+
+        for stage, stats in report["stages"].items():
+            tokens_per_second = (
+                f"{stats['tokens_per_second']:.1f} tokens/s"
+                if stats["tokens_per_second"]
+                else "tokens/s unknown"
+            )
+            self.stdout.write(
+                f"{stage}: {stats['requests']} requests, {stats['retries']} retries, "
+                f"{stats['average_seconds']:.2f}s average, {tokens_per_second}, "
+                f"~{stats['average_prompt_tokens']:.0f} prompt tokens "
+                f"({stats['prompt_tokens_saved']} saved by compaction)\n"
+            )
+        self.stdout.write(f"Run report written to {self.report_file}\n")
+
+    @staticmethod
+    def parse_stage_models(values):
+        """
+        Parses STAGE=MODEL arguments into a dictionary.
+        """
+        models = {}
+        for value in values:
+            stage, _, model = value.partition("=")
+            if stage not in STAGES or not model:
+                raise CommandError(
+                    f"Invalid --model {value!r}, expected STAGE=MODEL with a stage "
+                    f"among {', '.join(STAGES)}."
+                )
+            models[stage] = model
+        return models
+
+    def warm_up(self):
+        """
+        Loads the models of the stages to run on every Ollama endpoint before the first
+        property, so that no generation waits for them.
+        """
+        client = get_ollama_client()
+        if self.keep_alive is not None:
+            client.keep_alive = parse_keep_alive(self.keep_alive)
+
+        if self.structured:
+            stages = ["content"]
+        elif self.session:
+            stages = ["session"]
+        else:
+            stages = ["title", "description", "summary"]
+        self.stdout.write(
+            "Models: "
+            + ", ".join(
+                f"{stage} {get_stage_model(stage, client.model)}" for stage in stages
+            )
+            + "\n"
+        )
+
+        # Stages sharing a model load it once
+        models = list(
+            dict.fromkeys(get_stage_model(stage, client.model) for stage in stages)
+        )
+        if self.image_loader:
+            models.append(settings.OLLAMA_VISION_MODEL)
+
+        for model in models:
+            for url, elapsed in client.warm_up(model):
+                if elapsed is None:
                     self.stdout.write(
-                        self.style.SUCCESS(
-                            f"Updated title for property {property.property_id}\n"
-                        )
+                        self.style.ERROR(f"Failed to load {model} on {url}\n")
                     )
                 else:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"Failed to update title for property {property.property_id}\nTitle: {property.title}\n"
-                        )
+                    self.stdout.write(f"Loaded {model} on {url} in {elapsed:.2f}s\n")
+
+    def run_workers(self, processes, use_cache=True):
+        """
+        Drains the generation queue with a pool of worker processes. Jobs are claimed
+        from the database, so workers started on other machines share the work.
+        """
+        # Worker processes open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        ) as executor:
+            futures = [
+                executor.submit(
+                    drain_queue,
+                    use_cache=use_cache,
+                    keep_alive=self.keep_alive,
+                    stage_models=get_stage_models(),
+                )
+                for _ in range(processes)
+            ]
+            counts = Counter()
+            for future in futures:
+                counts.update(future.result())
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Worker processes finished: {counts['done']} jobs done, "
+                f"{counts['retry']} to retry, {counts['failed']} failed, "
+                f"{counts['lost']} lost to expired leases\n"
+            )
+        )
+        for stage, stage_counts in queue_stats().items():
+            statuses = ", ".join(
+                f"{count} {status}" for status, count in stage_counts.items()
+            )
+            self.stdout.write(f"{stage}: {statuses}\n")
+
+    def run_daemon(self, concurrency=None, debounce=None, sweep_interval=None):
+        """
+        Regenerates properties as they change. The triggers of the property tables
+        notify the IDs of changed properties, which are collected into batches and
+        processed like a --changed-only run. All properties are checked at startup and
+        every `sweep_interval` seconds, catching changes made while the daemon was down
+        or its connection was lost.
+        """
+        debounce = settings.LLM_DAEMON_DEBOUNCE if debounce is None else debounce
+        if sweep_interval is None:
+            sweep_interval = settings.LLM_DAEMON_SWEEP_INTERVAL
+
+        # Also ignores the notifications sent by the daemon's own writes
+        self.changed_only = True
+        self.checkpoint = RunCheckpoint(name="daemon")
+        listener = PropertyChangeListener()
+        next_sweep = time.monotonic()
+
+        status = "interrupted"
+        try:
+            # Listen before the first sweep so that no change falls in between
+            listener.connect()
+            self.stdout.write(f"Listening for property changes on {listener.channel}\n")
+
+            while True:
+                timeout = None
+                if next_sweep is not None:
+                    timeout = max(0, next_sweep - time.monotonic())
+                property_ids = listener.collect(
+                    timeout,
+                    debounce=debounce,
+                    max_wait=settings.LLM_DAEMON_MAX_WAIT,
+                    max_batch=settings.LLM_DAEMON_BATCH_SIZE,
+                )
+
+                if property_ids is None:
+                    # Reconnect after a pause and look for the changes that were missed
+                    time.sleep(5)
+                    next_sweep = time.monotonic()
+                elif property_ids:
+                    self.stdout.write(f"{len(property_ids)} properties changed\n")
+                    # Read from the primary, a replica may not have the changes yet
+                    self.process_changes(
+                        Property.objects.using("default").filter(
+                            property_id__in=property_ids
+                        ),
+                        concurrency,
                     )
 
-                # Try to generate the property description separately
-                new_description = write_property_description(property_info)
-                # print(f"new description: {new_description}")
-                if new_description:
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f"Updated description for property {property.property_id}\n"
-                        )
+                if next_sweep is not None and time.monotonic() >= next_sweep:
+                    self.stdout.write("Checking all properties for missed changes\n")
+                    self.process_changes(Property.objects.all(), concurrency)
+                    next_sweep = (
+                        time.monotonic() + sweep_interval if sweep_interval else None
                     )
-                else:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"Failed to update description for property {property.property_id}\nTitle: {property.title}\n"
-                        )
+        finally:
+            listener.close()
+            if self.image_loader:
+                self.image_loader.close()
+            self.flush()
+            self.write_run_report(status)
+
+    def process_changes(self, properties, concurrency=None):
+        """
+        Processes a batch of properties in daemon mode and stores the results right away.
+        """
+        # The daemon's connection may have been idle for a long time
+        close_old_connections()
+        if concurrency:
+            asyncio.run(self.handle_concurrently(properties, concurrency))
+        else:
+            self.handle_sequentially(properties)
+        self.flush()
+        self.write_run_report("running")
+
+    def export_batch(self, path, limit=None):
+        """
+        Writes the prompts of the selected properties to a JSONL file.
+        """
+        property_infos = (
+            property_info
+            for property_info in iter_property_info(limit=limit)
+            if self.should_process(property_info)
+        )
+        count = export_batch(
+            path, property_infos, get_ollama_client().model, self.structured
+        )
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} prompts to {path}\n"))
+
+    def import_batch(self, path):
+        """
+        Applies a results JSONL file with bulk writes.
+        """
+        applied, failed = import_batch(path, self.writer)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Applied {applied} results from {path}, skipped {failed} failed results\n"
+            )
+        )
+
+    def handle_sequentially(self, properties, limit=None):
+        """
+        Processes the properties one at a time.
+        """
+        # Property information is fetched in bulk chunks
+        jobs = (
+            (property_info, self.should_process(property_info))
+            for property_info in iter_property_info(
+                properties, limit=limit, images=self.image_loader is not None
+            )
+        )
+        if self.image_loader:
+            # Photos of the next properties are prepared while the current one is generated
+            jobs = self.image_loader.prefetch(jobs)
+
+        for property_info, process in jobs:
+            property_id = property_info["id"]
+            self.checkpoint.start(property_id)
+
+            if process:
+                print("\n")
+                with span("property", "pipeline", property_id=property_id):
+                    new_title, new_description, new_summary = self.generate(
+                        property_info
                     )
 
-                # Generate the property summary
-                new_summary = generate_property_summary(property_info)
-                # print(f"New summary: {new_summary}")
-                if new_summary:
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f"Updated summary for property {property.property_id}\n"
-                        )
+                if new_title and new_description and new_summary:
+                    mark_property_generated(
+                        property_info, new_title, new_description, self.writer
                     )
+                    self.counts["generated"] += 1
                 else:
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"Failed to update summary for property {property.property_id}\nTitle: {property.title}\n"
-                        )
-                    )
+                    self.counts["incomplete"] += 1
+            else:
+                self.counts["skipped"] += 1
+
+            self.checkpoint.finish(property_id)
+            self.maybe_flush()
+
+    def generate(self, property_info):
+        """
+        Generates title, description and summary of a property and reports each of them.
+        """
+        property_id = property_info["id"]
+        title = property_info["title"]
+
+        if self.structured:
+            new_title, new_description, new_summary = generate_property_content(
+                property_info, writer=self.writer
+            )
+            self.report(property_id, title, "title", new_title)
+            self.report(property_id, title, "description", new_description)
+            self.report(property_id, title, "summary", new_summary)
+            return new_title, new_description, new_summary
+
+        if self.session:
+            new_title, new_description, new_summary = generate_property_session(
+                property_info, writer=self.writer
+            )
+            self.report(property_id, title, "title", new_title)
+            self.report(property_id, title, "description", new_description)
+            self.report(property_id, title, "summary", new_summary)
+            return new_title, new_description, new_summary
+
+        new_title = rewrite_property_title(property_info, writer=self.writer)
+        # print(f"new title: {new_title}")
+        self.report(property_id, title, "title", new_title)
+
+        # Try to generate the property description separately, from the new title
+        new_description = write_property_description(
+            with_generated_fields(property_info, new_title), writer=self.writer
+        )
+        # print(f"new description: {new_description}")
+        self.report(property_id, title, "description", new_description)
+
+        # Generate the property summary
+        new_summary = generate_property_summary(
+            with_generated_fields(property_info, new_title, new_description),
+            writer=self.writer,
+        )
+        # print(f"New summary: {new_summary}")
+        self.report(property_id, title, "summary", new_summary)
+
+        return new_title, new_description, new_summary
+
+    def maybe_flush(self):
+        """
+        Flushes the write-behind buffer when it is due. The checkpoint is only saved
+        after a flush so that it never gets ahead of the stored values.
+        """
+        if self.writer.maybe_flush():
+            self.checkpoint.save()
+            self.write_run_report("running")
+
+    def flush(self):
+        """
+        Flushes the write-behind buffer and saves the checkpoint.
+        """
+        self.writer.flush()
+        self.checkpoint.save()
+
+    def write_run_report(self, status):
+        """
+        Writes the JSON run report: property counts, endpoint and cache statistics,
+        per-stage figures and every collected metric. Returns the report.
+        """
+        snapshot = get_metrics().snapshot()
+        report = {
+            "status": status,
+            "started_at": self.started_at.isoformat(),
+            "updated_at": timezone.now().isoformat(),
+            "elapsed": time.monotonic() - self.started,
+            "properties": self.counts,
+            "endpoints": get_endpoint_pool().stats(),
+            "resilience": {
+                "retry_budget": get_retry_policy().stats(),
+                "circuit_breaker": get_endpoint_pool().breaker.stats(),
+                "concurrency": self.concurrency,
+            },
+            "pipeline": self.pipeline,
+            "cache": get_generation_cache().stats(),
+            "stages": summarize_stages(snapshot),
+            "database_seconds": sum(
+                histogram["sum"]
+                for histogram in snapshot["histograms"]
+                if histogram["name"] == "llm_db_seconds"
+            ),
+            "metrics": snapshot,
+        }
+        write_run_report(self.report_file, report)
+        return report
+
+    def should_process(self, property_info):
+        """
+        Returns False for properties that can be skipped in --changed-only mode.
+        """
+        if not self.changed_only or needs_generation(property_info):
+            return True
+
+        print(f"Property {property_info['id']} is unchanged, skipping.")
+        return False
+
+    def report(self, property_id, title, field, value):
+        """
+        Writes the success or failure message for one generated field of a property.
+        """
+        if value:
+            self.stdout.write(
+                self.style.SUCCESS(f"Updated {field} for property {property_id}\n")
+            )
+        else:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"Failed to update {field} for property {property_id}\nTitle: {title}\n"
+                )
+            )
+
+    async def handle_concurrently(self, properties, concurrency, limit=None):
+        """
+        Processes the properties as a pipeline of stages connected by bounded queues:
+        loading, title, description and summary generation, and writing. Each property
+        goes through the stages in order while the stages work on different properties
+        at the same time, so the database and the model server are kept busy. Every
+        generation stage has `concurrency` workers, the client's adaptive limit decides
+        how many requests are actually in flight. All database access is handed off to
+        Django's sync thread.
+        """
+        async with AsyncOllamaClient(
+            pool_size=concurrency, keep_alive=self.keep_alive
+        ) as client:
+            if self.structured or self.session:
+                # A single request (or conversation) generates all three fields
+                stages = [
+                    Stage("content", partial(self.agenerate, client), concurrency)
+                ]
+            else:
+                stages = [
+                    Stage("title", partial(self.agenerate_title, client), concurrency),
+                    Stage(
+                        "description",
+                        partial(self.agenerate_description, client),
+                        concurrency,
+                    ),
+                    Stage(
+                        "summary", partial(self.agenerate_summary, client), concurrency
+                    ),
+                ]
+            if self.image_loader:
+                stages.insert(
+                    0, Stage("images", self.aload_images, self.image_loader.workers)
+                )
+            stages.append(Stage("write", self.afinish_property))
+
+            pipeline = Pipeline(stages, queue_size=concurrency * 2)
+            try:
+                await pipeline.run(self.aload_properties(properties, limit))
+            finally:
+                self.pipeline = pipeline.stats()
+
+            if client.limiter is not None:
+                self.concurrency = client.limiter.stats()
+
+    async def aload_properties(self, properties, limit=None):
+        """
+        Loads property information chunk by chunk and yields one job per property with
+        the fields generated by the stages.
+        """
+        chunks = iter_property_info_chunks(
+            properties, limit=limit, images=self.image_loader is not None
+        )
+        while chunk := await sync_to_async(next)(chunks, None):
+            for property_info in chunk:
+                self.checkpoint.start(property_info["id"])
+                yield {
+                    "info": property_info,
+                    # The last generation was loaded with the chunk, no query is needed
+                    "process": self.should_process(property_info),
+                    "title": None,
+                    "description": None,
+                    "summary": None,
+                }
+
+    async def aload_images(self, job):
+        """
+        Attaches the prepared photos of the property for the description stage.
+        """
+        if job["process"]:
+            job["info"] = await self.image_loader.aload(job["info"])
+        return job
+
+    async def agenerate_title(self, client, job):
+        if job["process"]:
+            print("\n")
+            property_info = job["info"]
+            job["title"] = await arewrite_property_title(
+                client, property_info, writer=self.writer
+            )
+            self.report(
+                property_info["id"], property_info["title"], "title", job["title"]
+            )
+        return job
+
+    async def agenerate_description(self, client, job):
+        if job["process"]:
+            property_info = job["info"]
+            job["description"] = await awrite_property_description(
+                client,
+                with_generated_fields(property_info, job["title"]),
+                writer=self.writer,
+            )
+            self.report(
+                property_info["id"],
+                property_info["title"],
+                "description",
+                job["description"],
+            )
+        return job
+
+    async def agenerate_summary(self, client, job):
+        if job["process"]:
+            property_info = job["info"]
+            job["summary"] = await agenerate_property_summary(
+                client,
+                with_generated_fields(property_info, job["title"], job["description"]),
+                writer=self.writer,
+            )
+            self.report(
+                property_info["id"], property_info["title"], "summary", job["summary"]
+            )
+        return job
+
+    async def agenerate(self, client, job):
+        """
+        Generates all three fields of a property in structured or session mode.
+        """
+        if not job["process"]:
+            return job
+
+        print("\n")
+        property_info = job["info"]
+        generate = (
+            agenerate_property_content
+            if self.structured
+            else agenerate_property_session
+        )
+        job["title"], job["description"], job["summary"] = await generate(
+            client, property_info, writer=self.writer
+        )
+        for field in ("title", "description", "summary"):
+            self.report(property_info["id"], property_info["title"], field, job[field])
+        return job
+
+    async def afinish_property(self, job):
+        """
+        Records the outcome of a property once all its stages are done.
+        """
+        property_info = job["info"]
+        if not job["process"]:
+            self.counts["skipped"] += 1
+        elif job["title"] and job["description"] and job["summary"]:
+            await sync_to_async(mark_property_generated)(
+                property_info, job["title"], job["description"], self.writer
+            )
+            self.counts["generated"] += 1
+        else:
+            self.counts["incomplete"] += 1
+
+        self.checkpoint.finish(property_info["id"])
+        await sync_to_async(self.maybe_flush)()
@@ -0,0 +1,346 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from llm_app.tracing import get_tracer
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    "llm_generation_requests_total": "Generation requests by stage, model, endpoint and outcome.",
+    "llm_generation_retries_total": "Generation requests that were retries of a failed attempt.",
+    "llm_generation_seconds": "Wall-clock time of generation requests as seen by the client.",
+    "llm_streamed_tokens_total": "Tokens received from Ollama, including streams stopped early.",
+    "ollama_prompt_eval_tokens_total": "Prompt tokens evaluated, as reported by Ollama.",
+    "ollama_eval_tokens_total": "Tokens generated, as reported by Ollama.",
+    "ollama_total_seconds_total": "Total request time, as reported by Ollama.",
+    "ollama_load_seconds_total": "Model load time, as reported by Ollama.",
+    "ollama_prompt_eval_seconds_total": "Prompt evaluation time, as reported by Ollama.",
+    "ollama_eval_seconds_total": "Generation time, as reported by Ollama.",
+    "ollama_load_seconds": "Model load time per request, as reported by Ollama.",
+    "llm_db_seconds": "Time spent in database operations of the pipeline.",
+    "llm_prompt_tokens": "Estimated tokens of the prompts sent to the model.",
+    "llm_prompt_saved_tokens_total": "Estimated prompt tokens saved by compacting the property details.",
+}
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process store of counters and histograms.
+    Metrics are identified by name and a set of labels, as in Prometheus.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                key,
+                {
+                    "buckets": list(buckets),
+                    "counts": [0] * len(buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                },
+            )
+            histogram["sum"] += value
+            histogram["count"] += 1
+            for index, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the time spent in the with block.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def snapshot(self):
+        """
+        Returns a JSON-serializable copy of every metric.
+        """
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": list(data["buckets"]),
+                        "counts": list(data["counts"]),
+                        "sum": data["sum"],
+                        "count": data["count"],
+                    }
+                    for (name, labels), data in self.histograms.items()
+                ],
+            }
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_prometheus(snapshots):
+    """
+    Renders metric snapshots in the Prometheus text exposition format.
+
+    Args:
+        snapshots (list): (snapshot, extra labels) pairs, e.g. one per process.
+    """
+    series = {}
+    for snapshot, extra_labels in snapshots:
+        for counter in snapshot.get("counters", []):
+            labels = {**counter["labels"], **extra_labels}
+            series.setdefault((counter["name"], "counter"), []).append(
+                f"{counter['name']}{format_labels(labels)} {counter['value']}"
+            )
+        for histogram in snapshot.get("histograms", []):
+            name = histogram["name"]
+            labels = {**histogram["labels"], **extra_labels}
+            lines = series.setdefault((name, "histogram"), [])
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                lines.append(
+                    f"{name}_bucket{format_labels({**labels, 'le': bound})} {count}"
+                )
+            lines.append(
+                f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {histogram['count']}"
+            )
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+    output = []
+    for (name, kind), lines in sorted(series.items()):
+        if name in HELP:
+            output.append(f"# HELP {name} {HELP[name]}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
+
+
+def endpoint_label(url):
+    """
+    Reduces a request URL to the scheme and host of the Ollama endpoint.
+    """
+    if not url:
+        return "unknown"
+    parts = urlsplit(str(url))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def record_generation(
+    stage, model, url, started, outcome, attempt=0, stats=None, tokens=0
+):
+    """
+    Records one generation request.
+
+    Args:
+        stage (str): Pipeline stage, e.g. "title".
+        model (str): Model used for the request.
+        url: URL of the request, used to label the endpoint.
+        started (float): time.monotonic() when the request was sent.
+        outcome (str): "success", "unparsed", "http_error" or "error".
+        attempt (int): Index of the attempt, anything above 0 counts as a retry.
+        stats (dict): Final NDJSON object of the response carrying Ollama's timings. It is
+            missing when the stream was stopped as soon as the wanted line was read.
+        tokens (int): Number of tokens received.
+    """
+    metrics = get_metrics()
+    labels = {"stage": stage, "model": model, "endpoint": endpoint_label(url)}
+
+    tracer = get_tracer()
+    if tracer is not None:
+        # Drawn as an async span, generations overlap the spans of the caller's track
+        tracer.interval(
+            f"generate {stage}",
+            "generation",
+            started,
+            time.monotonic(),
+            {**labels, "outcome": outcome, "attempt": attempt, "tokens": tokens},
+        )
+
+    metrics.inc("llm_generation_requests_total", outcome=outcome, **labels)
+    metrics.observe("llm_generation_seconds", time.monotonic() - started, **labels)
+    if attempt:
+        metrics.inc("llm_generation_retries_total", **labels)
+    if tokens:
+        metrics.inc("llm_streamed_tokens_total", tokens, **labels)
+
+    if stats:
+        metrics.inc(
+            "ollama_prompt_eval_tokens_total",
+            stats.get("prompt_eval_count", 0),
+            **labels,
+        )
+        metrics.inc("ollama_eval_tokens_total", stats.get("eval_count", 0), **labels)
+        for field in ("total", "load", "prompt_eval", "eval"):
+            metrics.inc(
+                f"ollama_{field}_seconds_total",
+                stats.get(f"{field}_duration", 0) / 1e9,
+                **labels,
+            )
+        metrics.observe(
+            "ollama_load_seconds", stats.get("load_duration", 0) / 1e9, **labels
+        )
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (nearest rank) of the values, or None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize_stages(snapshot):
+    """
+    Aggregates a snapshot per stage: requests, outcomes, average latency, tokens/sec and
+    estimated prompt tokens.
+    """
+    stages = {}
+
+    def stage_summary(stage):
+        return stages.setdefault(
+            stage,
+            {
+                "requests": 0,
+                "outcomes": {},
+                "retries": 0,
+                "eval_tokens": 0,
+                "streamed_tokens": 0,
+                "prompt_tokens_saved": 0,
+            },
+        )
+
+    for counter in snapshot["counters"]:
+        stage = counter["labels"].get("stage")
+        if stage is None:
+            continue
+        summary = stage_summary(stage)
+        if counter["name"] == "llm_generation_requests_total":
+            outcome = counter["labels"]["outcome"]
+            summary["requests"] += counter["value"]
+            summary["outcomes"][outcome] = (
+                summary["outcomes"].get(outcome, 0) + counter["value"]
+            )
+        elif counter["name"] == "llm_generation_retries_total":
+            summary["retries"] += counter["value"]
+        elif counter["name"] == "llm_streamed_tokens_total":
+            summary["streamed_tokens"] += counter["value"]
+        elif counter["name"] == "ollama_eval_tokens_total":
+            summary["eval_tokens"] += counter["value"]
+        elif counter["name"] == "ollama_eval_seconds_total":
+            summary["eval_seconds"] = summary.get("eval_seconds", 0) + counter["value"]
+        elif counter["name"] == "ollama_load_seconds_total":
+            summary["load_seconds"] = summary.get("load_seconds", 0) + counter["value"]
+        elif counter["name"] == "llm_prompt_saved_tokens_total":
+            summary["prompt_tokens_saved"] += counter["value"]
+
+    for histogram in snapshot["histograms"]:
+        stage = histogram["labels"].get("stage")
+        if histogram["name"] == "llm_generation_seconds" and stage in stages:
+            summary = stages[stage]
+            summary["seconds"] = summary.get("seconds", 0) + histogram["sum"]
+            summary["timed_requests"] = (
+                summary.get("timed_requests", 0) + histogram["count"]
+            )
+        elif histogram["name"] == "llm_prompt_tokens":
+            summary = stage_summary(stage)
+            summary["prompt_tokens"] = (
+                summary.get("prompt_tokens", 0) + histogram["sum"]
+            )
+            summary["prompts"] = summary.get("prompts", 0) + histogram["count"]
+
+    for summary in stages.values():
+        timed_requests = summary.pop("timed_requests", 0)
+        seconds = summary.pop("seconds", 0)
+        summary["average_seconds"] = seconds / timed_requests if timed_requests else 0
+        eval_seconds = summary.pop("eval_seconds", 0)
+        # Ollama only reports its timings at the end of a stream, for streams stopped
+        # early the rate is estimated from the tokens received and the wall-clock time
+        if eval_seconds:
+            summary["tokens_per_second"] = summary["eval_tokens"] / eval_seconds
+        elif seconds:
+            summary["tokens_per_second"] = summary["streamed_tokens"] / seconds
+        else:
+            summary["tokens_per_second"] = None
+        summary["load_seconds"] = summary.get("load_seconds", 0)
+        prompts = summary.setdefault("prompts", 0)
+        summary["average_prompt_tokens"] = (
+            summary.pop("prompt_tokens", 0) / prompts if prompts else 0
+        )
+
+    return stages
+
+
+def write_run_report(path, report):
+    """
+    Writes a run report as JSON. The file is replaced atomically so that readers such as
+    the /metrics view never see a partial report.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    os.replace(temporary_path, path)
+
+
+def read_run_report(path):
+    """
+    Returns the run report stored at the path, or None if there is none.
+    """
+    try:
+        with open(path) as report_file:
+            return json.load(report_file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+_metrics = None
+
+
+def get_metrics():
+    """
+    Returns the process-wide MetricsRegistry, creating it on first use.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("llm_app", "0003_alter_propertysummary_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedGeneration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("model", models.CharField(max_length=100)),
+                ("response", models.TextField()),
+                ("create_date", models.DateTimeField(auto_now_add=True)),
+                ("update_date", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                "verbose_name": "Cached Generation",
+                "verbose_name_plural": "Cached Generations",
+            },
+        ),
+    ]
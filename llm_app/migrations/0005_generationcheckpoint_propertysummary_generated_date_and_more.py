@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("llm_app", "0004_cachedgeneration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GenerationCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("last_property_id", models.IntegerField(blank=True, null=True)),
+                ("create_date", models.DateTimeField(auto_now_add=True)),
+                ("update_date", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Generation Checkpoint",
+                "verbose_name_plural": "Generation Checkpoints",
+            },
+        ),
+        migrations.AddField(
+            model_name="propertysummary",
+            name="generated_date",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="propertysummary",
+            name="input_fingerprint",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:11
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The search vector combines the property title (weight A) and the summary (weight B).
+# Triggers keep it up to date on every write, including bulk upserts and title changes.
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION llm_app_summary_search_vector(title text, summary text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(summary, '')), 'B');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE FUNCTION llm_app_propertysummary_search_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := llm_app_summary_search_vector(
+        (SELECT title FROM properties_property WHERE property_id = NEW.property_id),
+        NEW.summary
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_app_propertysummary_search
+BEFORE INSERT OR UPDATE OF summary, property_id ON llm_app_propertysummary
+FOR EACH ROW EXECUTE FUNCTION llm_app_propertysummary_search_trigger();
+
+CREATE FUNCTION llm_app_property_title_search_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE llm_app_propertysummary
+    SET search_vector = llm_app_summary_search_vector(NEW.title, summary)
+    WHERE property_id = NEW.property_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_app_property_title_search
+AFTER UPDATE OF title ON properties_property
+FOR EACH ROW WHEN (OLD.title IS DISTINCT FROM NEW.title)
+EXECUTE FUNCTION llm_app_property_title_search_trigger();
+
+UPDATE llm_app_propertysummary AS summary
+SET search_vector = llm_app_summary_search_vector(property.title, summary.summary)
+FROM properties_property AS property
+WHERE property.property_id = summary.property_id;
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS llm_app_property_title_search ON properties_property;
+DROP TRIGGER IF EXISTS llm_app_propertysummary_search ON llm_app_propertysummary;
+DROP FUNCTION IF EXISTS llm_app_property_title_search_trigger();
+DROP FUNCTION IF EXISTS llm_app_propertysummary_search_trigger();
+DROP FUNCTION IF EXISTS llm_app_summary_search_vector(text, text);
+"""
+
+
+def create_search_vector(apps, schema_editor):
+    # Full-text search relies on Postgres, other databases (e.g. the SQLite test
+    # database of the benchmark) go without the triggers
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_VECTOR_SQL, params=None)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(DROP_SEARCH_VECTOR_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "llm_app",
+            "0005_generationcheckpoint_propertysummary_generated_date_and_more",
+        ),
+        ("properties", "0003_alter_amenity_name_alter_location_latitude_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="propertysummary",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_vector, drop_search_vector),
+        migrations.AddIndex(
+            model_name="propertysummary",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="propertysummary_search"
+            ),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("llm_app", "0006_propertysummary_search_vector"),
+        ("properties", "0003_alter_amenity_name_alter_location_latitude_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GenerationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[
+                            ("title", "Title"),
+                            ("description", "Description"),
+                            ("summary", "Summary"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("lease_expiry", models.DateTimeField(blank=True, null=True)),
+                ("worker", models.CharField(blank=True, default="", max_length=100)),
+                ("attempts", models.IntegerField(default=0)),
+                ("create_date", models.DateTimeField(auto_now_add=True)),
+                ("update_date", models.DateTimeField(auto_now=True)),
+                (
+                    "property",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="generation_jobs",
+                        to="properties.property",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Generation Job",
+                "verbose_name_plural": "Generation Jobs",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "lease_expiry"], name="generationjob_claim"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("property", "stage"),
+                        name="generationjob_property_stage",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,100 @@
+from django.db import migrations
+
+# Triggers sending the ID of every changed property on the llm_property_changed channel,
+# for `summary --daemon`. Postgres drops duplicate notifications within a transaction,
+# so bulk changes send each property once per transaction.
+NOTIFY_SQL = """
+CREATE FUNCTION llm_app_notify_property_trigger() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('llm_property_changed', NEW.property_id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_app_notify_property
+AFTER INSERT OR UPDATE OF title, description ON properties_property
+FOR EACH ROW EXECUTE FUNCTION llm_app_notify_property_trigger();
+
+CREATE FUNCTION llm_app_notify_property_link_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('llm_property_changed', OLD.property_id::text);
+    ELSE
+        PERFORM pg_notify('llm_property_changed', NEW.property_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_app_notify_property_locations
+AFTER INSERT OR DELETE ON properties_property_locations
+FOR EACH ROW EXECUTE FUNCTION llm_app_notify_property_link_trigger();
+
+CREATE TRIGGER llm_app_notify_property_amenities
+AFTER INSERT OR DELETE ON properties_property_amenities
+FOR EACH ROW EXECUTE FUNCTION llm_app_notify_property_link_trigger();
+
+CREATE FUNCTION llm_app_notify_location_trigger() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('llm_property_changed', property_id::text)
+    FROM properties_property_locations WHERE location_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_app_notify_location
+AFTER UPDATE ON properties_location
+FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION llm_app_notify_location_trigger();
+
+CREATE FUNCTION llm_app_notify_amenity_trigger() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('llm_property_changed', property_id::text)
+    FROM properties_property_amenities WHERE amenity_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_app_notify_amenity
+AFTER UPDATE ON properties_amenity
+FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION llm_app_notify_amenity_trigger();
+"""
+
+DROP_NOTIFY_SQL = """
+DROP TRIGGER IF EXISTS llm_app_notify_amenity ON properties_amenity;
+DROP TRIGGER IF EXISTS llm_app_notify_location ON properties_location;
+DROP TRIGGER IF EXISTS llm_app_notify_property_amenities ON properties_property_amenities;
+DROP TRIGGER IF EXISTS llm_app_notify_property_locations ON properties_property_locations;
+DROP TRIGGER IF EXISTS llm_app_notify_property ON properties_property;
+DROP FUNCTION IF EXISTS llm_app_notify_amenity_trigger();
+DROP FUNCTION IF EXISTS llm_app_notify_location_trigger();
+DROP FUNCTION IF EXISTS llm_app_notify_property_link_trigger();
+DROP FUNCTION IF EXISTS llm_app_notify_property_trigger();
+"""
+
+
+def create_notify_triggers(apps, schema_editor):
+    # LISTEN/NOTIFY is Postgres only, other databases (e.g. the SQLite test database of
+    # the benchmark) go without the triggers
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(NOTIFY_SQL, params=None)
+
+
+def drop_notify_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(DROP_NOTIFY_SQL, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("llm_app", "0007_generationjob"),
+        ("properties", "0003_alter_amenity_name_alter_location_latitude_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_notify_triggers, drop_notify_triggers),
+    ]
@@ -1,6 +1,11 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from properties.models import Property
 
+# Text search configuration of PropertySummary.search_vector, see migration 0006
+SEARCH_CONFIG = "english"
+
 
 class PropertySummary(models.Model):
     """
@@ -11,12 +16,106 @@ class PropertySummary(models.Model):
         Property, on_delete=models.CASCADE, related_name="summary"
     )
     summary = models.TextField()
+    # Hash of the property data the last complete generation ended with, and when it finished
+    input_fingerprint = models.CharField(max_length=64, blank=True, default="")
+    generated_date = models.DateTimeField(null=True, blank=True)
+    # Property title and summary for full-text search, maintained by database triggers
+    search_vector = SearchVectorField(null=True, editable=False)
     create_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Property Summary"
         verbose_name_plural = "Property Summaries"
+        indexes = [GinIndex(fields=["search_vector"], name="propertysummary_search")]
+
+    def __str__(self):
+        # property_id avoids a query for the related property on every call
+        return f"Summary for property {self.property_id}"
+
+
+class CachedGeneration(models.Model):
+    """
+    Model to store cached LLM generations, keyed by a hash of the model, prompt and options
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    response = models.TextField()
+    create_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Cached Generation"
+        verbose_name_plural = "Cached Generations"
+
+    def __str__(self):
+        return f"Cached {self.model} generation {self.key[:12]}"
+
+
+class GenerationCheckpoint(models.Model):
+    """
+    Model to store the last property processed by a generation run, used to resume it
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    last_property_id = models.IntegerField(null=True, blank=True)
+    create_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Generation Checkpoint"
+        verbose_name_plural = "Generation Checkpoints"
+
+    def __str__(self):
+        return f"Checkpoint {self.name} at property {self.last_property_id}"
+
+
+class GenerationJob(models.Model):
+    """
+    Model to store the generation queue: one job per property and stage, claimed by
+    workers with SELECT ... FOR UPDATE SKIP LOCKED, see llm_app.jobs
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    STAGE_CHOICES = [
+        ("title", "Title"),
+        ("description", "Description"),
+        ("summary", "Summary"),
+    ]
+
+    property = models.ForeignKey(
+        Property, on_delete=models.CASCADE, related_name="generation_jobs"
+    )
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Running jobs whose lease expired are claimed again, their worker is presumed dead
+    lease_expiry = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    attempts = models.IntegerField(default=0)
+    create_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Generation Job"
+        verbose_name_plural = "Generation Jobs"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["property", "stage"], name="generationjob_property_stage"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["status", "lease_expiry"], name="generationjob_claim")
+        ]
 
     def __str__(self):
-        return f"Summary for {self.property.title}"
+        return f"{self.stage} job for property {self.property_id} ({self.status})"
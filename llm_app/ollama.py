@@ -0,0 +1,460 @@
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from llm_app.endpoints import EndpointPool, get_endpoint_pool
+from llm_app.resilience import AdaptiveLimiter
+from llm_app.tracing import annotate, span
+
+
+def parse_keep_alive(keep_alive):
+    """
+    Converts a keep_alive setting into the value Ollama expects.
+    Plain numbers (e.g. "-1" to keep the model loaded forever) are sent as integers,
+    durations such as "10m" are sent unchanged.
+    """
+    if keep_alive is None or keep_alive == "":
+        return None
+
+    keep_alive = str(keep_alive).strip()
+    if keep_alive.lstrip("-").isdigit():
+        return int(keep_alive)
+    return keep_alive
+
+
+class BaseOllamaClient:
+    """
+    Holds the Ollama connection settings shared by the sync and async clients.
+    Every argument falls back to the matching OLLAMA_* setting when omitted.
+
+    Requests are routed over the process-wide EndpointPool (OLLAMA_URLS) unless a
+    `base_url` is given, in which case only that server is used.
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        model=None,
+        connect_timeout=None,
+        read_timeout=None,
+        keep_alive=None,
+        pool_size=None,
+        hedge_after=None,
+    ):
+        if base_url:
+            self.pool = EndpointPool([base_url], health_check_interval=0)
+        else:
+            self.pool = get_endpoint_pool()
+        self.model = model or settings.OLLAMA_MODEL
+        self.connect_timeout = connect_timeout or settings.OLLAMA_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or settings.OLLAMA_READ_TIMEOUT
+        self.keep_alive = parse_keep_alive(
+            keep_alive if keep_alive is not None else settings.OLLAMA_KEEP_ALIVE
+        )
+        self.pool_size = pool_size or settings.OLLAMA_POOL_SIZE
+        self.hedge_after = (
+            hedge_after if hedge_after is not None else settings.OLLAMA_HEDGE_AFTER
+        )
+
+    def build_payload(
+        self, prompt, model=None, options=None, format=None, context=None, images=None
+    ):
+        """
+        Builds the JSON body of a generate request.
+        `options` are passed through as Ollama model options (e.g. stop, num_predict),
+        `format` requests structured output ("json" or a JSON schema), `context` is the
+        context returned by a previous request, to continue that conversation, and
+        `images` are base64-encoded images for vision models.
+        """
+        payload = {"prompt": prompt, "model": model or self.model}
+        if images:
+            payload["images"] = images
+        if options:
+            payload["options"] = options
+        if format:
+            payload["format"] = format
+        if context:
+            payload["context"] = context
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def can_hedge(self):
+        return bool(self.hedge_after) and len(self.pool.endpoints) > 1
+
+
+class OllamaClient(BaseOllamaClient):
+    """
+    Client for the Ollama generate API backed by a keep-alive requests.Session.
+    Connections are pooled and reused across calls instead of being opened per request.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    @contextmanager
+    def generate(self, prompt, model=None, options=None, context=None, images=None):
+        """
+        Starts a streaming generation for the prompt.
+
+        Yields:
+            requests.Response: The streaming response. The connection is released when
+            the context exits, or closed if the stream was abandoned early.
+        """
+        payload = self.build_payload(
+            prompt, model, options, context=context, images=images
+        )
+        # Ollama sends the response headers along with the first token
+        with span("ollama.request", "ollama", model=payload["model"]):
+            endpoint, started, response = self.post(payload, stream=True)
+            annotate(endpoint=endpoint.url, status=response.status_code)
+        error = True
+        try:
+            with span("ollama.stream", "ollama"):
+                yield response
+            error = response.status_code != 200
+        finally:
+            response.close()
+            self.pool.release(endpoint, started, error)
+
+    def generate_structured(self, prompt, format, model=None, options=None):
+        """
+        Requests a complete (non-streamed) structured-output generation.
+
+        Returns:
+            requests.Response: The response, whose JSON body carries the generated
+            JSON document as a string in its "response" key.
+        """
+        payload = self.build_payload(prompt, model, options, format)
+        payload["stream"] = False
+        with span("ollama.request", "ollama", model=payload["model"]):
+            endpoint, started, response = self.post(payload, stream=False)
+            annotate(endpoint=endpoint.url, status=response.status_code)
+        self.pool.release(endpoint, started, response.status_code != 200)
+        return response
+
+    def warm_up(self, model=None):
+        """
+        Loads the model on every endpoint with an empty generate request, so that the
+        first generations do not wait for it. The model then stays loaded for keep_alive.
+
+        Returns:
+            list: (endpoint url, seconds taken or None if the request failed) pairs.
+        """
+        payload = {"model": model or self.model, "stream": False}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        results = []
+        for endpoint in self.pool.endpoints:
+            started = time.monotonic()
+            try:
+                response = self.send(endpoint, payload, stream=False)
+                elapsed = time.monotonic() - started
+                results.append(
+                    (endpoint.url, elapsed if response.status_code == 200 else None)
+                )
+            except requests.exceptions.RequestException:
+                results.append((endpoint.url, None))
+        return results
+
+    def embed(self, inputs, model=None):
+        """
+        Computes embeddings of the input texts with the Ollama embed API.
+
+        Returns:
+            requests.Response: The response, whose JSON body carries one vector per
+            input in its "embeddings" key.
+        """
+        payload = {"model": model or settings.OLLAMA_EMBED_MODEL, "input": inputs}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        endpoint, started, response = self.post(
+            payload, stream=False, path="/api/embed"
+        )
+        self.pool.release(endpoint, started, response.status_code != 200)
+        return response
+
+    def send(self, endpoint, payload, stream, path="/api/generate"):
+        return self.session.post(
+            f"{endpoint.url}{path}",
+            json=payload,
+            timeout=(self.connect_timeout, self.read_timeout),
+            stream=stream,
+        )
+
+    def post(self, payload, stream, path="/api/generate"):
+        """
+        Sends a request (a generation by default) to the least loaded endpoint. With hedging enabled, a
+        request that got no response within `hedge_after` seconds is also sent to another
+        endpoint and the first response wins.
+
+        Returns:
+            tuple: The endpoint, the start time and the response. The caller releases
+            the endpoint once it is done with the response.
+        """
+        # Requests are held back while the circuit breaker is open
+        probe = self.pool.breaker.wait()
+        endpoint = self.pool.acquire()
+        started = time.monotonic()
+        if probe:
+            self.pool.breaker.start_probe(started)
+
+        if not self.can_hedge():
+            try:
+                return endpoint, started, self.send(endpoint, payload, stream, path)
+            except requests.exceptions.RequestException:
+                self.pool.release(endpoint, started, error=True)
+                raise
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.pool_size)
+
+        attempts = {
+            self.executor.submit(self.send, endpoint, payload, stream, path): (
+                endpoint,
+                started,
+            )
+        }
+        done, _ = wait(attempts, timeout=self.hedge_after)
+        if not done:
+            hedge = self.pool.acquire(exclude=endpoint)
+            if hedge is not None:
+                print(f"Hedging slow request to {endpoint.url} on {hedge.url}.")
+                attempts[
+                    self.executor.submit(self.send, hedge, payload, stream, path)
+                ] = (
+                    hedge,
+                    time.monotonic(),
+                )
+
+        pending = set(attempts)
+        winner = None
+        failure = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    failure = future.exception()
+                    self.pool.release(*attempts[future], error=True)
+                elif winner is None:
+                    winner = future
+                else:
+                    future.result().close()
+                    self.pool.release(*attempts[future])
+
+        # The slower attempt is closed and released whenever it completes
+        for future in pending:
+            future.add_done_callback(partial(self.discard, *attempts[future]))
+
+        if winner is None:
+            raise failure
+        return (*attempts[winner], winner.result())
+
+    def discard(self, endpoint, started, future):
+        if future.exception() is not None:
+            self.pool.release(endpoint, started, error=True)
+        else:
+            future.result().close()
+            self.pool.release(endpoint, started)
+
+
+class AsyncOllamaClient(BaseOllamaClient):
+    """
+    Asynchronous client for the Ollama generate API.
+    Keeps a pool of connections open so that several generations can be in flight at once.
+
+    With `adaptive` concurrency (OLLAMA_ADAPTIVE_CONCURRENCY by default), the number of
+    generations in flight is limited by an AdaptiveLimiter between 1 and the pool size,
+    following the time the server takes to start responding.
+    """
+
+    def __init__(self, adaptive=None, **kwargs):
+        super().__init__(**kwargs)
+        if adaptive is None:
+            adaptive = settings.OLLAMA_ADAPTIVE_CONCURRENCY
+        self.limiter = (
+            AdaptiveLimiter(self.pool_size, tolerance=settings.OLLAMA_LATENCY_TOLERANCE)
+            if adaptive
+            else None
+        )
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+            ),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    @asynccontextmanager
+    async def stream(self, prompt, model=None, options=None, context=None, images=None):
+        """
+        Starts a streaming generation for the prompt.
+
+        Yields:
+            httpx.Response: The streaming response. Leaving the context before the stream
+            is exhausted closes the connection, which makes Ollama stop generating.
+        """
+        await self.acquire_slot()
+        latency = None
+        error = True
+        try:
+            payload = self.build_payload(
+                prompt, model, options, context=context, images=images
+            )
+            with span("ollama.request", "ollama", model=payload["model"]):
+                endpoint, started, response = await self.post(payload, stream=True)
+                annotate(endpoint=endpoint.url, status=response.status_code)
+            # Ollama starts responding once the request left its queue
+            latency = time.monotonic() - started
+            try:
+                with span("ollama.stream", "ollama"):
+                    yield response
+                error = response.status_code != 200
+            finally:
+                await response.aclose()
+                self.pool.release(endpoint, started, error)
+        finally:
+            self.release_slot(latency, error)
+
+    async def generate_structured(self, prompt, format, model=None, options=None):
+        """
+        Async counterpart of OllamaClient.generate_structured.
+
+        Returns:
+            httpx.Response: The complete response.
+        """
+        payload = self.build_payload(prompt, model, options, format)
+        payload["stream"] = False
+        await self.acquire_slot()
+        error = True
+        try:
+            with span("ollama.request", "ollama", model=payload["model"]):
+                endpoint, started, response = await self.post(payload, stream=False)
+                annotate(endpoint=endpoint.url, status=response.status_code)
+            error = response.status_code != 200
+            self.pool.release(endpoint, started, error)
+            return response
+        finally:
+            # Complete responses include the generation, so only failures are fed back
+            self.release_slot(None, error)
+
+    async def acquire_slot(self):
+        if self.limiter is not None:
+            await self.limiter.acquire()
+
+    def release_slot(self, latency, error):
+        if self.limiter is not None:
+            self.limiter.release(latency, error)
+
+    async def send(self, endpoint, payload, stream):
+        request = self.client.build_request(
+            "POST", f"{endpoint.url}/api/generate", json=payload
+        )
+        return await self.client.send(request, stream=stream)
+
+    async def post(self, payload, stream):
+        """
+        Async counterpart of OllamaClient.post. The slower attempt of a hedged request
+        is cancelled as soon as the other one responds.
+        """
+        probe = await self.pool.breaker.await_closed()
+        endpoint = self.pool.acquire()
+        started = time.monotonic()
+        if probe:
+            self.pool.breaker.start_probe(started)
+
+        if not self.can_hedge():
+            try:
+                return endpoint, started, await self.send(endpoint, payload, stream)
+            except httpx.HTTPError:
+                self.pool.release(endpoint, started, error=True)
+                raise
+
+        attempts = {
+            asyncio.create_task(self.send(endpoint, payload, stream)): (
+                endpoint,
+                started,
+            )
+        }
+        done, _ = await asyncio.wait(attempts, timeout=self.hedge_after)
+        if not done:
+            hedge = self.pool.acquire(exclude=endpoint)
+            if hedge is not None:
+                print(f"Hedging slow request to {endpoint.url} on {hedge.url}.")
+                attempts[asyncio.create_task(self.send(hedge, payload, stream))] = (
+                    hedge,
+                    time.monotonic(),
+                )
+
+        pending = set(attempts)
+        winner = None
+        failure = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    failure = task.exception()
+                    self.pool.release(*attempts[task], error=True)
+                elif winner is None:
+                    winner = task
+                else:
+                    await task.result().aclose()
+                    self.pool.release(*attempts[task])
+
+        for task in pending:
+            task.cancel()
+            self.pool.release(*attempts[task])
+
+        if winner is None:
+            raise failure
+        return (*attempts[winner], winner.result())
+
+
+_client = None
+
+
+def get_ollama_client():
+    """
+    Returns the process-wide OllamaClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        _client = OllamaClient()
+    return _client
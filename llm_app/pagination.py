@@ -0,0 +1,45 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the planner's row estimate of the table instead of COUNT(*) for
+    unfiltered querysets on large tables. Counting every row of a big table on each page
+    load is slow in Postgres, while the estimate from the last ANALYZE is read instantly.
+    Filtered querysets and small tables are counted exactly.
+    """
+
+    # Tables estimated to have fewer rows are counted exactly
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = self.estimate_rows(self.object_list)
+            if estimate is not None and estimate >= self.exact_count_threshold:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def estimate_rows(queryset):
+        """
+        Returns the row estimate of the queryset's table, or None if it is unknown.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+
+        # reltuples is -1 for tables that were never analyzed
+        if row is None or row[0] < 0:
+            return None
+        return int(row[0])
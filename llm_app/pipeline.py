@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from llm_app.tracing import span
+
+# Marks the end of the items of a queue
+DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: `workers` tasks apply the async `handler` to the items of the
+    stage, one item each at a time. The handler returns the item for the next stage, or
+    None to drop it.
+    """
+
+    def __init__(self, name, handler, workers=1):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.processed = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+
+    async def worker(self, input_queue, output_queue):
+        while True:
+            item = await input_queue.get()
+            if item is DONE:
+                # Put the marker back for the other workers of the stage
+                await input_queue.put(DONE)
+                return
+
+            started = time.monotonic()
+            with span(self.name, "pipeline"):
+                item = await self.handler(item)
+            self.busy += time.monotonic() - started
+            self.processed += 1
+
+            if item is not None and output_queue is not None:
+                await output_queue.put(item)
+
+    async def run(self, input_queue, output_queue):
+        self.started = time.monotonic()
+        await asyncio.gather(
+            *(self.worker(input_queue, output_queue) for _ in range(self.workers))
+        )
+        self.finished = time.monotonic()
+        if output_queue is not None:
+            await output_queue.put(DONE)
+
+    def stats(self):
+        """
+        Returns the number of processed items and the average number of busy workers.
+        """
+        elapsed = (self.finished or time.monotonic()) - (self.started or 0)
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "busy_workers": self.busy / elapsed if self.started and elapsed else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages connected by bounded queues.
+
+    Every stage works on different items at the same time, e.g. the summary of one
+    property is generated while the title of the next one is, and items go through the
+    stages in order. When a stage falls behind, the queue in front of it fills up and the
+    stages before it wait, so at most `queue_size` items are buffered between two stages.
+    """
+
+    def __init__(self, stages, queue_size=16):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    async def run(self, items):
+        """
+        Feeds the items of an async iterable through the stages and returns once every
+        item went through all of them. If a stage raises, the other stages are
+        cancelled and the exception is raised.
+        """
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        tasks = [asyncio.create_task(self.feed(items, queues[0]))]
+        for index, stage in enumerate(self.stages):
+            output_queue = queues[index + 1] if index + 1 < len(queues) else None
+            tasks.append(asyncio.create_task(stage.run(queues[index], output_queue)))
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def feed(items, queue):
+        async for item in items:
+            await queue.put(item)
+        await queue.put(DONE)
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
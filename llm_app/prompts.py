@@ -0,0 +1,367 @@
+import math
+import re
+
+from django.conf import settings
+
+from llm_app.metrics import get_metrics
+
+# Upper bounds (estimated tokens) of the prompt size histogram buckets
+PROMPT_TOKEN_BUCKETS = (64, 128, 256, 384, 512, 768, 1024, 2048, 4096)
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Location types ranked by how much they say about a property, other types (e.g. nearby
+# landmarks) follow in their stored order
+LOCATION_TYPE_RANKS = {"city": 0, "state": 1, "country": 2}
+
+# Amenities most properties have, listed after the ones that set a property apart
+COMMON_AMENITIES = {
+    "wifi",
+    "free wifi",
+    "internet",
+    "parking",
+    "free parking",
+    "air conditioning",
+    "heating",
+    "tv",
+    "elevator",
+    "lift",
+    "24-hour front desk",
+    "daily housekeeping",
+    "non-smoking rooms",
+    "luggage storage",
+}
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of a text without a tokenizer: one per punctuation
+    mark and per started four characters of a word. Errs on the high side for common
+    English words.
+    """
+    return sum(math.ceil(len(token) / 4) for token in TOKEN_PATTERN.findall(text or ""))
+
+
+def normalize_space(text):
+    return " ".join(str(text or "").split())
+
+
+def rank_locations(locations):
+    """
+    Returns the (name, type) pairs of the locations without coordinates or duplicate
+    names, ranked by LOCATION_TYPE_RANKS.
+    """
+    ranked = sorted(
+        locations,
+        key=lambda location: LOCATION_TYPE_RANKS.get(
+            normalize_space(location.get("type")).casefold(), len(LOCATION_TYPE_RANKS)
+        ),
+    )
+    seen = set()
+    pairs = []
+    for location in ranked:
+        name = normalize_space(location.get("name"))
+        if name and name.casefold() not in seen:
+            seen.add(name.casefold())
+            pairs.append((name, normalize_space(location.get("type"))))
+    return pairs
+
+
+def rank_amenities(amenities):
+    """
+    Returns the amenities without duplicates, common ones last.
+    """
+    seen = set()
+    names = []
+    for amenity in amenities:
+        name = normalize_space(amenity)
+        if name and name.casefold() not in seen:
+            seen.add(name.casefold())
+            names.append(name)
+    return sorted(names, key=lambda name: name.casefold() in COMMON_AMENITIES)
+
+
+def format_locations(pairs):
+    """
+    Formats (name, type) pairs grouped by type, e.g. "Dhaka (city); Bangladesh (country)".
+    """
+    groups = {}
+    for name, location_type in pairs:
+        groups.setdefault(location_type, []).append(name)
+    return "; ".join(
+        f"{', '.join(names)} ({location_type})" if location_type else ", ".join(names)
+        for location_type, names in groups.items()
+    )
+
+
+def format_details(title, description, locations, amenities):
+    lines = [f"Title: {title}"]
+    if description:
+        lines.append(f"Description: {description}")
+    if locations:
+        lines.append(f"Location: {format_locations(locations)}")
+    if amenities:
+        lines.append(f"Amenities: {', '.join(amenities)}")
+    return "\n".join(lines)
+
+
+def truncate_words(text, tokens):
+    """
+    Drops words from the end of the text until about `tokens` fewer tokens remain.
+    """
+    words = text.split()
+    while words and tokens > 0:
+        tokens -= estimate_tokens(words.pop())
+    return " ".join(words) + "..." if words else ""
+
+
+def render_details(property_info, budget=None):
+    """
+    Renders title, description, locations and amenities of a property as compact lines.
+
+    Locations and amenities are deduplicated, ranked and capped at
+    LLM_PROMPT_MAX_LOCATIONS and LLM_PROMPT_MAX_AMENITIES. When the lines exceed `budget`
+    tokens, the description is shortened to half of the budget, then the lowest ranked
+    locations and amenities are dropped, keeping at least one of each, and finally the
+    description is shortened further.
+    """
+    title = normalize_space(property_info.get("title"))
+    description = normalize_space(property_info.get("description"))
+    locations = rank_locations(property_info.get("locations") or [])
+    locations = locations[: settings.LLM_PROMPT_MAX_LOCATIONS]
+    amenities = rank_amenities(property_info.get("amenities") or [])
+    amenities = amenities[: settings.LLM_PROMPT_MAX_AMENITIES]
+
+    details = format_details(title, description, locations, amenities)
+    if budget is None or estimate_tokens(details) <= budget:
+        return details
+
+    excess = estimate_tokens(description) - budget // 2
+    if excess > 0:
+        description = truncate_words(description, excess)
+        details = format_details(title, description, locations, amenities)
+
+    while estimate_tokens(details) > budget and max(len(locations), len(amenities)) > 1:
+        if len(locations) >= len(amenities):
+            locations = locations[:-1]
+        else:
+            amenities = amenities[:-1]
+        details = format_details(title, description, locations, amenities)
+
+    excess = estimate_tokens(details) - budget
+    if excess > 0 and description:
+        description = truncate_words(description, excess)
+        details = format_details(title, description, locations, amenities)
+    return details
+
+
+def render_raw_details(property_info):
+    """
+    Renders the property details as the prompts did before they were compacted, to
+    measure the savings.
+    """
+    return (
+        f"Title: {property_info.get('title')}\n"
+        f"Description: {property_info.get('description')}\n"
+        f"Location: {property_info.get('locations')}\n"
+        f"Amenities: {property_info.get('amenities')}"
+    )
+
+
+class PromptTemplate:
+    """
+    The prompt of one stage: fixed instructions around the title or the property
+    details. The instructions are assembled and their tokens counted once, when the
+    module is loaded.
+
+    Every rendered prompt is recorded in the llm_prompt_tokens histogram of its metrics
+    stage, and prompts with property details also record the tokens saved compared to
+    the raw details in llm_prompt_saved_tokens_total.
+    """
+
+    def __init__(self, budget_key, metrics_stage, text):
+        self.budget_key = budget_key
+        self.metrics_stage = metrics_stage
+        self.text = text
+        self.with_details = "{details}" in text
+        self.base_tokens = estimate_tokens(text.format(title="", details=""))
+
+    def render(self, property_info=None):
+        property_info = property_info or {}
+        saved = 0
+        details = ""
+        if self.with_details:
+            budget = settings.LLM_PROMPT_TOKEN_BUDGETS.get(self.budget_key)
+            details = render_details(
+                property_info, budget - self.base_tokens if budget else None
+            )
+            saved = estimate_tokens(render_raw_details(property_info)) - (
+                estimate_tokens(details)
+            )
+
+        prompt = self.text.format(title=property_info.get("title"), details=details)
+
+        metrics = get_metrics()
+        metrics.observe(
+            "llm_prompt_tokens",
+            estimate_tokens(prompt),
+            buckets=PROMPT_TOKEN_BUCKETS,
+            stage=self.metrics_stage,
+        )
+        if saved > 0:
+            metrics.inc(
+                "llm_prompt_saved_tokens_total", saved, stage=self.metrics_stage
+            )
+        return prompt
+
+
+TITLE_PROMPT = PromptTemplate(
+    "title",
+    "title",
+    "Please rewrite the following property title to make it more attractive and readable while "
+    "preserving its original meaning. Ensure that the title reflects the nature and identity of "
+    "the property, but do not simply return the original title. Rephrase the title creatively while "
+    "keeping the key elements like the hotel name and location intact. Avoid changing the property "
+    "type or location information. Make sure the title is free of any extra symbols or punctuation.\n\n"
+    "Title: {title}\n\nGive only one new title and in the following format only:\nTitle: generated_title",
+)
+
+DESCRIPTION_PROMPT = PromptTemplate(
+    "description",
+    "description",
+    "Write a concise, compelling description for the following hotel property. "
+    "Preserve the originality and identity of the hotel, but creatively rephrase it "
+    "to highlight its unique features. The description should be brief, around 2-3 sentences, "
+    "and make the hotel appealing to potential guests. Ensure that the description is free of any "
+    "extra symbols or punctuation. Give only one new description and in the following format only::\n\n"
+    "Description: generated_description\n\nTitle: {title}",
+)
+
+IMAGE_DESCRIPTION_PROMPT = PromptTemplate(
+    "description",
+    "description",
+    "Write a concise, compelling description for the hotel property with the following title, "
+    "shown in the attached photos. Preserve the originality and identity of the hotel, and use "
+    "what the photos show, such as the rooms, views and facilities, to highlight its unique features. "
+    "The description should be brief, around 2-3 sentences, and make the hotel appealing to potential "
+    "guests. Only mention what the title or the photos show. Ensure that the description is free of "
+    "any extra symbols or punctuation. Give only one new description and in the following format only:\n\n"
+    "Description: generated_description\n\nTitle: {title}",
+)
+
+SUMMARY_PROMPT = PromptTemplate(
+    "summary",
+    "summary",
+    "Generate a concise, engaging summary for the following hotel property. "
+    "Use the provided information to highlight the key features, atmosphere, and appeal of the property. "
+    "The summary should be around 2-3 sentences and make the property stand out to potential guests. "
+    "Ensure that the summary is free of any extra symbols or punctuation. Give only one summary and in the following format only:\n\n"
+    "Summary: generated_summary\n\n"
+    "{details}",
+)
+
+CONTENT_PROMPT = PromptTemplate(
+    "content",
+    "content",
+    "Rewrite the title, and write a description and a summary for the following hotel property. "
+    "The title should be more attractive and readable while preserving its original meaning, keeping "
+    "key elements like the hotel name, property type and location intact. The description should be "
+    "concise and compelling, around 2-3 sentences, and highlight the unique features of the hotel. "
+    "The summary should be concise and engaging, around 2-3 sentences, and use the provided information "
+    "to highlight the key features, atmosphere, and appeal of the property. Ensure that all texts are "
+    "free of any extra symbols or punctuation. Respond with a JSON object with the keys "
+    "title, description and summary.\n\n"
+    "{details}",
+)
+
+# The session requests are recorded under the stage of the field they generate
+SESSION_TITLE_PROMPT = PromptTemplate(
+    "session",
+    "title",
+    "You will write content for the following hotel property, one step at a time.\n\n"
+    "{details}\n\n"
+    "First, rewrite the title of the property to make it more attractive and readable while "
+    "preserving its original meaning. Rephrase the title creatively while keeping the key elements "
+    "like the hotel name and location intact, and do not simply return the original title. Avoid "
+    "changing the property type or location information. Make sure the title is free of any extra "
+    "symbols or punctuation.\n\nGive only one new title and in the following format only:\n"
+    "Title: generated_title",
+)
+
+SESSION_DESCRIPTION_PROMPT = PromptTemplate(
+    "session",
+    "description",
+    "Next, write a concise, compelling description of the property based on your new title. "
+    "Preserve the originality and identity of the hotel, but creatively rephrase it to highlight "
+    "its unique features. The description should be brief, around 2-3 sentences, and make the hotel "
+    "appealing to potential guests. Ensure that the description is free of any extra symbols or "
+    "punctuation. Give only one new description and in the following format only:\n\n"
+    "Description: generated_description",
+)
+
+SESSION_SUMMARY_PROMPT = PromptTemplate(
+    "session",
+    "summary",
+    "Finally, generate a concise, engaging summary of the property from your new title and "
+    "description and the information above. Highlight the key features, atmosphere, and appeal of "
+    "the property. The summary should be around 2-3 sentences and make the property stand out to "
+    "potential guests. Ensure that the summary is free of any extra symbols or punctuation. Give only "
+    "one summary and in the following format only:\n\n"
+    "Summary: generated_summary",
+)
+
+
+def build_title_prompt(property_info):
+    """
+    Builds the prompt used to rewrite the title of a property.
+    """
+    return TITLE_PROMPT.render(property_info)
+
+
+def build_description_prompt(property_info):
+    """
+    Builds the prompt used to write the description of a property from its title, and
+    from its photos when prepared ones are attached under "images".
+    """
+    if property_info.get("images"):
+        return IMAGE_DESCRIPTION_PROMPT.render(property_info)
+    return DESCRIPTION_PROMPT.render(property_info)
+
+
+def build_summary_prompt(property_info):
+    """
+    Builds the prompt used to generate the summary of a property from its title,
+    description, locations and amenities.
+    """
+    return SUMMARY_PROMPT.render(property_info)
+
+
+def build_content_prompt(property_info):
+    """
+    Builds the prompt used to generate title, description and summary of a property in a
+    single structured-output request.
+    """
+    return CONTENT_PROMPT.render(property_info)
+
+
+def build_session_title_prompt(property_info):
+    """
+    Builds the first prompt of a session: the property information, followed by the
+    title instructions. The description and summary prompts of the session continue the
+    conversation, so the information is only evaluated once.
+    """
+    return SESSION_TITLE_PROMPT.render(property_info)
+
+
+def build_session_description_prompt():
+    """
+    Builds the second prompt of a session, continuing after the new title.
+    """
+    return SESSION_DESCRIPTION_PROMPT.render()
+
+
+def build_session_summary_prompt():
+    """
+    Builds the last prompt of a session, continuing after the new description.
+    """
+    return SESSION_SUMMARY_PROMPT.render()
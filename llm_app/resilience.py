@@ -0,0 +1,341 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Returns the seconds to wait before retry number `attempt` (1 for the first retry):
+    exponential backoff with full jitter, so that requests failing together do not all
+    come back at the same time.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Pauses all Ollama requests while too many of them fail.
+
+    The breaker opens when at least `min_requests` requests completed in the last
+    `window` seconds and `threshold` of them failed. New requests then wait `cooldown`
+    seconds, after which a single probe request is let through: the breaker closes if it
+    succeeds and opens again if it fails. Requests that were already in flight do not
+    count as the probe, which is identified by its start time (see start_probe). A probe
+    whose outcome is not recorded within `window` seconds is replaced by a new one.
+    """
+
+    def __init__(self, threshold=0.5, window=30, min_requests=10, cooldown=10):
+        self.threshold = threshold
+        self.window = window
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        # (completion time, failed) of the requests of the window
+        self.outcomes = deque()
+        self.state = "closed"
+        self.opened_at = None
+        # When the probe was let through and when it was sent, while half open
+        self.probe_admitted_at = None
+        self.probe_started = None
+        self.opened = 0
+
+    def record(self, error, started=None):
+        """
+        Records the outcome of a completed request sent at `started` (time.monotonic()).
+        While half open, only the outcome of the probe is taken into account.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.state == "half_open":
+                if started is None or started != self.probe_started:
+                    return
+                self.probe_admitted_at = self.probe_started = None
+                if error:
+                    self.open(now)
+                else:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                    print("Circuit breaker closed, resuming Ollama requests.")
+                return
+
+            self.outcomes.append((now, error))
+            while self.outcomes and self.outcomes[0][0] < now - self.window:
+                self.outcomes.popleft()
+
+            if self.state == "closed" and len(self.outcomes) >= self.min_requests:
+                errors = sum(failed for _, failed in self.outcomes)
+                if errors >= self.threshold * len(self.outcomes):
+                    print(
+                        f"Circuit breaker opened: {errors} of the last "
+                        f"{len(self.outcomes)} Ollama requests failed."
+                    )
+                    self.open(now)
+
+    def open(self, now):
+        self.state = "open"
+        self.opened_at = now
+        self.opened += 1
+        self.outcomes.clear()
+
+    def delay(self):
+        """
+        Returns 0 if a request may be sent now, otherwise the seconds to wait before
+        asking again, and whether the request is let through as the probe.
+        """
+        with self.lock:
+            if self.state == "closed":
+                return 0, False
+
+            now = time.monotonic()
+            if self.state == "open":
+                remaining = self.opened_at + self.cooldown - now
+                if remaining > 0:
+                    return remaining, False
+                self.state = "half_open"
+
+            if (
+                self.probe_admitted_at is not None
+                and now < self.probe_admitted_at + self.window
+            ):
+                return min(1.0, self.cooldown), False
+            self.probe_admitted_at = now
+            self.probe_started = None
+            return 0, True
+
+    def start_probe(self, started):
+        """
+        Identifies the request let through as the probe by the time it was sent.
+        """
+        with self.lock:
+            if self.state == "half_open":
+                self.probe_started = started
+
+    def wait(self):
+        """
+        Waits until a request may be sent. Returns True if it is sent as the probe, in
+        which case the caller passes its start time to start_probe.
+        """
+        delay, probe = self.delay()
+        while delay:
+            time.sleep(delay)
+            delay, probe = self.delay()
+        return probe
+
+    async def await_closed(self):
+        """
+        Async counterpart of wait.
+        """
+        delay, probe = self.delay()
+        while delay:
+            await asyncio.sleep(delay)
+            delay, probe = self.delay()
+        return probe
+
+    def stats(self):
+        with self.lock:
+            return {"state": self.state, "opened": self.opened}
+
+
+class RetryPolicy:
+    """
+    Backoff and retry budget shared by the generation retry loops of a run.
+
+    Retries wait with exponential backoff and jitter, and are only allowed while they
+    stay within `budget_ratio` of the first attempts plus `budget_minimum`, so that an
+    overloaded server is not sent several times its normal load.
+    """
+
+    def __init__(
+        self, base_delay=0.5, max_delay=30, budget_ratio=0.2, budget_minimum=10
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_minimum = budget_minimum
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Starts a new run with a full retry budget.
+        """
+        with self.lock:
+            self.requests = 0
+            self.retries = 0
+            self.denied = 0
+
+    def next_delay(self, attempt):
+        """
+        Counts an attempt and returns the seconds to wait before sending it, or None if
+        it is a retry and the budget is spent.
+        """
+        with self.lock:
+            if not attempt:
+                self.requests += 1
+                return 0
+
+            if self.retries >= self.budget_ratio * self.requests + self.budget_minimum:
+                if not self.denied:
+                    print("Retry budget exhausted, failed requests are not retried.")
+                self.denied += 1
+                return None
+
+            self.retries += 1
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def backoff(self, attempt):
+        """
+        Waits before an attempt. Returns False if the attempt must not be made.
+        """
+        delay = self.next_delay(attempt)
+        if delay:
+            time.sleep(delay)
+        return delay is not None
+
+    async def abackoff(self, attempt):
+        """
+        Async counterpart of backoff.
+        """
+        delay = self.next_delay(attempt)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay is not None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "denied": self.denied,
+            }
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of requests in flight with AIMD (additive increase, multiplicative
+    decrease), for use within one event loop.
+
+    Ollama queues the requests it cannot run in parallel, which shows as a longer time
+    to first byte. The limit starts at `minimum` and doubles every window of successful
+    requests until the first cut (slow start), then grows by one per window. It is cut by
+    `decrease_ratio` when a request fails or the smoothed latency exceeds `tolerance`
+    times its baseline, at most once per window so that one burst of slow requests does
+    not collapse it.
+
+    The baseline is the lowest smoothed latency seen. At the minimum limit nothing is
+    queued, so the baseline is reset there, which lets it follow a lasting slowdown
+    (e.g. a larger model).
+    """
+
+    def __init__(
+        self,
+        maximum,
+        minimum=1,
+        tolerance=2.0,
+        decrease_ratio=0.75,
+        smoothing=0.1,
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(minimum)
+        self.slow_start = True
+        self.tolerance = tolerance
+        self.decrease_ratio = decrease_ratio
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.waiters = deque()
+        self.average = None
+        self.baseline = None
+        self.since_decrease = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        """
+        Waits until a request may be sent.
+        """
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                else:
+                    self.wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency=None, error=False):
+        """
+        Ends a request and adjusts the limit.
+
+        Args:
+            latency (float): Seconds until the response started, None if unknown.
+            error (bool): Whether the request failed or timed out.
+        """
+        self.in_flight -= 1
+        self.since_decrease += 1
+
+        overloaded = error
+        if latency is not None and not error:
+            if self.average is None:
+                self.average = latency
+            else:
+                self.average += self.smoothing * (latency - self.average)
+
+            if self.baseline is None or self.limit <= self.minimum:
+                self.baseline = self.average
+            self.baseline = min(self.baseline, self.average)
+            overloaded = self.average > self.tolerance * self.baseline
+
+        if overloaded:
+            if self.since_decrease >= self.limit:
+                self.limit = max(self.minimum, self.limit * self.decrease_ratio)
+                self.since_decrease = 0
+                self.decreases += 1
+                self.slow_start = False
+        else:
+            increase = 1 if self.slow_start else 1 / self.limit
+            self.limit = min(self.maximum, self.limit + increase)
+
+        self.wake()
+
+    def wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "maximum": self.maximum,
+            "decreases": self.decreases,
+            "baseline_latency": self.baseline,
+        }
+
+
+_policy = None
+
+
+def get_retry_policy():
+    """
+    Returns the process-wide RetryPolicy built from the OLLAMA_RETRY_* settings,
+    creating it on first use.
+    """
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy(
+            base_delay=settings.OLLAMA_RETRY_BASE_DELAY,
+            max_delay=settings.OLLAMA_RETRY_MAX_DELAY,
+            budget_ratio=settings.OLLAMA_RETRY_BUDGET,
+            budget_minimum=settings.OLLAMA_RETRY_BUDGET_MINIMUM,
+        )
+    return _policy
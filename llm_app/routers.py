@@ -0,0 +1,56 @@
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Database alias of the read replica, used when it is configured
+REPLICA = "replica"
+
+# Apps whose tables are owned by property-manager-django, read from the replica
+REPLICA_APPS = {"properties"}
+
+# time.monotonic() until which the reads of the current thread or task go to the primary
+_pinned_until = ContextVar("pinned_until", default=0.0)
+
+
+def pin_to_primary(seconds=None):
+    """
+    Sends the reads of the current thread or task to the primary for `seconds`, by
+    default LLM_DB_REPLICA_PIN, so that they see the writes made just before.
+    """
+    if seconds is None:
+        seconds = settings.LLM_DB_REPLICA_PIN
+    _pinned_until.set(max(_pinned_until.get(), time.monotonic() + seconds))
+
+
+class ReplicaRouter:
+    """
+    Routes reads of the property tables to the read replica, when one is configured,
+    so that generation runs do not compete with property-manager-django for the primary.
+    Everything else, including all writes, goes to the primary.
+
+    Replicas lag behind the primary, so after a write to the property tables the reads
+    of the same thread or task stay on the primary for LLM_DB_REPLICA_PIN seconds.
+    Writes to the app's own tables (cache, checkpoints, jobs) do not pin.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.app_label in REPLICA_APPS
+            and REPLICA in settings.DATABASES
+            and time.monotonic() >= _pinned_until.get()
+        ):
+            return REPLICA
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in REPLICA_APPS:
+            pin_to_primary()
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
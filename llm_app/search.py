@@ -0,0 +1,42 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F
+
+from llm_app.models import SEARCH_CONFIG, PropertySummary
+
+
+def build_search_query(text):
+    """
+    Parses user input with web search syntax: quoted phrases, "or" and -exclusions.
+    """
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+
+
+def search_summaries(text, limit=20, offset=0):
+    """
+    Searches property titles and summaries with the full-text index.
+
+    Returns:
+        list: Matching summaries as dictionaries, best matches first, with a highlighted
+        excerpt of the summary.
+    """
+    query = build_search_query(text)
+    results = (
+        PropertySummary.objects.filter(search_vector=query)
+        .annotate(
+            rank=SearchRank(F("search_vector"), query),
+            headline=SearchHeadline("summary", query, config=SEARCH_CONFIG),
+        )
+        .order_by("-rank", "property_id")
+        .values("property_id", "property__title", "summary", "headline", "rank")
+    )[offset : offset + limit]
+
+    return [
+        {
+            "property_id": result["property_id"],
+            "title": result["property__title"],
+            "summary": result["summary"],
+            "headline": result["headline"],
+            "rank": result["rank"],
+        }
+        for result in results
+    ]
@@ -1,12 +1,140 @@
+import hashlib
 import json
+import time
 
 import requests
-from django.db import transaction
-from properties.models import Property
+from django.conf import settings
+from django.utils import timezone
+from properties.models import Property, PropertyImage
 
+from llm_app.cache import get_generation_cache
+from llm_app.metrics import get_metrics, record_generation
 from llm_app.models import PropertySummary
+from llm_app.ollama import get_ollama_client
+from llm_app.prompts import (
+    build_content_prompt,
+    build_description_prompt,
+    build_session_description_prompt,
+    build_session_summary_prompt,
+    build_session_title_prompt,
+    build_summary_prompt,
+    build_title_prompt,
+)
+from llm_app.resilience import get_retry_policy
+from llm_app.stage_models import get_stage_model
+from llm_app.tracing import annotate, span, traced
 
 
+def build_property_info(property_obj):
+    """
+    Collects the information used for generation from a Property instance.
+    Uses the prefetched locations and amenities when they are available.
+    """
+    return {
+        "id": property_obj.property_id,
+        "title": property_obj.title,
+        "description": property_obj.description,
+        "locations": [
+            {
+                "name": location.name,
+                "type": location.type,
+                "latitude": location.latitude,
+                "longitude": location.longitude,
+            }
+            for location in property_obj.locations.all()
+        ],
+        "amenities": [amenity.name for amenity in property_obj.amenities.all()],
+        "create_date": property_obj.create_date,
+        "update_date": property_obj.update_date,
+    }
+
+
+def iter_property_info_chunks(
+    properties=None, chunk_size=500, limit=None, images=False
+):
+    """
+    Loads property information in chunks of at most `chunk_size` properties.
+
+    Properties are paginated by property_id (keyset pagination), their locations and
+    amenities are prefetched and the fingerprints of their last generations are loaded
+    for needs_generation, so each chunk costs four queries no matter how large the table
+    is and only one chunk of model instances is held in memory at a time.
+
+    Args:
+        properties (QuerySet): Properties to load, all properties by default.
+        chunk_size (int): Number of properties loaded per chunk.
+        limit (int): Maximum number of properties to load.
+        images (bool): Whether to also load the file names of the photos of each
+            property, in upload order, under "image_names" (one more query per chunk).
+
+    Yields:
+        list: The fetch_property_info dictionaries of one chunk.
+    """
+    if properties is None:
+        properties = Property.objects.all()
+    properties = properties.order_by("property_id").prefetch_related(
+        "locations", "amenities"
+    )
+
+    last_property_id = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+
+        chunk_query = properties
+        if last_property_id is not None:
+            chunk_query = chunk_query.filter(property_id__gt=last_property_id)
+        with span("load_properties", "db", size=size):
+            with get_metrics().timer("llm_db_seconds", operation="load"):
+                chunk = list(chunk_query[:size])
+                if not chunk:
+                    return
+                property_ids = [property_obj.property_id for property_obj in chunk]
+                # Summaries are queried apart from the properties, so that they come
+                # from the primary when the properties are read from a replica
+                last_generations = {
+                    row["property_id"]: row
+                    for row in PropertySummary.objects.filter(
+                        property_id__in=property_ids
+                    ).values("property_id", "input_fingerprint", "generated_date")
+                }
+                image_names = {}
+                if images:
+                    for property_id, name in (
+                        PropertyImage.objects.filter(property_id__in=property_ids)
+                        .order_by("id")
+                        .values_list("property_id", "image")
+                    ):
+                        image_names.setdefault(property_id, []).append(name)
+            property_infos = []
+            for property_obj in chunk:
+                property_info = build_property_info(property_obj)
+                property_info["last_generation"] = last_generations.get(
+                    property_obj.property_id
+                )
+                if images:
+                    property_info["image_names"] = image_names.get(
+                        property_obj.property_id, []
+                    )
+                property_infos.append(property_info)
+
+        yield property_infos
+
+        last_property_id = chunk[-1].property_id
+        if remaining is not None:
+            remaining -= len(chunk)
+
+
+def iter_property_info(properties=None, chunk_size=500, limit=None, images=False):
+    """
+    Yields the fetch_property_info dictionary of every property, loaded in bulk chunks.
+    See iter_property_info_chunks for the arguments.
+    """
+    for chunk in iter_property_info_chunks(properties, chunk_size, limit, images):
+        yield from chunk
+
+
+@traced(category="db")
 def fetch_property_info(property_id, print_output=False):
     """
     Fetches information about a property by its ID and optionally prints the details.
@@ -23,17 +151,7 @@ def fetch_property_info(property_id, print_output=False):
         property_obj = Property.objects.select_related().get(property_id=property_id)
 
         # Collect information
-        info = {
-            "id": property_obj.property_id,
-            "title": property_obj.title,
-            "description": property_obj.description,
-            "locations": list(
-                property_obj.locations.values("name", "type", "latitude", "longitude")
-            ),
-            "amenities": list(property_obj.amenities.values_list("name", flat=True)),
-            "create_date": property_obj.create_date,
-            "update_date": property_obj.update_date,
-        }
+        info = build_property_info(property_obj)
 
         # Optionally print the information
         if print_output:
@@ -59,37 +177,387 @@ def fetch_property_info(property_id, print_output=False):
         return None
 
 
-def parse_response(response_chunks, keyword):
+def clean_generated_text(text):
     """
-    Extracts the value associated with the keyword from the list of JSON chunks.
-    Assumes each chunk is a JSON object containing a 'response' key.
+    Removes unwanted punctuation from generated text, keeping only letters, digits and whitespace.
+    Returns None when there is no text to clean.
     """
-    response_text = ""
-    for chunk in response_chunks:
+    if text is None:
+        return None
+
+    return "".join(c for c in text if c.isalnum() or c.isspace()).strip()
+
+
+def save_property_title(property_id, title, writer=None):
+    """
+    Stores a newly generated title for the property, or hands it to the write-behind
+    writer when one is given.
+    """
+    if writer is not None:
+        writer.add_title(property_id, title)
+        return
+
+    with span("save_property_title", "db"), get_metrics().timer(
+        "llm_db_seconds", operation="save"
+    ):
+        # Only the generated column is written: a full save() of a row read from a
+        # lagging replica would overwrite newer changes made on the primary
+        Property.objects.filter(property_id=property_id).update(
+            title=title, update_date=timezone.now()
+        )
+
+
+def save_property_description(property_id, description, writer=None):
+    """
+    Stores a newly generated description for the property, or hands it to the write-behind
+    writer when one is given.
+    """
+    if writer is not None:
+        writer.add_description(property_id, description)
+        return
+
+    with span("save_property_description", "db"), get_metrics().timer(
+        "llm_db_seconds", operation="save"
+    ):
+        Property.objects.filter(property_id=property_id).update(
+            description=description, update_date=timezone.now()
+        )
+
+
+def save_property_summary(property_id, summary, writer=None):
+    """
+    Creates or updates the PropertySummary of the property, or hands the summary to the
+    write-behind writer when one is given.
+    """
+    if writer is not None:
+        writer.add_summary(property_id, summary)
+        return
+
+    with span("save_property_summary", "db"), get_metrics().timer(
+        "llm_db_seconds", operation="save"
+    ):
+        PropertySummary.objects.update_or_create(
+            property_id=property_id, defaults={"summary": summary}
+        )
+
+
+def compute_fingerprint(property_info):
+    """
+    Returns a hash of the property data that feeds the prompts: title, description,
+    locations and amenities. Ordering of locations and amenities does not matter.
+    """
+    data = {
+        "title": property_info.get("title"),
+        "description": property_info.get("description"),
+        "locations": sorted(
+            [
+                [
+                    location["name"],
+                    location["type"],
+                    location["latitude"],
+                    location["longitude"],
+                ]
+                for location in property_info.get("locations", [])
+            ],
+            key=str,
+        ),
+        "amenities": sorted(property_info.get("amenities", [])),
+    }
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_up_to_date(property_info, last_generation):
+    """
+    Checks a PropertySummary's input_fingerprint and generated_date (as a dict, or None
+    if there is no summary) against the current property data.
+    """
+    if not last_generation or not last_generation["generated_date"]:
+        return False
+
+    if property_info.get("update_date") > last_generation["generated_date"]:
+        return False
+
+    return last_generation["input_fingerprint"] == compute_fingerprint(property_info)
+
+
+def needs_generation(property_info):
+    """
+    Checks whether the property changed since its last complete generation, either because
+    its update_date is newer or because its fingerprint differs. Uses the last generation
+    loaded by iter_property_info_chunks when there is one.
+    """
+    if "last_generation" in property_info:
+        last_generation = property_info["last_generation"]
+    else:
+        last_generation = (
+            PropertySummary.objects.filter(property_id=property_info.get("id"))
+            .values("input_fingerprint", "generated_date")
+            .first()
+        )
+    return not is_up_to_date(property_info, last_generation)
+
+
+def get_up_to_date_summary(property_info):
+    """
+    Returns the stored summary of the property if it was generated from the current
+    property data, otherwise None.
+    """
+    last_generation = (
+        PropertySummary.objects.filter(property_id=property_info.get("id"))
+        .values("summary", "input_fingerprint", "generated_date")
+        .first()
+    )
+    if is_up_to_date(property_info, last_generation):
+        return last_generation["summary"]
+    return None
+
+
+def with_generated_fields(property_info, title=None, description=None):
+    """
+    Returns the property information with the newly generated title and description, so
+    that the prompts of the next stages build on them. Fields that could not be generated
+    keep their current value.
+    """
+    return {
+        **property_info,
+        "title": title or property_info.get("title"),
+        "description": description or property_info.get("description"),
+    }
+
+
+def mark_property_generated(property_info, title, description, writer=None):
+    """
+    Records the fingerprint of the property data as it stands after a complete generation,
+    i.e. with the newly generated title and description.
+    """
+    fingerprint = compute_fingerprint(
+        {**property_info, "title": title, "description": description}
+    )
+    if writer is not None:
+        writer.add_fingerprint(property_info.get("id"), fingerprint)
+        return
+
+    with span("save_fingerprint", "db"):
+        PropertySummary.objects.filter(property_id=property_info.get("id")).update(
+            input_fingerprint=fingerprint, generated_date=timezone.now()
+        )
+
+
+# Per-stage generation options. Only the keyword line of each answer is kept, so the
+# stop sequences end generation once the model moves on to another field or commentary
+# and num_predict caps how many tokens a rambling answer can cost.
+GENERATION_OPTIONS = {
+    "Title": {
+        "num_predict": 64,
+        "stop": ["\nDescription:", "\nSummary:", "\nNote:", "\nExplanation:"],
+    },
+    "Description": {
+        "num_predict": 160,
+        "stop": ["\nTitle:", "\nSummary:", "\nNote:", "\nExplanation:"],
+    },
+    "Summary": {
+        "num_predict": 200,
+        "stop": ["\nTitle:", "\nDescription:", "\nNote:", "\nExplanation:"],
+    },
+}
+
+
+# JSON schema of the structured-output request generating all three fields at once
+CONTENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "summary": {"type": "string"},
+    },
+    "required": ["title", "description", "summary"],
+}
+CONTENT_OPTIONS = {"num_predict": 400}
+
+
+class ResponseParser:
+    """
+    Incrementally parses the NDJSON stream returned by the Ollama generate API.
+
+    Network chunks are fed as they arrive and may split or merge JSON lines arbitrarily.
+    The generated tokens are assembled line by line and the value following `keyword: `
+    is extracted as soon as its line is complete, so the caller can stop reading the stream.
+    The timing statistics of the final object are kept in `stats` when the stream is read
+    to its end, which `read_to_end` enforces (e.g. to get the context of a session).
+    The time spent parsing is added to the enclosing trace span when tracing.
+    """
+
+    def __init__(self, keyword, read_to_end=False):
+        self.keyword = f"{keyword}: "
+        self.read_to_end = read_to_end
+        self.buffer = b""
+        self.line_parts = []
+        self.value = None
+        self.done = False
+        self.tokens = 0
+        self.stats = None
+        self.chunks = 0
+        self.parse_seconds = 0.0
+
+    def feed(self, chunk):
+        """
+        Consumes a raw network chunk.
+
+        Returns:
+            bool: True once the keyword line was found or the model finished generating.
+        """
+        started = time.monotonic()
+        self.chunks += 1
+        lines = (self.buffer + chunk).split(b"\n")
+        self.buffer = lines.pop()
+
         try:
-            data = json.loads(chunk.decode("utf-8"))
-            response_text += data.get("response", "")
-        except json.JSONDecodeError:
+            for line in lines:
+                if self.handle_line(line):
+                    return True
+            return False
+        finally:
+            self.parse_seconds += time.monotonic() - started
+
+    def handle_line(self, line):
+        """
+        Handles one complete NDJSON line. Returns True when no more input is needed.
+        """
+        if not line.strip():
+            return False
+
+        try:
+            data = json.loads(line.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
             # Handle JSON parsing error
             print("Error decoding JSON chunk")
+            return False
 
-    # Now process the complete response text
-    keyword = f"{keyword}: "
-    start_index = response_text.find(keyword)
+        if data.get("response"):
+            self.tokens += 1
 
-    if start_index == -1:
-        return None
+        if self.value is None:
+            tokens = data.get("response", "").split("\n")
+            # Every part but the last one completes the current line of text
+            for token in tokens[:-1]:
+                self.line_parts.append(token)
+                if self.match_line():
+                    break
+            else:
+                self.line_parts.append(tokens[-1])
+
+            if self.value is not None and not self.read_to_end:
+                return True
+
+        self.done = data.get("done", False)
+        if self.done:
+            self.stats = data
+        return self.done
 
-    start_index += len(keyword)
-    end_index = response_text.find("\n", start_index)
+    def match_line(self):
+        """
+        Checks the current line of text for the keyword and starts a new line.
+        """
+        line = "".join(self.line_parts)
+        self.line_parts = []
 
-    if end_index == -1:
-        end_index = len(response_text)
+        start_index = line.find(self.keyword)
+        if start_index == -1:
+            return False
 
-    return response_text[start_index:end_index].strip()
+        self.value = line[start_index + len(self.keyword) :].strip()
+        return True
 
+    def partial_value(self):
+        """
+        Returns the value as generated so far: the text following the keyword on the line
+        currently being generated, or None while the keyword has not appeared.
+        """
+        if self.value is not None:
+            return self.value
 
-def rewrite_property_title(property_info, model="gemma2:2b", retries=3):
+        line = "".join(self.line_parts)
+        start_index = line.find(self.keyword)
+        if start_index == -1:
+            return None
+        return line[start_index + len(self.keyword) :].lstrip()
+
+    def finish(self):
+        """
+        Flushes any trailing partial line and returns the extracted value, or None if the
+        keyword was never found.
+        """
+        if self.value is None and self.buffer:
+            self.handle_line(self.buffer)
+            self.buffer = b""
+        if self.value is None and self.line_parts:
+            self.match_line()
+        annotate(
+            parse_ms=round(self.parse_seconds * 1000, 3),
+            chunks=self.chunks,
+            tokens=self.tokens,
+        )
+        return self.value
+
+    def parse(self, response_chunks):
+        """
+        Feeds raw NDJSON chunks until the keyword line is complete and returns its value.
+        """
+        for chunk in response_chunks:
+            if chunk and self.feed(chunk):
+                break
+        return self.finish()
+
+
+@traced(category="parse")
+def parse_response(response_chunks, keyword):
+    """
+    Extracts the value associated with the keyword from a stream of raw NDJSON chunks.
+    Stops consuming the chunks as soon as the keyword line is complete.
+    """
+    return ResponseParser(keyword).parse(response_chunks)
+
+
+@traced(category="parse")
+def parse_structured_response(response_text):
+    """
+    Validates the JSON document of a structured-output generation.
+
+    Returns:
+        dict: The title, description and summary. Fields that are missing, not strings or
+        empty after cleaning are None. Titles must also be a single line of at most 255
+        characters, as stored in properties_property.
+    """
+    fields = {"title": None, "description": None, "summary": None}
+
+    try:
+        data = json.loads(response_text)
+    except (TypeError, json.JSONDecodeError):
+        print("Error decoding structured response")
+        return fields
+
+    if not isinstance(data, dict):
+        return fields
+
+    title = data.get("title")
+    if isinstance(title, str) and "\n" not in title.strip():
+        title = title.strip()
+        if 0 < len(title) <= 255:
+            fields["title"] = title
+
+    for field in ("description", "summary"):
+        value = data.get(field)
+        if isinstance(value, str):
+            fields[field] = clean_generated_text(value) or None
+
+    return fields
+
+
+@traced(category="generation")
+def rewrite_property_title(
+    property_info, model=None, retries=3, client=None, writer=None
+):
     """
     Rewrites the title of the property using the specified model.
     Ensures data integrity by retrying on blank responses and handling errors.
@@ -98,55 +566,66 @@ def rewrite_property_title(property_info, model="gemma2:2b", retries=3):
     title = property_info.get("title")
     property_id = property_info.get("id")
 
-    prompt = (
-        f"Please rewrite the following property title to make it more attractive and readable while "
-        f"preserving its original meaning. Ensure that the title reflects the nature and identity of "
-        f"the property, but do not simply return the original title. Rephrase the title creatively while "
-        f"keeping the key elements like the hotel name and location intact. Avoid changing the property "
-        f"type or location information. Make sure the title is free of any extra symbols or punctuation.\n\n"
-        f"Title: {title}\n\nGive only one new title and in the following format only:\nTitle: generated_title"
-    )
+    prompt = build_title_prompt(property_info)
+    client = client or get_ollama_client()
+    model = model or get_stage_model("title", client.model)
+    options = GENERATION_OPTIONS["Title"]
+
+    # Reuse a previous generation for the exact same request if there is one
+    cache = get_generation_cache()
+    cache_key = cache.make_key(model, prompt, options)
+    cached_title = cache.get(cache_key)
+    if cached_title:
+        print(f"Previous title: {title}")
+        print(f"New title (cached): {cached_title}")
+        save_property_title(property_id, cached_title, writer)
+        return cached_title
 
     for attempt in range(retries):
+        if not get_retry_policy().backoff(attempt):
+            break
+        started = time.monotonic()
         try:
-            response = requests.post(
-                "http://localhost:11434/api/generate",  # Update with your API endpoint
-                json={"prompt": prompt, "model": model},
-                timeout=30,  # Timeout set to 10 seconds
-                stream=True,  # Enable streaming
-            )
-
-            if response.status_code == 200:
-                response_chunks = []
+            with client.generate(prompt, model, options) as response:
+                if response.status_code == 200:
+                    # Process the response chunks as they arrive. Leaving the with
+                    # block closes the stream once the title line has been read.
+                    parser = ResponseParser("Title")
+                    response_text = parser.parse(response.iter_content(chunk_size=None))
+                    # print(f"Raw response text: {response_text}")  # Log the raw response
 
-                # Process the response chunks as they arrive
-                for chunk in response.iter_content(chunk_size=None):
-                    if chunk:
-                        response_chunks.append(chunk)  # Collect chunks
-
-                response_text = parse_response(response_chunks, "Title")
-                # print(f"Raw response text: {response_text}")  # Log the raw response
-
-                new_title = response_text
-                print(f"Previous title: {title}")
-                print(f"New title: {new_title}")
+                    new_title = response_text
+                    print(f"Previous title: {title}")
+                    print(f"New title: {new_title}")
+                    record_generation(
+                        "title",
+                        model,
+                        response.url,
+                        started,
+                        "success" if new_title else "unparsed",
+                        attempt,
+                        parser.stats,
+                        parser.tokens,
+                    )
 
-                if new_title:
-                    # Update the property title in the database
-                    with transaction.atomic():
-                        property_obj = Property.objects.get(property_id=property_id)
-                        property_obj.title = new_title
-                        property_obj.save()
-                    return new_title
+                    if new_title:
+                        # Update the property title in the database
+                        save_property_title(property_id, new_title, writer)
+                        cache.set(cache_key, model, new_title)
+                        return new_title
 
-            else:
-                # Handle non-200 responses
-                print(
-                    f"Unexpected response status {response.status_code} for property {property_id}."
-                )
+                else:
+                    # Handle non-200 responses
+                    record_generation(
+                        "title", model, response.url, started, "http_error", attempt
+                    )
+                    print(
+                        f"Unexpected response status {response.status_code} for property {property_id}."
+                    )
 
         except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
             # Handle request timeout or other request-related errors
+            record_generation("title", model, None, started, "error", attempt)
             print(f"Attempt {attempt + 1} failed: {e}")
 
     print(
@@ -155,62 +634,88 @@ def rewrite_property_title(property_info, model="gemma2:2b", retries=3):
     return None
 
 
-def write_property_description(property_info, model="gemma2:2b", retries=3):
+@traced(category="generation")
+def write_property_description(
+    property_info, model=None, retries=3, client=None, writer=None
+):
     """
     Generates a description for the property based on its title using the specified model.
     Ensures data integrity by retrying on blank responses and handling errors.
     """
-    title = property_info.get("title")
     property_id = property_info.get("id")
 
-    prompt = (
-        f"Write a concise, compelling description for the following hotel property. "
-        f"Preserve the originality and identity of the hotel, but creatively rephrase it "
-        f"to highlight its unique features. The description should be brief, around 2-3 sentences, "
-        f"and make the hotel appealing to potential guests. Ensure that the description is free of any "
-        f"extra symbols or punctuation. Give only one new description and in the following format only::\n\n"
-        f"Description: generated_description\n\nTitle: {title}"
+    prompt = build_description_prompt(property_info)
+    client = client or get_ollama_client()
+    # Photos prepared by an ImageLoader are described by the vision model
+    images = property_info.get("images")
+    model = model or (
+        settings.OLLAMA_VISION_MODEL
+        if images
+        else get_stage_model("description", client.model)
+    )
+    options = GENERATION_OPTIONS["Description"]
+
+    cache = get_generation_cache()
+    cache_key = cache.make_key(
+        model, prompt, options, [image.key for image in images or []]
     )
+    cached_description = cache.get(cache_key)
+    if cached_description:
+        print(f"New description (cached): {cached_description}")
+        save_property_description(property_id, cached_description, writer)
+        return cached_description
 
     for attempt in range(retries):
+        if not get_retry_policy().backoff(attempt):
+            break
+        started = time.monotonic()
         try:
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={"prompt": prompt, "model": model},
-                timeout=30,
-                stream=True,
-            )
-
-            if response.status_code == 200:
-                response_chunks = []
-
-                # Process the response chunks as they arrive
-                for chunk in response.iter_content(chunk_size=None):
-                    if chunk:
-                        response_chunks.append(chunk)
+            with client.generate(
+                prompt,
+                model,
+                options,
+                images=[image.data for image in images or []],
+            ) as response:
+                if response.status_code == 200:
+                    # Process the response chunks as they arrive
+                    parser = ResponseParser("Description")
+                    description = parser.parse(response.iter_content(chunk_size=None))
+                    print(f"New description: {description}")  # Log the raw response
 
-                description = parse_response(response_chunks, "Description")
-                print(f"New description: {description}")  # Log the raw response
-
-                # Remove unwanted punctuation and clean up description
-                description = "".join(
-                    c for c in description if c.isalnum() or c.isspace()
-                ).strip()
+                    # Remove unwanted punctuation and clean up description
+                    description = clean_generated_text(description)
+                    record_generation(
+                        "description",
+                        model,
+                        response.url,
+                        started,
+                        "success" if description else "unparsed",
+                        attempt,
+                        parser.stats,
+                        parser.tokens,
+                    )
 
-                if description:
-                    # Update the property title in the database
-                    with transaction.atomic():
-                        property_obj = Property.objects.get(property_id=property_id)
-                        property_obj.description = description
-                        property_obj.save()
-                    return description
+                    if description:
+                        # Update the property description in the database
+                        save_property_description(property_id, description, writer)
+                        cache.set(cache_key, model, description)
+                        return description
 
-            else:
-                print(
-                    f"Unexpected response status {response.status_code} for property {property_id}."
-                )
+                else:
+                    record_generation(
+                        "description",
+                        model,
+                        response.url,
+                        started,
+                        "http_error",
+                        attempt,
+                    )
+                    print(
+                        f"Unexpected response status {response.status_code} for property {property_id}."
+                    )
 
         except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
+            record_generation("description", model, None, started, "error", attempt)
             print(f"Attempt {attempt + 1} failed: {e}")
 
     print(
@@ -219,65 +724,307 @@ def write_property_description(property_info, model="gemma2:2b", retries=3):
     return None
 
 
-def generate_property_summary(property_info, model="gemma2:2b", retries=3):
+@traced(category="generation")
+def generate_property_summary(
+    property_info, model=None, retries=3, client=None, writer=None
+):
     """
     Generates a summary for the property based on its title, description, location, and amenities.
     Ensures data integrity by retrying on blank responses and handling errors.
     """
-    title = property_info.get("title")
-    description = property_info.get("description")
-    locations = property_info.get("locations")
-    amenities = property_info.get("amenities")
     property_id = property_info.get("id")
 
-    prompt = (
-        f"Generate a concise, engaging summary for the following hotel property. "
-        f"Use the provided information to highlight the key features, atmosphere, and appeal of the property. "
-        f"The summary should be around 2-3 sentences and make the property stand out to potential guests. "
-        f"Ensure that the summary is free of any extra symbols or punctuation. Give only one summary and in the following format only:\n\n"
-        f"Summary: generated_summary\n\n"
-        f"Title: {title}\n"
-        f"Description: {description}\n"
-        f"Location: {locations}\n"
-        f"Amenities: {amenities}"
-    )
+    prompt = build_summary_prompt(property_info)
+    client = client or get_ollama_client()
+    model = model or get_stage_model("summary", client.model)
+    options = GENERATION_OPTIONS["Summary"]
+
+    cache = get_generation_cache()
+    cache_key = cache.make_key(model, prompt, options)
+    cached_summary = cache.get(cache_key)
+    if cached_summary:
+        save_property_summary(property_id, cached_summary, writer)
+        return cached_summary
 
     for attempt in range(retries):
+        if not get_retry_policy().backoff(attempt):
+            break
+        started = time.monotonic()
         try:
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={"prompt": prompt, "model": model},
-                timeout=30,
-                stream=True,
-            )
-
-            if response.status_code == 200:
-                response_chunks = []
-                for chunk in response.iter_content(chunk_size=None):
-                    if chunk:
-                        response_chunks.append(chunk)
-
-                summary = parse_response(response_chunks, "Summary")
-                summary = "".join(
-                    c for c in summary if c.isalnum() or c.isspace()
-                ).strip()
-
-                if summary:
-                    property_obj = Property.objects.get(property_id=property_id)
-                    PropertySummary.objects.update_or_create(
-                        property=property_obj, defaults={"summary": summary}
+            with client.generate(prompt, model, options) as response:
+                if response.status_code == 200:
+                    parser = ResponseParser("Summary")
+                    summary = parser.parse(response.iter_content(chunk_size=None))
+                    summary = clean_generated_text(summary)
+                    record_generation(
+                        "summary",
+                        model,
+                        response.url,
+                        started,
+                        "success" if summary else "unparsed",
+                        attempt,
+                        parser.stats,
+                        parser.tokens,
                     )
-                    return summary
 
-            else:
-                print(
-                    f"Unexpected response status {response.status_code} for property {property_id}."
-                )
+                    if summary:
+                        save_property_summary(property_id, summary, writer)
+                        cache.set(cache_key, model, summary)
+                        return summary
+
+                else:
+                    record_generation(
+                        "summary", model, response.url, started, "http_error", attempt
+                    )
+                    print(
+                        f"Unexpected response status {response.status_code} for property {property_id}."
+                    )
 
         except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
+            record_generation("summary", model, None, started, "error", attempt)
             print(f"Attempt {attempt + 1} failed: {e}")
 
     print(
         f"Failed to generate summary for property {property_id} after {retries} attempts."
     )
     return None
+
+
+@traced(category="generation")
+def generate_property_content(
+    property_info, model=None, retries=3, client=None, writer=None
+):
+    """
+    Generates title, description and summary of the property with a single
+    structured-output request. Fields that fail validation are generated with their
+    separate requests instead, with the model of their own stage unless `model` is given.
+
+    Returns:
+        tuple: The new title, description and summary, each None if it could not be generated.
+    """
+    property_id = property_info.get("id")
+
+    prompt = build_content_prompt(property_info)
+    client = client or get_ollama_client()
+    content_model = model or get_stage_model("content", client.model)
+    options = {**CONTENT_OPTIONS, "format": CONTENT_SCHEMA}
+
+    cache = get_generation_cache()
+    cache_key = cache.make_key(content_model, prompt, options)
+    response_text = cache.get(cache_key)
+
+    for attempt in range(retries if response_text is None else 0):
+        if not get_retry_policy().backoff(attempt):
+            break
+        started = time.monotonic()
+        try:
+            response = client.generate_structured(
+                prompt, CONTENT_SCHEMA, content_model, CONTENT_OPTIONS
+            )
+            if response.status_code == 200:
+                # Non-streamed responses carry the timing statistics directly
+                data = response.json()
+                response_text = data.get("response")
+                # Output that is not a usable JSON document is retried like a failure
+                parsed = any(parse_structured_response(response_text).values())
+                record_generation(
+                    "content",
+                    content_model,
+                    response.url,
+                    started,
+                    "success" if parsed else "unparsed",
+                    attempt,
+                    data,
+                )
+                if parsed:
+                    break
+                continue
+
+            record_generation(
+                "content", content_model, response.url, started, "http_error", attempt
+            )
+            print(
+                f"Unexpected response status {response.status_code} for property {property_id}."
+            )
+
+        except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
+            record_generation("content", content_model, None, started, "error", attempt)
+            print(f"Attempt {attempt + 1} failed: {e}")
+
+    fields = parse_structured_response(response_text)
+    if all(fields.values()):
+        cache.set(cache_key, content_model, response_text)
+
+    print(f"Previous title: {property_info.get('title')}")
+    print(f"New title: {fields['title']}")
+    print(f"New description: {fields['description']}")
+
+    # Store the valid fields and fall back to separate requests for the others
+    if fields["title"]:
+        save_property_title(property_id, fields["title"], writer)
+    else:
+        fields["title"] = rewrite_property_title(
+            property_info, model, retries, client, writer
+        )
+
+    if fields["description"]:
+        save_property_description(property_id, fields["description"], writer)
+    else:
+        fields["description"] = write_property_description(
+            with_generated_fields(property_info, fields["title"]),
+            model,
+            retries,
+            client,
+            writer,
+        )
+
+    if fields["summary"]:
+        save_property_summary(property_id, fields["summary"], writer)
+    else:
+        fields["summary"] = generate_property_summary(
+            with_generated_fields(
+                property_info, fields["title"], fields["description"]
+            ),
+            model,
+            retries,
+            client,
+            writer,
+        )
+
+    return fields["title"], fields["description"], fields["summary"]
+
+
+def generate_session_field(
+    client, prompt, keyword, model, retries, property_id, context=None, clean=True
+):
+    """
+    Requests one generation of a session. The prompt continues the conversation of
+    `context`, and the stream is read to its end to get the context of the next request.
+    Session generations depend on the whole conversation, so they are not cached.
+
+    Returns:
+        tuple: The parsed (and optionally cleaned) value, or None once all attempts
+        failed, and the context continuing the conversation after it.
+    """
+    stage = keyword.lower()
+    options = GENERATION_OPTIONS[keyword]
+
+    for attempt in range(retries):
+        if not get_retry_policy().backoff(attempt):
+            break
+        started = time.monotonic()
+        try:
+            with client.generate(prompt, model, options, context) as response:
+                if response.status_code != 200:
+                    record_generation(
+                        stage, model, response.url, started, "http_error", attempt
+                    )
+                    print(
+                        f"Unexpected response status {response.status_code} for property {property_id}."
+                    )
+                    continue
+
+                parser = ResponseParser(keyword, read_to_end=True)
+                value = parser.parse(response.iter_content(chunk_size=None))
+
+        except (requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
+            record_generation(stage, model, None, started, "error", attempt)
+            print(f"Attempt {attempt + 1} failed: {e}")
+            continue
+
+        if clean:
+            value = clean_generated_text(value)
+        record_generation(
+            stage,
+            model,
+            response.url,
+            started,
+            "success" if value else "unparsed",
+            attempt,
+            parser.stats,
+            parser.tokens,
+        )
+
+        if value:
+            return value, (parser.stats or {}).get("context")
+
+    return None, None
+
+
+@traced(category="generation")
+def generate_property_session(
+    property_info, model=None, retries=3, client=None, writer=None
+):
+    """
+    Generates title, description and summary of the property as one conversation: each
+    request sends the context returned by the previous one, so Ollama does not evaluate
+    the instructions and property information again. A field whose session request
+    fails, and every field after it, is generated with its separate request instead.
+    `model` replaces the session model and the stage models of these requests.
+
+    Returns:
+        tuple: The new title, description and summary, each None if it could not be generated.
+    """
+    property_id = property_info.get("id")
+    client = client or get_ollama_client()
+    session_model = model or get_stage_model("session", client.model)
+
+    print(f"Previous title: {property_info.get('title')}")
+    title, context = generate_session_field(
+        client,
+        build_session_title_prompt(property_info),
+        "Title",
+        session_model,
+        retries,
+        property_id,
+        clean=False,
+    )
+    print(f"New title: {title}")
+    if title:
+        save_property_title(property_id, title, writer)
+    else:
+        title = rewrite_property_title(property_info, model, retries, client, writer)
+
+    description = None
+    if context:
+        description, context = generate_session_field(
+            client,
+            build_session_description_prompt(),
+            "Description",
+            session_model,
+            retries,
+            property_id,
+            context,
+        )
+        print(f"New description: {description}")
+    if description:
+        save_property_description(property_id, description, writer)
+    else:
+        context = None
+        description = write_property_description(
+            with_generated_fields(property_info, title), model, retries, client, writer
+        )
+
+    summary = None
+    if context:
+        summary, _ = generate_session_field(
+            client,
+            build_session_summary_prompt(),
+            "Summary",
+            session_model,
+            retries,
+            property_id,
+            context,
+        )
+    if summary:
+        save_property_summary(property_id, summary, writer)
+    else:
+        summary = generate_property_summary(
+            with_generated_fields(property_info, title, description),
+            model,
+            retries,
+            client,
+            writer,
+        )
+
+    return title, description, summary
@@ -0,0 +1,70 @@
+import json
+import os
+
+from django.conf import settings
+
+# Generation stages that can be given a model of their own
+STAGES = ("title", "description", "summary", "content", "session")
+
+
+def read_model_map(path):
+    """
+    Returns the per-stage models recommended by calibrate_models in the file at the path,
+    or an empty dictionary if there is none.
+    """
+    try:
+        with open(path) as map_file:
+            models = json.load(map_file).get("models", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Ignoring the model map {path}: {e}")
+        return {}
+    return {
+        stage: model for stage, model in models.items() if stage in STAGES and model
+    }
+
+
+_stage_models = None
+
+
+def get_stage_models():
+    """
+    Returns the models configured per stage: OLLAMA_STAGE_MODELS, falling back to the
+    mapping of LLM_MODEL_MAP_FILE. Stages without a model are missing.
+    """
+    global _stage_models
+    if _stage_models is None:
+        configured = {
+            stage: model
+            for stage, model in settings.OLLAMA_STAGE_MODELS.items()
+            if model
+        }
+        _stage_models = {**read_model_map(settings.LLM_MODEL_MAP_FILE), **configured}
+    return _stage_models
+
+
+def set_stage_models(models):
+    """
+    Replaces the models configured per stage for the rest of the process.
+    """
+    global _stage_models
+    _stage_models = dict(models)
+
+
+def get_stage_model(stage, default=None):
+    """
+    Returns the model configured for the stage, or `default` if there is none.
+    """
+    return get_stage_models().get(stage) or default
+
+
+def write_model_map(path, report):
+    """
+    Writes a calibration report, whose "models" the summary command picks up. The file
+    is replaced atomically so that a run starting meanwhile never reads a partial map.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as map_file:
+        json.dump(report, map_file, indent=2, default=str)
+    os.replace(temporary_path, path)
@@ -0,0 +1,163 @@
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from llm_app.async_services import _agenerate_field
+from llm_app.ollama import AsyncOllamaClient
+from llm_app.services import (
+    build_summary_prompt,
+    mark_property_generated,
+    save_property_summary,
+)
+
+# Events that end a stream
+FINAL_EVENTS = ("summary", "error")
+
+
+class SummaryStream:
+    """
+    An on-demand summary generation shared by every request for the same property.
+
+    Published events are kept so that requests joining late first replay what was
+    generated so far. The generation runs in its own task, so it completes and is stored
+    even when the request that started it disconnects.
+
+    Events:
+        token: The next piece of the summary as it arrives from Ollama.
+        reset: A failed attempt is retried, the tokens received so far are discarded.
+        summary: The final, cleaned summary.
+        error: The summary could not be generated.
+    """
+
+    def __init__(self, property_info, retries=3):
+        self.property_info = property_info
+        self.retries = retries
+        self.events = []
+        self.updated = asyncio.Event()
+        self.attempt = 0
+        self.sent = ""
+        self.task = None
+
+    def publish(self, event, data=""):
+        self.events.append((event, data))
+        # Wake up every subscriber and give the next round of waiters a fresh event
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def on_text(self, attempt, text):
+        """
+        Publishes the part of the summary generated since the last call.
+        """
+        if attempt != self.attempt:
+            self.attempt = attempt
+            if self.sent:
+                self.sent = ""
+                self.publish("reset")
+
+        if text and text.startswith(self.sent) and len(text) > len(self.sent):
+            self.publish("token", text[len(self.sent) :])
+            self.sent = text
+
+    async def run(self):
+        property_id = self.property_info["id"]
+        try:
+            summary = await _agenerate_field(
+                get_stream_client(),
+                build_summary_prompt(self.property_info),
+                "Summary",
+                None,
+                self.retries,
+                property_id,
+                on_text=self.on_text,
+            )
+
+            if summary:
+                await sync_to_async(save_property_summary)(property_id, summary)
+                # The title and description are unchanged, so the summary is current
+                # for the property as it stands and later requests get it right away
+                await sync_to_async(mark_property_generated)(
+                    self.property_info,
+                    self.property_info["title"],
+                    self.property_info["description"],
+                )
+                self.publish("summary", summary)
+            else:
+                self.publish(
+                    "error", f"Failed to generate summary for property {property_id}."
+                )
+        except Exception as e:
+            print(f"On-demand summary for property {property_id} failed: {e}")
+            self.publish(
+                "error", f"Failed to generate summary for property {property_id}."
+            )
+
+    async def subscribe(self):
+        """
+        Yields every (event, data) pair of the stream, from the first one until the
+        final summary or error.
+        """
+        index = 0
+        while True:
+            if index == len(self.events):
+                await self.updated.wait()
+                continue
+
+            event, data = self.events[index]
+            index += 1
+            yield event, data
+            if event in FINAL_EVENTS:
+                return
+
+
+# In-flight generations per event loop and property id. Asyncio primitives belong to
+# their event loop, so requests are coalesced within one loop, i.e. one ASGI worker.
+_in_flight = weakref.WeakKeyDictionary()
+
+# Ollama client per event loop, whose connections are reused by all of its streams
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_stream_client():
+    """
+    Returns the AsyncOllamaClient of the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncOllamaClient()
+    return client
+
+
+def get_summary_stream(property_info):
+    """
+    Returns the in-flight generation of the property's summary, starting one if there
+    is none.
+    """
+    streams = _in_flight.setdefault(asyncio.get_running_loop(), {})
+    property_id = property_info["id"]
+
+    stream = streams.get(property_id)
+    if stream is None:
+        stream = SummaryStream(property_info)
+        streams[property_id] = stream
+        stream.task = asyncio.create_task(stream.run())
+        stream.task.add_done_callback(lambda task: streams.pop(property_id, None))
+    return stream
+
+
+async def replay(events):
+    """
+    Turns a list of (event, data) pairs into a stream.
+    """
+    for event in events:
+        yield event
+
+
+async def format_sse(events):
+    """
+    Formats a stream of (event, data) pairs as Server-Sent Events.
+    """
+    async for event, data in events:
+        lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+        yield f"event: {event}\n{lines}\n"
@@ -1,3 +1,671 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from properties.models import Amenity, Location, Property
+
+from llm_app.checkpoint import RunCheckpoint
+from llm_app.embeddings import EmbeddingIndex
+from llm_app.fake_ollama import FakeOllamaServer
+from llm_app.images import ImageLoader
+from llm_app.models import GenerationCheckpoint, PropertySummary
+from llm_app.prompts import estimate_tokens, render_details
+from llm_app.resilience import AdaptiveLimiter, CircuitBreaker
+from llm_app.routers import ReplicaRouter, _pinned_until
+from llm_app.services import (
+    ResponseParser,
+    generate_property_content,
+    iter_property_info,
+    mark_property_generated,
+    needs_generation,
+    parse_structured_response,
+)
+from llm_app.streaming import get_stream_client
+from llm_app.writer import GenerationWriter
+
+
+def ndjson(tokens):
+    """
+    Returns the NDJSON stream Ollama sends when generating the tokens.
+    """
+    lines = [json.dumps({"response": token, "done": False}) for token in tokens]
+    lines.append(json.dumps({"response": "", "done": True, "eval_count": len(tokens)}))
+    return "".join(f"{line}\n" for line in lines).encode("utf-8")
+
+
+def split_bytes(data, size):
+    return [data[index : index + size] for index in range(0, len(data), size)]
+
+
+class GenerationWriterTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(title="Old title", description="Old")
+        self.property_id = self.property.property_id
+        self.writer = GenerationWriter(batch_size=100, flush_interval=60)
+
+    def test_flush_writes_titles_descriptions_and_summaries(self):
+        self.writer.add_title(self.property_id, "New title")
+        self.writer.add_description(self.property_id, "New description")
+        self.writer.add_summary(self.property_id, "New summary")
+        self.writer.flush()
+
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.title, "New title")
+        self.assertEqual(self.property.description, "New description")
+        self.assertEqual(
+            PropertySummary.objects.get(property=self.property).summary, "New summary"
+        )
+        self.assertEqual(self.writer.pending, 0)
+
+    def test_fingerprint_flushed_with_its_summary(self):
+        self.writer.add_summary(self.property_id, "Summary")
+        self.writer.add_fingerprint(self.property_id, "a" * 64)
+        self.writer.flush()
+
+        summary = PropertySummary.objects.get(property=self.property)
+        self.assertEqual(summary.input_fingerprint, "a" * 64)
+        self.assertIsNotNone(summary.generated_date)
+
+    def test_fingerprint_flushed_after_its_summary(self):
+        # The flush of another property may write the summary before the property is
+        # marked as generated
+        self.writer.add_summary(self.property_id, "Summary")
+        self.writer.flush()
+        self.writer.add_fingerprint(self.property_id, "b" * 64)
+        self.assertEqual(self.writer.pending, 1)
+        self.writer.flush()
+
+        summary = PropertySummary.objects.get(property=self.property)
+        self.assertEqual(summary.summary, "Summary")
+        self.assertEqual(summary.input_fingerprint, "b" * 64)
+        self.assertIsNotNone(summary.generated_date)
+        self.assertEqual(self.writer.fingerprints, {})
+
+    def test_summary_without_fingerprint_keeps_previous_fingerprint(self):
+        self.writer.add_summary(self.property_id, "First")
+        self.writer.add_fingerprint(self.property_id, "c" * 64)
+        self.writer.flush()
+        self.writer.add_summary(self.property_id, "Second")
+        self.writer.flush()
+
+        summary = PropertySummary.objects.get(property=self.property)
+        self.assertEqual(summary.summary, "Second")
+        self.assertEqual(summary.input_fingerprint, "c" * 64)
+
+    def test_conflicting_title_only_skips_its_property(self):
+        other = Property.objects.create(title="Taken title")
+        self.writer.add_title(self.property_id, "Taken title")
+        self.writer.add_title(other.property_id, "Fresh title")
+        self.writer.add_summary(self.property_id, "Summary")
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.writer.flush()
+
+        self.assertIn(
+            f"Failed to store generated values for property {self.property_id}",
+            output.getvalue(),
+        )
+        other.refresh_from_db()
+        self.property.refresh_from_db()
+        self.assertEqual(other.title, "Fresh title")
+        self.assertEqual(self.property.title, "Old title")
+
+
+class ResponseParserTests(SimpleTestCase):
+    def test_lines_split_across_chunks(self):
+        stream = ndjson(["Sure.\n\nTi", "tle: Cozy ", "Garden Hotel", "\n", "More"])
+        parser = ResponseParser("Title")
+        self.assertEqual(parser.parse(split_bytes(stream, 7)), "Cozy Garden Hotel")
+
+    def test_stops_once_the_keyword_line_is_complete(self):
+        parser = ResponseParser("Title")
+        stream = ndjson(["Title: Cozy Hotel\n", "ignored", "tokens"])
+        lines = stream.split(b"\n")
+        self.assertFalse(parser.feed(lines[0]))
+        self.assertTrue(parser.feed(b"\n"))
+        self.assertEqual(parser.finish(), "Cozy Hotel")
+        self.assertIsNone(parser.stats)
+
+    def test_malformed_lines_are_skipped(self):
+        stream = b'{"response": "Title: Co\n{not json\n' + ndjson(
+            ["Title: Cozy Hotel", "\n"]
+        )
+        with redirect_stdout(io.StringIO()):
+            value = ResponseParser("Title").parse(split_bytes(stream, 5))
+        self.assertEqual(value, "Cozy Hotel")
+
+    def test_value_on_the_last_line_without_newline(self):
+        parser = ResponseParser("Summary")
+        self.assertEqual(
+            parser.parse([ndjson(["Summary: A quiet ", "stay"])]), "A quiet stay"
+        )
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.stats["eval_count"], 2)
+
+    def test_read_to_end_keeps_the_final_stats(self):
+        parser = ResponseParser("Title", read_to_end=True)
+        self.assertEqual(
+            parser.parse(split_bytes(ndjson(["Title: Cozy\n", "more"]), 3)), "Cozy"
+        )
+        self.assertEqual(parser.stats["eval_count"], 2)
+        self.assertEqual(parser.tokens, 2)
+
+    def test_missing_keyword(self):
+        self.assertIsNone(ResponseParser("Title").parse([ndjson(["No title", "\n"])]))
+
+
+class RunCheckpointTests(TestCase):
+    def test_watermark_waits_for_earlier_properties(self):
+        checkpoint = RunCheckpoint("test")
+        for property_id in (1, 2, 3):
+            checkpoint.start(property_id)
+
+        self.assertFalse(checkpoint.finish(2))
+        self.assertIsNone(checkpoint.last_property_id)
+        self.assertTrue(checkpoint.finish(1))
+        self.assertEqual(checkpoint.last_property_id, 2)
+        self.assertTrue(checkpoint.finish(3))
+        self.assertEqual(checkpoint.last_property_id, 3)
+
+    def test_saved_watermark_is_resumed_until_reset(self):
+        checkpoint = RunCheckpoint("test")
+        checkpoint.start(5)
+        checkpoint.finish(5)
+        checkpoint.save()
+        self.assertEqual(RunCheckpoint("test").last_property_id, 5)
+        self.assertIsNone(RunCheckpoint("other").last_property_id)
+
+        checkpoint.reset()
+        self.assertIsNone(RunCheckpoint("test").last_property_id)
+
+
+class ParseStructuredResponseTests(SimpleTestCase):
+    def test_valid_document(self):
+        fields = parse_structured_response(
+            json.dumps(
+                {
+                    "title": "  Cozy Hotel ",
+                    "description": "Quiet rooms!",
+                    "summary": "A stay, near the beach.",
+                }
+            )
+        )
+        self.assertEqual(
+            fields,
+            {
+                "title": "Cozy Hotel",
+                "description": "Quiet rooms",
+                "summary": "A stay near the beach",
+            },
+        )
+
+    def test_invalid_documents(self):
+        empty = {"title": None, "description": None, "summary": None}
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(parse_structured_response('{"title": "Co'), empty)
+            self.assertEqual(parse_structured_response(None), empty)
+        self.assertEqual(parse_structured_response('["Cozy Hotel"]'), empty)
+
+    def test_invalid_fields_are_none(self):
+        fields = parse_structured_response(
+            json.dumps({"title": "Two\nlines", "description": "!!!", "summary": 3})
+        )
+        self.assertEqual(fields, {"title": None, "description": None, "summary": None})
+        fields = parse_structured_response(json.dumps({"title": "x" * 256}))
+        self.assertIsNone(fields["title"])
+
+
+class SummaryCommandTests(TestCase):
+    def setUp(self):
+        dhaka = Location.objects.create(
+            name="Dhaka", type="city", latitude=23.8, longitude=90.4
+        )
+        pool = Amenity.objects.create(name="Pool")
+        self.properties = []
+        for index in range(3):
+            property_obj = Property.objects.create(
+                title=f"Hotel {index}", description=f"A hotel, number {index}."
+            )
+            property_obj.locations.add(dhaka)
+            property_obj.amenities.add(pool)
+            self.properties.append(property_obj)
+
+    def run_summary(self, fake_server, **options):
+        report_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(report_dir.cleanup)
+        report_file = os.path.join(report_dir.name, "summary_report.json")
+
+        # The process-wide client, endpoint pool and stage models are built for the
+        # fake server and discarded afterwards
+        with override_settings(
+            OLLAMA_URL=fake_server.url, OLLAMA_URLS=[fake_server.url]
+        ), mock.patch("llm_app.ollama._client", None), mock.patch(
+            "llm_app.endpoints._pool", None
+        ), mock.patch(
+            "llm_app.stage_models._stage_models", {}
+        ), redirect_stdout(
+            io.StringIO()
+        ):
+            call_command(
+                "summary",
+                no_cache=True,
+                report=report_file,
+                stdout=io.StringIO(),
+                **options,
+            )
+        with open(report_file) as report:
+            return json.load(report)
+
+    def test_summary_run(self):
+        with FakeOllamaServer(seed=1, split_chunks=True) as fake_server:
+            self.run_summary(fake_server)
+
+        self.assertEqual(len(fake_server.durations["title"]), 3)
+        for index, property_obj in enumerate(self.properties):
+            property_obj.refresh_from_db()
+            self.assertNotEqual(property_obj.title, f"Hotel {index}")
+            summary = PropertySummary.objects.get(property=property_obj)
+            self.assertTrue(summary.summary)
+            self.assertTrue(summary.input_fingerprint)
+            self.assertIsNotNone(summary.generated_date)
+
+        # Unchanged properties are skipped by the next run
+        with FakeOllamaServer(seed=1) as fake_server:
+            self.run_summary(fake_server, changed_only=True)
+        self.assertEqual(fake_server.durations, {})
+
+
+class EmbeddingIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index = EmbeddingIndex(directory.name)
+        self.index.write(
+            {1: [1, 0], 2: [0.9, 0.1], 3: [0, 2], 4: [-1, 0], 5: [0.5, 0.5]}, "model"
+        )
+
+    def ids(self, results):
+        return [property_id for property_id, _ in results]
+
+    def test_top_k_most_similar_first(self):
+        results = self.index.search([2, 0], k=3)
+        self.assertEqual(self.ids(results), [1, 2, 5])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+    def test_exclude_and_min_score(self):
+        self.assertEqual(self.ids(self.index.search([1, 0], k=2, exclude=1)), [2, 5])
+        self.assertEqual(
+            self.ids(self.index.search([1, 0], k=10, min_score=0.5)), [1, 2, 5]
+        )
+        self.assertEqual(self.ids(self.index.similar(1, k=1)), [2])
+
+    def test_k_larger_than_the_index(self):
+        self.assertEqual(self.ids(self.index.search([1, 0], k=10)), [1, 2, 5, 3, 4])
+
+    def test_removed_rows_are_not_found(self):
+        self.index.write({}, "model", removed=[2])
+        self.assertEqual(self.ids(self.index.search([1, 0], k=2)), [1, 5])
+        self.assertIsNone(self.index.similar(2))
+
+    def test_mapped_readers_keep_their_vectors_during_writes(self):
+        reader = EmbeddingIndex(self.index.directory)
+        self.assertEqual(self.ids(reader.search([0, 1], k=1)), [3])
+        mapped = reader.vectors
+
+        self.index.write({1: [0, 1]}, "model", removed=[3])
+        self.assertEqual(mapped[0].tolist(), [1, 0])
+        self.assertEqual(mapped[2].tolist(), [0, 1])
+
+        self.assertEqual(self.ids(reader.search([0, 1], k=1)), [1])
+
+    def test_invalid_queries(self):
+        self.assertEqual(self.index.search([0, 0]), [])
+        self.assertEqual(self.index.search([1, 0, 0]), [])
+        self.assertEqual(self.index.search([1, 0], k=0), [])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(
+            threshold=0.5, window=30, min_requests=4, cooldown=5
+        )
+
+    def open_breaker(self):
+        with redirect_stdout(io.StringIO()):
+            for error in (False, True, False, True):
+                self.breaker.record(error, time.monotonic())
+
+    def end_cooldown(self):
+        self.breaker.opened_at -= self.breaker.cooldown
+
+    def send_probe(self):
+        """
+        Lets the probe through and returns its start time.
+        """
+        self.assertEqual(self.breaker.delay(), (0, True))
+        started = time.monotonic()
+        self.breaker.start_probe(started)
+        return started
+
+    def test_opens_when_enough_requests_fail(self):
+        with redirect_stdout(io.StringIO()):
+            for error in (True, True, True):
+                self.breaker.record(error, time.monotonic())
+        self.assertEqual(self.breaker.delay(), (0, False))
+
+        self.open_breaker()
+        self.assertEqual(self.breaker.state, "open")
+        delay, probe = self.breaker.delay()
+        self.assertGreater(delay, 0)
+        self.assertFalse(probe)
+        self.assertEqual(self.breaker.stats(), {"state": "open", "opened": 1})
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.end_cooldown()
+        started = self.send_probe()
+        self.assertEqual(self.breaker.state, "half_open")
+        # Only one probe is let through
+        self.assertGreater(self.breaker.delay()[0], 0)
+
+        with redirect_stdout(io.StringIO()):
+            self.breaker.record(False, started)
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertEqual(self.breaker.delay(), (0, False))
+
+    def test_failed_probe_opens_again(self):
+        self.open_breaker()
+        self.end_cooldown()
+        started = self.send_probe()
+
+        self.breaker.record(True, started)
+        self.assertEqual(self.breaker.stats(), {"state": "open", "opened": 2})
+        self.assertGreater(self.breaker.delay()[0], 0)
+
+    def test_requests_sent_before_the_probe_are_ignored(self):
+        in_flight = time.monotonic()
+        self.open_breaker()
+        self.end_cooldown()
+        started = self.send_probe()
+
+        self.breaker.record(False, in_flight)
+        self.breaker.record(True, in_flight)
+        self.assertEqual(self.breaker.state, "half_open")
+
+        with redirect_stdout(io.StringIO()):
+            self.breaker.record(False, started)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_lost_probe_is_replaced(self):
+        self.open_breaker()
+        self.end_cooldown()
+        self.send_probe()
+        self.breaker.probe_admitted_at -= self.breaker.window
+        self.send_probe()
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def request(self, limiter, latency=0.1, error=False):
+        asyncio.run(limiter.acquire())
+        limiter.release(latency, error)
+
+    def test_slow_start_until_the_first_cut(self):
+        limiter = AdaptiveLimiter(maximum=16)
+        for _ in range(3):
+            self.request(limiter)
+        self.assertEqual(limiter.limit, 4)
+
+        self.request(limiter, error=True)
+        self.assertEqual(limiter.limit, 3)
+        self.assertFalse(limiter.slow_start)
+
+        self.request(limiter)
+        self.assertAlmostEqual(limiter.limit, 3 + 1 / 3)
+
+    def test_cut_at_most_once_per_window(self):
+        limiter = AdaptiveLimiter(maximum=16)
+        for _ in range(7):
+            self.request(limiter)
+        self.request(limiter, error=True)
+        self.request(limiter, error=True)
+        self.assertEqual(limiter.limit, 6)
+        self.assertEqual(limiter.decreases, 1)
+
+    def test_latency_above_tolerance_cuts(self):
+        limiter = AdaptiveLimiter(maximum=16, smoothing=1.0)
+        for _ in range(3):
+            self.request(limiter, latency=0.1)
+        self.request(limiter, latency=0.5)
+        self.assertEqual(limiter.limit, 3)
+        self.assertEqual(limiter.baseline, 0.1)
+
+    def test_limit_stays_within_bounds(self):
+        limiter = AdaptiveLimiter(maximum=2, minimum=1)
+        for _ in range(5):
+            self.request(limiter)
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(5):
+            self.request(limiter, error=True)
+        self.assertEqual(limiter.limit, 1)
+
+
+@override_settings(LLM_PROMPT_MAX_LOCATIONS=8, LLM_PROMPT_MAX_AMENITIES=15)
+class RenderDetailsTests(SimpleTestCase):
+    property_info = {
+        "title": "Cozy  Hotel",
+        "description": " ".join(f"word{index}" for index in range(100)),
+        "locations": [
+            {"name": "Bangladesh", "type": "country"},
+            {"name": "Dhaka", "type": "city"},
+            {"name": "dhaka", "type": "city"},
+            {"name": "Gulshan Lake", "type": "landmark"},
+        ],
+        "amenities": ["Free WiFi", "Pool", "Spa", "pool", "Rooftop bar"],
+    }
+
+    def test_without_budget(self):
+        details = render_details(self.property_info)
+        lines = details.split("\n")
+        self.assertEqual(lines[0], "Title: Cozy Hotel")
+        self.assertEqual(
+            lines[2],
+            "Location: Dhaka (city); Bangladesh (country); Gulshan Lake (landmark)",
+        )
+        self.assertEqual(lines[3], "Amenities: Pool, Spa, Rooftop bar, Free WiFi")
+
+    def test_description_is_shortened_to_half_of_the_budget(self):
+        budget = 200
+        details = render_details(self.property_info, budget)
+        self.assertLessEqual(estimate_tokens(details), budget)
+        description = details.split("\n")[1].removeprefix("Description: ")
+        self.assertTrue(description.endswith("..."))
+        self.assertLessEqual(estimate_tokens(description.rstrip(".")), budget // 2)
+        self.assertIn("Gulshan Lake (landmark)", details)
+
+    def test_lowest_ranked_details_are_dropped_first(self):
+        budget = 60
+        details = render_details(self.property_info, budget)
+        self.assertLessEqual(estimate_tokens(details), budget)
+        lines = details.split("\n")
+        self.assertEqual(lines[0], "Title: Cozy Hotel")
+        self.assertEqual(lines[2], "Location: Dhaka (city)")
+        self.assertEqual(lines[3], "Amenities: Pool, Spa")
+
+    def test_budget_too_small_keeps_one_location_and_amenity(self):
+        details = render_details(self.property_info, 5)
+        self.assertIn("Location: Dhaka (city)", details)
+        self.assertIn("Amenities: Pool", details)
+        self.assertNotIn("word1", details)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        token = _pinned_until.set(0.0)
+        self.addCleanup(_pinned_until.reset, token)
+        patcher = mock.patch.dict(settings.DATABASES, {"replica": {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_property_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Property), "replica")
+        self.assertEqual(self.router.db_for_read(PropertySummary), "default")
+
+    def test_only_property_writes_pin_reads_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(GenerationCheckpoint), "default")
+        self.assertEqual(self.router.db_for_read(Property), "replica")
+
+        self.assertEqual(self.router.db_for_write(Property), "default")
+        self.assertEqual(self.router.db_for_read(Property), "default")
+
+
+class StructuredFallbackTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(title="Hotel", description="A hotel")
+        self.property_info = {
+            "id": self.property.property_id,
+            "title": "Hotel",
+            "description": "A hotel",
+            "locations": [],
+            "amenities": [],
+        }
+        self.client = mock.Mock(model="default")
+        self.client.generate_structured.return_value = mock.Mock(
+            status_code=500, url="http://ollama"
+        )
+        patcher = mock.patch(
+            "llm_app.services.get_stage_model",
+            side_effect=lambda stage, default=None: f"{stage}-model",
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, model=None):
+        fallbacks = {
+            name: mock.patch(f"llm_app.services.{name}", return_value="Generated")
+            for name in (
+                "rewrite_property_title",
+                "write_property_description",
+                "generate_property_summary",
+            )
+        }
+        with fallbacks["rewrite_property_title"] as title, fallbacks[
+            "write_property_description"
+        ] as description, fallbacks["generate_property_summary"] as summary:
+            with redirect_stdout(io.StringIO()):
+                generate_property_content(
+                    self.property_info, model=model, retries=1, client=self.client
+                )
+        return [
+            fallback.call_args.args[1] for fallback in (title, description, summary)
+        ]
+
+    def test_fallbacks_use_their_stage_models(self):
+        self.assertEqual(self.generate(), [None, None, None])
+        self.assertEqual(
+            self.client.generate_structured.call_args.args[2], "content-model"
+        )
+
+    def test_explicit_model_is_used_by_every_request(self):
+        self.assertEqual(self.generate("override"), ["override"] * 3)
+        self.assertEqual(self.client.generate_structured.call_args.args[2], "override")
+
+
+class ChangeDetectionTests(TestCase):
+    def setUp(self):
+        for index in range(3):
+            property_obj = Property.objects.create(title=f"Hotel {index}")
+            PropertySummary.objects.create(property=property_obj, summary="Summary")
+        self.generated = Property.objects.order_by("property_id").first()
+        property_info = next(iter_property_info())
+        mark_property_generated(
+            property_info, property_info["title"], property_info["description"]
+        )
+
+    def test_changes_are_detected_without_a_query_per_property(self):
+        # Four queries for the chunk and one finding no more properties
+        with self.assertNumQueries(5):
+            property_infos = list(iter_property_info())
+        with self.assertNumQueries(0):
+            changed = [
+                property_info["id"]
+                for property_info in property_infos
+                if needs_generation(property_info)
+            ]
+        self.assertEqual(len(changed), 2)
+        self.assertNotIn(self.generated.property_id, changed)
+
+    def test_changed_property_needs_generation(self):
+        self.generated.description = "Renovated"
+        self.generated.save()
+        property_info = next(iter_property_info())
+        self.assertTrue(needs_generation(property_info))
+
+
+@mock.patch("llm_app.views.search_summaries", return_value=[])
+class SearchViewTests(SimpleTestCase):
+    def get(self, **params):
+        return self.client.get(reverse("llm_app:search"), {"q": "pool", **params})
+
+    def test_limit_and_offset_are_clamped(self, search_summaries):
+        for limit, expected in (("-5", 1), ("0", 1), ("500", 100), ("10", 10)):
+            self.assertEqual(self.get(limit=limit, offset="-3").status_code, 200)
+            search_summaries.assert_called_with("pool", expected, 0)
+
+    def test_invalid_limit(self, search_summaries):
+        self.assertEqual(self.get(limit="ten").status_code, 400)
+        search_summaries.assert_not_called()
+
+    def test_empty_query_is_not_searched(self, search_summaries):
+        response = self.client.get(reverse("llm_app:search"), {"q": " "})
+        self.assertEqual(response.json(), {"query": "", "results": []})
+        search_summaries.assert_not_called()
+
+
+class ImageLoaderTests(SimpleTestCase):
+    def setUp(self):
+        self.loader = ImageLoader(workers=1, per_property=2, root="/media")
+
+    def test_paths_come_from_the_loaded_image_names(self):
+        property_info = {"id": 1, "image_names": ["a.jpg", "", "b.jpg", "c.jpg"]}
+        self.assertEqual(
+            self.loader.image_paths(property_info), ["/media/a.jpg", "/media/b.jpg"]
+        )
+
+    def test_only_processed_properties_are_prepared(self):
+        properties = [({"id": 1}, True), ({"id": 2}, False), ({"id": 3}, True)]
+        with mock.patch.object(self.loader, "submit", return_value=[]) as submit:
+            prefetched = list(self.loader.prefetch(properties))
+
+        self.assertEqual([call.args[0]["id"] for call in submit.call_args_list], [1, 3])
+        self.assertEqual(
+            prefetched,
+            [
+                ({"id": 1, "images": []}, True),
+                ({"id": 2, "images": []}, False),
+                ({"id": 3, "images": []}, True),
+            ],
+        )
+
+
+@mock.patch("llm_app.streaming.AsyncOllamaClient")
+class StreamClientTests(SimpleTestCase):
+    async def get_clients(self):
+        return get_stream_client(), get_stream_client()
+
+    def test_one_client_per_event_loop(self, client_class):
+        first, second = asyncio.run(self.get_clients())
+        self.assertIs(first, second)
+        self.assertEqual(client_class.call_count, 1)
+
+        asyncio.run(self.get_clients())
+        self.assertEqual(client_class.call_count, 2)
@@ -0,0 +1,248 @@
+import asyncio
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.db import connections
+
+# Spans opened by the current thread or task, innermost last. Each one is the dict of
+# arguments of its trace event, which the query counter and annotate() add to.
+_open_spans = ContextVar("open_spans", default=())
+
+# Returned by span() while tracing is off, so that instrumented code costs one check
+_DISABLED = nullcontext()
+
+_tracer = None
+
+
+class Tracer:
+    """
+    Records spans as Chrome trace events, viewable in Perfetto (ui.perfetto.dev) or
+    chrome://tracing.
+
+    Spans of a thread are drawn on a track of their own, as are the spans of each asyncio
+    task, so concurrent generations appear side by side. The queries run while a span is
+    open are counted in its `queries` and `db_ms` arguments by an execute wrapper
+    installed on the database connections of every thread that opens a span.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.events = []
+        self.tracks = {}
+        self.task_tracks = weakref.WeakKeyDictionary()
+        self.track_ids = itertools.count(1)
+        self.async_ids = itertools.count(1)
+        self.wrapped = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def timestamp(monotonic):
+        # Trace events are timed in microseconds
+        return round(monotonic * 1e6)
+
+    def track(self):
+        """
+        Returns the track ID of the current asyncio task, or of the current thread.
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+
+        with self.lock:
+            if task is not None:
+                track = self.task_tracks.get(task)
+                if track is None:
+                    track = self.task_tracks[task] = self.new_track(
+                        f"Task {task.get_name()}"
+                    )
+                return track
+
+            thread = threading.current_thread()
+            track = self.tracks.get(thread.ident)
+            if track is None:
+                track = self.tracks[thread.ident] = self.new_track(
+                    f"Thread {thread.name}"
+                )
+            return track
+
+    def new_track(self, name):
+        track = next(self.track_ids)
+        self.events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": track,
+                "args": {"name": name},
+            }
+        )
+        return track
+
+    def count_queries(self, execute, sql, params, many, context):
+        spans = _open_spans.get()
+        if not spans:
+            return execute(sql, params, many, context)
+
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.monotonic() - started) * 1000
+            for args in spans:
+                args["queries"] = args.get("queries", 0) + 1
+                args["db_ms"] = round(args.get("db_ms", 0.0) + elapsed, 3)
+
+    def wrap_connections(self):
+        """
+        Installs the query counter on the connections of the current thread.
+        """
+        for connection in connections.all():
+            if self.count_queries not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self.count_queries)
+                self.wrapped.append(connection)
+
+    def unwrap_connections(self):
+        for connection in self.wrapped:
+            if self.count_queries in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self.count_queries)
+        self.wrapped = []
+
+    @contextmanager
+    def span(self, name, category, args):
+        self.wrap_connections()
+        spans = _open_spans.get()
+        token = _open_spans.set(spans + (args,))
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            finished = time.monotonic()
+            _open_spans.reset(token)
+            self.complete(name, category, started, finished, args)
+
+    def complete(self, name, category, started, finished, args=None):
+        """
+        Records a span of the current track from `started` to `finished`, both
+        time.monotonic() values.
+        """
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": self.timestamp(started),
+                "dur": self.timestamp(finished) - self.timestamp(started),
+                "pid": self.pid,
+                "tid": self.track(),
+                "args": args or {},
+            }
+        )
+
+    def interval(self, name, category, started, finished, args=None):
+        """
+        Records an async span, drawn on a track of its own so that it may overlap with
+        the spans of the current track.
+        """
+        event_id = next(self.async_ids)
+        for phase, timestamp in (("b", started), ("e", finished)):
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": phase,
+                    "id": event_id,
+                    "ts": self.timestamp(timestamp),
+                    "pid": self.pid,
+                    "tid": self.track(),
+                    "args": (args or {}) if phase == "b" else {},
+                }
+            )
+
+    def write(self, path):
+        with open(path, "w") as trace_file:
+            json.dump(
+                {"traceEvents": self.events, "displayTimeUnit": "ms"},
+                trace_file,
+                default=str,
+            )
+
+
+def get_tracer():
+    """
+    Returns the running Tracer, None while tracing is off.
+    """
+    return _tracer
+
+
+def start_tracing():
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing(path=None):
+    """
+    Stops tracing and writes the recorded events to `path` if given.
+
+    Returns:
+        int: The number of recorded events.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return 0
+    tracer.unwrap_connections()
+    if path:
+        tracer.write(path)
+    return len(tracer.events)
+
+
+def span(name, category="llm", **args):
+    """
+    Context manager recording the enclosed block as a span of the trace, if tracing.
+    """
+    if _tracer is None:
+        return _DISABLED
+    return _tracer.span(name, category, args)
+
+
+def traced(name=None, category="llm"):
+    """
+    Decorator recording each call of the function as a span.
+    """
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name, category, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def annotate(**args):
+    """
+    Adds arguments to the innermost open span of the current thread or task.
+    """
+    if _tracer is None:
+        return
+    spans = _open_spans.get()
+    if spans:
+        spans[-1].update(args)
@@ -5,4 +5,12 @@ from . import views
 app_name = "llm_app"
 urlpatterns = [
     path("", views.index, name="index"),
+    path("metrics", views.metrics, name="metrics"),
+    path("summaries/search", views.search, name="search"),
+    path("properties/<int:property_id>/similar", views.similar, name="similar"),
+    path(
+        "properties/<int:property_id>/summary/stream",
+        views.stream_summary,
+        name="stream_summary",
+    ),
 ]
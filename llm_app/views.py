@@ -1,8 +1,116 @@
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from properties.models import Property
+
+from llm_app.embeddings import get_embedding_index
+from llm_app.metrics import get_metrics, read_run_report, render_prometheus
+from llm_app.search import search_summaries
+from llm_app.services import fetch_property_info, get_up_to_date_summary
+from llm_app.streaming import format_sse, get_summary_stream, replay
 
 
 def index(request):
     return HttpResponse(
         '<header><h1>Hello this is the index page</h1></header><body><a href="http://127.0.0.1:8000/admin">Please click here for the Admin page</a></body>'
     )
+
+
+def metrics(request):
+    """
+    Exports the generation metrics in the Prometheus text format: those of this process
+    and those of the latest summary run, read from its run report.
+    """
+    snapshots = [(get_metrics().snapshot(), {"source": "web"})]
+    report = read_run_report(settings.LLM_RUN_REPORT_FILE)
+    if report:
+        snapshots.append((report["metrics"], {"source": "summary"}))
+
+    return HttpResponse(
+        render_prometheus(snapshots), content_type="text/plain; version=0.0.4"
+    )
+
+
+def search(request):
+    """
+    Full-text search over property titles and summaries.
+
+    Query parameters:
+        q: Search text, supporting quoted phrases, "or" and -exclusions.
+        limit: Number of results, from 1 to 100 (default 20).
+        offset: Number of results to skip (default 0).
+    """
+    text = request.GET.get("q", "").strip()
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 20)), 100))
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        return JsonResponse({"error": "limit and offset must be integers"}, status=400)
+
+    results = search_summaries(text, limit, offset) if text else []
+    return JsonResponse({"query": text, "results": results})
+
+
+def similar(request, property_id):
+    """
+    Properties whose summaries are the most similar to the property's, from the embedding
+    index.
+
+    Query parameters:
+        k: Number of results, at most 100 (default 10).
+        min_score: Minimum cosine similarity, e.g. 0.95 to find near-duplicates.
+    """
+    try:
+        k = min(int(request.GET.get("k", 10)), 100)
+        min_score = request.GET.get("min_score")
+        min_score = float(min_score) if min_score else None
+    except ValueError:
+        return JsonResponse({"error": "k and min_score must be numbers"}, status=400)
+
+    results = get_embedding_index().similar(property_id, k, min_score)
+    if results is None:
+        raise Http404(f"Property {property_id} is not in the embedding index.")
+
+    titles = dict(
+        Property.objects.filter(
+            property_id__in=[similar_id for similar_id, _ in results]
+        ).values_list("property_id", "title")
+    )
+    return JsonResponse(
+        {
+            "property_id": property_id,
+            "results": [
+                {
+                    "property_id": similar_id,
+                    "title": titles.get(similar_id),
+                    "score": score,
+                }
+                for similar_id, score in results
+            ],
+        }
+    )
+
+
+async def stream_summary(request, property_id):
+    """
+    Streams a freshly generated summary of the property as Server-Sent Events: "token"
+    events as the text arrives from Ollama, then a "summary" event with the final text.
+    Concurrent requests for a property share one generation, and a stored summary that
+    is up to date with the property data is sent right away.
+    """
+    property_info = await sync_to_async(fetch_property_info)(property_id)
+    if property_info is None:
+        raise Http404(f"Property {property_id} does not exist.")
+
+    summary = await sync_to_async(get_up_to_date_summary)(property_info)
+    if summary:
+        events = replay([("summary", summary)])
+    else:
+        events = get_summary_stream(property_info).subscribe()
+
+    return StreamingHttpResponse(
+        format_sse(events),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
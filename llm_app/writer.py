@@ -0,0 +1,191 @@
+import time
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from properties.models import Property
+
+from llm_app.metrics import get_metrics
+from llm_app.models import PropertySummary
+from llm_app.tracing import span
+
+
+class GenerationWriter:
+    """
+    Write-behind buffer for generated titles, descriptions and summaries.
+
+    Values are collected per property and written in bulk once `batch_size` properties
+    are pending or `flush_interval` seconds have passed since the last flush. Titles and
+    descriptions are written with bulk_update and summaries with a bulk upsert, so a flush
+    costs a handful of queries regardless of how many properties it contains.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.titles = {}
+        self.descriptions = {}
+        self.summaries = {}
+        self.fingerprints = {}
+        self.last_flush = time.monotonic()
+
+    def add_title(self, property_id, title):
+        self.titles[property_id] = title
+
+    def add_description(self, property_id, description):
+        self.descriptions[property_id] = description
+
+    def add_summary(self, property_id, summary):
+        self.summaries[property_id] = summary
+
+    def add_fingerprint(self, property_id, fingerprint):
+        """
+        Records the fingerprint of a completely generated property, stored with its summary.
+        """
+        self.fingerprints[property_id] = fingerprint
+
+    @property
+    def pending(self):
+        """
+        Number of properties with values waiting to be written.
+        """
+        return len(
+            self.titles.keys()
+            | self.descriptions.keys()
+            | self.summaries.keys()
+            | self.fingerprints.keys()
+        )
+
+    def maybe_flush(self):
+        """
+        Flushes if the batch is full or the flush interval has elapsed.
+
+        Returns:
+            bool: True if a flush happened.
+        """
+        elapsed = time.monotonic() - self.last_flush
+        if self.pending >= self.batch_size or elapsed >= self.flush_interval:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """
+        Writes every pending value to the database in a single transaction. If the batch
+        violates a constraint (e.g. a duplicate title), the properties are written one by
+        one so that only the offending ones are skipped.
+        """
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+
+        with span("flush", "db", properties=self.pending), get_metrics().timer(
+            "llm_db_seconds", operation="flush"
+        ):
+            self.write_pending()
+
+        self.titles = {}
+        self.descriptions = {}
+        self.summaries = {}
+        self.fingerprints = {}
+
+    def write_pending(self):
+        try:
+            self.write(
+                self.titles, self.descriptions, self.summaries, self.fingerprints
+            )
+        except IntegrityError:
+            property_ids = (
+                self.titles.keys()
+                | self.descriptions.keys()
+                | self.summaries.keys()
+                | self.fingerprints.keys()
+            )
+            for property_id in sorted(property_ids):
+                values = [
+                    (
+                        {property_id: pending[property_id]}
+                        if property_id in pending
+                        else {}
+                    )
+                    for pending in (
+                        self.titles,
+                        self.descriptions,
+                        self.summaries,
+                        self.fingerprints,
+                    )
+                ]
+                try:
+                    self.write(*values)
+                except IntegrityError as e:
+                    print(
+                        f"Failed to store generated values for property {property_id}: {e}"
+                    )
+
+    def write(self, titles, descriptions, summaries, fingerprints):
+        """
+        Writes the given values with bulk queries inside one transaction.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # Property.save() would bump update_date, so bulk_update sets it as well
+            Property.objects.bulk_update(
+                [
+                    Property(property_id=property_id, title=title, update_date=now)
+                    for property_id, title in titles.items()
+                ],
+                ["title", "update_date"],
+            )
+            Property.objects.bulk_update(
+                [
+                    Property(
+                        property_id=property_id,
+                        description=description,
+                        update_date=now,
+                    )
+                    for property_id, description in descriptions.items()
+                ],
+                ["description", "update_date"],
+            )
+
+            # Summaries of completely generated properties also store their fingerprint,
+            # the others keep the fingerprint of their last complete generation
+            generated_date = timezone.now()
+            self.upsert_summaries(
+                [
+                    PropertySummary(
+                        property_id=property_id,
+                        summary=summary,
+                        input_fingerprint=fingerprints[property_id],
+                        generated_date=generated_date,
+                    )
+                    for property_id, summary in summaries.items()
+                    if property_id in fingerprints
+                ],
+                ["summary", "input_fingerprint", "generated_date", "update_date"],
+            )
+            self.upsert_summaries(
+                [
+                    PropertySummary(property_id=property_id, summary=summary)
+                    for property_id, summary in summaries.items()
+                    if property_id not in fingerprints
+                ],
+                ["summary", "update_date"],
+            )
+
+            # The summary of a property may have been flushed before the property was
+            # complete, e.g. by the flush of another property in concurrent runs
+            for property_id, fingerprint in fingerprints.items():
+                if property_id not in summaries:
+                    PropertySummary.objects.filter(property_id=property_id).update(
+                        input_fingerprint=fingerprint, generated_date=generated_date
+                    )
+
+    @staticmethod
+    def upsert_summaries(summaries, update_fields):
+        if summaries:
+            PropertySummary.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=["property"],
+                update_fields=update_fields,
+            )
@@ -22,7 +22,7 @@ load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-sys.path.append(os.getenv('django_project_path'))
+sys.path.append(os.getenv("django_project_path"))
 
 # Optionally, you can set a default path or raise an error
 # sys.path.append('/path/to/your/default/fallback/directory')
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "llm_app.apps.LlmAppConfig",
     "properties.apps.PropertiesConfig",
 ]
@@ -93,9 +94,157 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        # Seconds a connection is kept open for later requests, checked before reuse.
+        # Leave at 0 when serving with ASGI, where connections are not reused.
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 0)),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower()
+        == "true",
     },
 }
 
+# Read replica of the property tables, with the same credentials by default. Reads of the
+# thread or task that just wrote a property stay on the primary for LLM_DB_REPLICA_PIN
+# seconds.
+if os.getenv("DB_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.getenv("DB_REPLICA_NAME", DATABASES["default"]["NAME"]),
+        "USER": os.getenv("DB_REPLICA_USER", DATABASES["default"]["USER"]),
+        "PASSWORD": os.getenv("DB_REPLICA_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        "HOST": os.getenv("DB_REPLICA_HOST"),
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["llm_app.routers.ReplicaRouter"]
+LLM_DB_REPLICA_PIN = float(os.getenv("LLM_DB_REPLICA_PIN", 5))
+
+# Ollama
+# Connection settings shared by every Ollama client in llm_app
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Comma-separated Ollama servers to balance requests over, defaults to OLLAMA_URL
+OLLAMA_URLS = [
+    url.strip()
+    for url in os.getenv("OLLAMA_URLS", OLLAMA_URL).split(",")
+    if url.strip()
+]
+OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv("OLLAMA_HEALTH_CHECK_INTERVAL", 30))
+OLLAMA_MAX_ERRORS = int(os.getenv("OLLAMA_MAX_ERRORS", 3))
+# Seconds without a response after which a request is also sent to another server, 0 disables
+OLLAMA_HEDGE_AFTER = float(os.getenv("OLLAMA_HEDGE_AFTER", 0))
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b")
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 5))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", 30))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "5m")
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", 10))
+
+# Resilience
+# Retries back off exponentially with jitter and may not exceed OLLAMA_RETRY_BUDGET times
+# the first attempts of a run plus OLLAMA_RETRY_BUDGET_MINIMUM. The circuit breaker pauses
+# all requests for OLLAMA_BREAKER_COOLDOWN seconds when OLLAMA_BREAKER_THRESHOLD of the
+# requests of the last OLLAMA_BREAKER_WINDOW seconds failed.
+
+OLLAMA_RETRY_BASE_DELAY = float(os.getenv("OLLAMA_RETRY_BASE_DELAY", 0.5))
+OLLAMA_RETRY_MAX_DELAY = float(os.getenv("OLLAMA_RETRY_MAX_DELAY", 30))
+OLLAMA_RETRY_BUDGET = float(os.getenv("OLLAMA_RETRY_BUDGET", 0.2))
+OLLAMA_RETRY_BUDGET_MINIMUM = int(os.getenv("OLLAMA_RETRY_BUDGET_MINIMUM", 10))
+OLLAMA_BREAKER_THRESHOLD = float(os.getenv("OLLAMA_BREAKER_THRESHOLD", 0.5))
+OLLAMA_BREAKER_WINDOW = float(os.getenv("OLLAMA_BREAKER_WINDOW", 30))
+OLLAMA_BREAKER_MIN_REQUESTS = int(os.getenv("OLLAMA_BREAKER_MIN_REQUESTS", 10))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", 10))
+# Whether the async client adapts the number of requests in flight to the latency of the
+# server, up to its pool size, and how much slower than usual a response may get first
+OLLAMA_ADAPTIVE_CONCURRENCY = (
+    os.getenv("OLLAMA_ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+)
+OLLAMA_LATENCY_TOLERANCE = float(os.getenv("OLLAMA_LATENCY_TOLERANCE", 2.0))
+
+# Generation cache
+# Number of entries kept in memory, number of rows kept in the database and their lifetime
+
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", 1024))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 200000))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 30 * 24 * 60 * 60))
+
+# Embedding index
+# Directory of the memory-mapped summary embeddings used to find similar properties
+
+LLM_EMBEDDINGS_DIR = os.getenv("LLM_EMBEDDINGS_DIR", str(BASE_DIR / "embeddings"))
+
+# Property photos
+# With --images, descriptions are written by OLLAMA_VISION_MODEL from the first
+# LLM_IMAGES_PER_PROPERTY photos of a property, found under LLM_IMAGE_ROOT (the media
+# directory of property-manager-django). Photos are downscaled to LLM_IMAGE_MAX_SIZE pixels
+# by LLM_IMAGE_WORKERS processes and cached in LLM_IMAGE_CACHE_DIR, photos over
+# LLM_IMAGE_MAX_PIXELS pixels are skipped.
+
+OLLAMA_VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "llava")
+LLM_IMAGE_ROOT = os.getenv(
+    "LLM_IMAGE_ROOT",
+    os.path.join(os.getenv("django_project_path") or BASE_DIR, "media"),
+)
+LLM_IMAGES_PER_PROPERTY = int(os.getenv("LLM_IMAGES_PER_PROPERTY", 3))
+LLM_IMAGE_MAX_SIZE = int(os.getenv("LLM_IMAGE_MAX_SIZE", 672))
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", 85))
+LLM_IMAGE_MAX_PIXELS = int(os.getenv("LLM_IMAGE_MAX_PIXELS", 50_000_000))
+LLM_IMAGE_WORKERS = int(os.getenv("LLM_IMAGE_WORKERS", os.cpu_count() or 1))
+LLM_IMAGE_CACHE_DIR = os.getenv("LLM_IMAGE_CACHE_DIR", str(BASE_DIR / "image_cache"))
+
+# Model tiering
+# Model per generation stage, e.g. a small model for titles and a larger one for summaries.
+# Stages without one use the mapping recommended by the calibrate_models command in
+# LLM_MODEL_MAP_FILE, then OLLAMA_MODEL
+
+OLLAMA_STAGE_MODELS = {
+    "title": os.getenv("OLLAMA_TITLE_MODEL", ""),
+    "description": os.getenv("OLLAMA_DESCRIPTION_MODEL", ""),
+    "summary": os.getenv("OLLAMA_SUMMARY_MODEL", ""),
+    "content": os.getenv("OLLAMA_CONTENT_MODEL", ""),
+    "session": os.getenv("OLLAMA_SESSION_MODEL", ""),
+}
+LLM_MODEL_MAP_FILE = os.getenv("LLM_MODEL_MAP_FILE", str(BASE_DIR / "model_map.json"))
+
+# Prompts
+# Locations and amenities listed in a prompt at most, and budget of estimated tokens per
+# prompt, enforced by dropping the lowest ranked locations and amenities, then shortening
+# the description
+
+LLM_PROMPT_MAX_LOCATIONS = int(os.getenv("LLM_PROMPT_MAX_LOCATIONS", 8))
+LLM_PROMPT_MAX_AMENITIES = int(os.getenv("LLM_PROMPT_MAX_AMENITIES", 15))
+LLM_PROMPT_TOKEN_BUDGETS = {
+    "summary": int(os.getenv("LLM_PROMPT_BUDGET_SUMMARY", 384)),
+    "content": int(os.getenv("LLM_PROMPT_BUDGET_CONTENT", 448)),
+    "session": int(os.getenv("LLM_PROMPT_BUDGET_SESSION", 448)),
+}
+
+# Generation queue
+# Seconds a worker may hold a job without renewing it before it is presumed dead and the
+# job is claimed again (workers renew it every third of that while generating), and
+# number of attempts after which a job is marked as failed
+
+LLM_JOB_LEASE = int(os.getenv("LLM_JOB_LEASE", 600))
+LLM_JOB_MAX_ATTEMPTS = int(os.getenv("LLM_JOB_MAX_ATTEMPTS", 3))
+
+# Daemon mode
+# Changed properties are batched until none changed for LLM_DAEMON_DEBOUNCE seconds, for
+# at most LLM_DAEMON_MAX_WAIT seconds or LLM_DAEMON_BATCH_SIZE properties. Every
+# LLM_DAEMON_SWEEP_INTERVAL seconds all properties are checked for missed changes (0 only
+# checks them at startup).
+
+LLM_DAEMON_DEBOUNCE = float(os.getenv("LLM_DAEMON_DEBOUNCE", 2))
+LLM_DAEMON_MAX_WAIT = float(os.getenv("LLM_DAEMON_MAX_WAIT", 10))
+LLM_DAEMON_BATCH_SIZE = int(os.getenv("LLM_DAEMON_BATCH_SIZE", 100))
+LLM_DAEMON_SWEEP_INTERVAL = float(os.getenv("LLM_DAEMON_SWEEP_INTERVAL", 3600))
+
+# Metrics
+# JSON report written by the summary command, also exported by the /metrics view
+
+LLM_RUN_REPORT_FILE = os.getenv(
+    "LLM_RUN_REPORT_FILE", str(BASE_DIR / "summary_report.json")
+)
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 